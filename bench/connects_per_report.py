@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""Benchmark comparing the connection providers available to DbReport.
+
+For each provider the three reports are run a number of times, and the
+number of backend connections opened and the elapsed time are printed.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/connects_per_report.py --db news
+"""
+
+import argparse
+import time
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+
+
+def _run_reports(report, runs):
+    for _ in range(runs):
+        report.get_most_popular_articles(3)
+        report.get_most_popular_authors()
+        report.get_dates_wth_more_pct_errors(1.0)
+
+
+def main():
+    """Runs the benchmark and prints a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news",
+                        help="database to report upon (default 'news').")
+    parser.add_argument("--runs", type=int, default=10,
+                        help="number of times to run the three reports "
+                        "(default 10).")
+    args = parser.parse_args()
+
+    providers = [
+        ("direct", connection_provider.DirectConnectionProvider(args.db)),
+        ("single", connection_provider.SingleConnectionProvider(args.db)),
+        ("pooled", connection_provider.PooledConnectionProvider(args.db))]
+
+    reports_run = 3 * args.runs
+    print("{:<8} {:>9} {:>12} {:>12}".format(
+        "provider", "connects", "per report", "ms/report"))
+    for name, provider in providers:
+        with provider:
+            report = db_report.DbReport(args.db, provider)
+            start = time.perf_counter()
+            _run_reports(report, args.runs)
+            elapsed = time.perf_counter() - start
+            print("{:<8} {:>9d} {:>12.2f} {:>12.2f}".format(
+                name, provider.connect_count,
+                provider.connect_count / reports_run,
+                1000 * elapsed / reports_run))
+
+
+if __name__ == '__main__':
+    main()
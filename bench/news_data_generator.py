@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""Generates a synthetic news database at a chosen scale.
+
+The authors, articles and log tables are emptied and refilled with data
+generated from a seed, so the same seed and options always give the same
+data. Article popularity follows a Zipf distribution, so a few articles get
+most of the views, as on a real site. Requests fail at a low base rate,
+except on a few error spike days on which they fail at a much higher rate.
+The log is loaded with COPY, through logs_analysis.log_ingest.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/news_data_generator.py --rows 10000000
+
+This replaces all the data in the database, which defaults to news_test.
+"""
+
+import argparse
+import collections
+import datetime as dt
+import itertools
+import random
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.log_ingest as log_ingest
+
+# Options for generating the data. See main() for their descriptions.
+GeneratorOptions = collections.namedtuple(
+    "GeneratorOptions",
+    ["rows", "seed", "authors", "articles", "days", "zipf_exponent",
+     "article_share", "error_rate", "spike_days", "spike_error_rate"])
+
+DEFAULT_OPTIONS = GeneratorOptions(
+    rows=100000, seed=1, authors=4, articles=8, days=31, zipf_exponent=1.1,
+    article_share=0.5, error_rate=0.005, spike_days=1,
+    spike_error_rate=0.025)
+
+_START = dt.datetime(2016, 7, 1, tzinfo=dt.timezone.utc)
+
+_OK = "200 OK"
+
+_NOT_FOUND = "404 NOT FOUND"
+
+_OTHER_PATHS = ["/", "/favicon.ico", "/search"]
+
+_BATCH = 10000
+
+_RESET_SQL = """
+truncate table log, articles, authors;
+alter sequence log_id_seq restart;
+alter sequence articles_id_seq restart;
+alter sequence authors_id_seq restart"""
+
+# the rollups, if installed, would otherwise describe the replaced log
+_RESET_ROLLUPS_SQL = """
+truncate table article_hits_daily, request_status_daily,
+  request_status_minutely, article_visitors_daily;
+update rollup_state set high_water = 0"""
+
+_ROLLUPS_INSTALLED_SQL = "select to_regclass('rollup_state') is not null"
+
+_AUTHOR_SQL = "insert into authors (name, bio) values (%s, %s)"
+
+_ARTICLE_SQL = """
+insert into articles (author, title, slug, lead, body, time)
+  values (%s, %s, %s, %s, %s, %s)"""
+
+
+def spike_days(options):
+    """Returns the sorted day numbers, from 0, that are error spike days."""
+    rng = random.Random(options.seed)
+    return sorted(rng.sample(range(options.days),
+                             min(options.spike_days, options.days)))
+
+
+def slugs(options):
+    """Returns the article slugs, most popular first."""
+    return ["article-{}".format(number)
+            for number in range(1, options.articles + 1)]
+
+
+def generate_log(options):
+    """Generates the (path, ip, method, status, time) log records."""
+    # separate generators, so that changing one part of the data, such as
+    # the number of rows, leaves the others the same
+    rng = random.Random(options.seed + 1)
+    spikes = set(spike_days(options))
+    paths = ["/article/" + slug for slug in slugs(options)]
+    cum_weights = list(itertools.accumulate(
+        1 / rank ** options.zipf_exponent
+        for rank in range(1, len(paths) + 1)))
+    seconds = options.days * 24 * 60 * 60
+    remaining = options.rows
+    while remaining > 0:
+        batch = min(remaining, _BATCH)
+        remaining -= batch
+        articles = rng.choices(paths, cum_weights=cum_weights, k=batch)
+        for article in articles:
+            offset = rng.randrange(seconds)
+            day = offset // (24 * 60 * 60)
+            error_rate = options.spike_error_rate if day in spikes \
+                else options.error_rate
+            if rng.random() < error_rate:
+                path, status = article + "-missing", _NOT_FOUND
+            elif rng.random() < options.article_share:
+                path, status = article, _OK
+            else:
+                path, status = rng.choice(_OTHER_PATHS), _OK
+            ip = "198.51.100.{}".format(rng.randrange(1, 255))
+            yield (path, ip, "GET", status,
+                   _START + dt.timedelta(seconds=offset))
+
+
+def generate(dbname, options=DEFAULT_OPTIONS, provider=None):
+    """Replaces the data in a database with generated data.
+
+    Returns the log_ingest.IngestResult of loading the log.
+
+    Keyword arguments:
+    dbname -- name of the psql database to fill. Required.
+    options -- the GeneratorOptions. Optional. Defaults to DEFAULT_OPTIONS.
+    provider -- the connection_provider.ConnectionProvider used to obtain
+                connections to the database. Optional. Defaults to None,
+                which means a new connection for every step.
+    """
+    if provider is None:
+        provider = connection_provider.DirectConnectionProvider(dbname)
+    rng = random.Random(options.seed + 2)
+    with provider.connection() as news_db:
+        with news_db.cursor() as cursor:
+            cursor.execute(_RESET_SQL)
+            cursor.execute(_ROLLUPS_INSTALLED_SQL)
+            if cursor.fetchone()[0]:
+                cursor.execute(_RESET_ROLLUPS_SQL)
+            cursor.executemany(_AUTHOR_SQL, [
+                ("Author {}".format(number), "Generated author.")
+                for number in range(1, options.authors + 1)])
+            cursor.executemany(_ARTICLE_SQL, [
+                (rng.randrange(1, options.authors + 1),
+                 "Title of {}".format(slug), slug, "Lead.", "Body.", _START)
+                for slug in slugs(options)])
+    ingester = log_ingest.LogIngester(dbname, provider, defer_indexes=True,
+                                      defer_constraints=True)
+    return ingester.ingest(generate_log(options))
+
+
+def add_arguments(parser):
+    """Adds the generator options to an argparse parser."""
+    defaults = DEFAULT_OPTIONS
+    parser.add_argument("--seed", type=int, default=defaults.seed,
+                        help="seed of the generated data "
+                        "(default %(default)s).")
+    parser.add_argument("--authors", type=int, default=defaults.authors,
+                        help="number of authors (default %(default)s).")
+    parser.add_argument("--articles", type=int, default=defaults.articles,
+                        help="number of articles (default %(default)s).")
+    parser.add_argument("--days", type=int, default=defaults.days,
+                        help="number of days covered by the log "
+                        "(default %(default)s).")
+    parser.add_argument("--zipf-exponent", type=float,
+                        default=defaults.zipf_exponent,
+                        help="exponent of the Zipf distribution of article "
+                        "popularity (default %(default)s).")
+    parser.add_argument("--article-share", type=float,
+                        default=defaults.article_share,
+                        help="fraction of successful requests that are for "
+                        "articles (default %(default)s).")
+    parser.add_argument("--error-rate", type=float,
+                        default=defaults.error_rate,
+                        help="fraction of requests that fail "
+                        "(default %(default)s).")
+    parser.add_argument("--spike-days", type=int,
+                        default=defaults.spike_days,
+                        help="number of error spike days "
+                        "(default %(default)s).")
+    parser.add_argument("--spike-error-rate", type=float,
+                        default=defaults.spike_error_rate,
+                        help="fraction of requests that fail on error spike "
+                        "days (default %(default)s).")
+
+
+def options_from_args(args, rows):
+    """Returns the GeneratorOptions given by parsed arguments."""
+    return GeneratorOptions(
+        rows=rows, seed=args.seed, authors=args.authors,
+        articles=args.articles, days=args.days,
+        zipf_exponent=args.zipf_exponent, article_share=args.article_share,
+        error_rate=args.error_rate, spike_days=args.spike_days,
+        spike_error_rate=args.spike_error_rate)
+
+
+def main():
+    """Generates the data and prints the load statistics."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news_test",
+                        help="database to fill (default 'news_test').")
+    parser.add_argument("--rows", type=int, default=DEFAULT_OPTIONS.rows,
+                        help="number of log rows (default %(default)s).")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    options = options_from_args(args, args.rows)
+    result = generate(args.db, options)
+    print("Generated {} log rows in {:.2f}s ({} rows/second); error spike "
+          "days: {}.".format(
+              format(result.rows, ",d"), result.seconds,
+              format(int(result.rows_per_second), ",d"),
+              ", ".join((_START + dt.timedelta(days=day)).strftime("%d %b %Y")
+                        for day in spike_days(options)) or "none"))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+"""Benchmark timing the reports across scales of generated data.
+
+For each scale, the database is filled by news_data_generator with that
+many log rows, then each report, all the reports in one query, and the full
+command line application are run a number of times. The fastest and median
+times are printed and saved as JSON. Given the JSON of an earlier run with
+--compare, any timing that has slowed by more than --tolerance is reported
+as a regression and the benchmark exits with status 1.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/scaling_benchmark.py \\
+        --scales 1000000,10000000 --output results.json
+
+This replaces all the data in the database, which defaults to news_test.
+"""
+
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+
+import news_data_generator
+
+
+def _time(function, repeat):
+    """Returns the fastest and median seconds taken by a function."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return {"min": min(seconds), "median": statistics.median(seconds)}
+
+
+def _run_cli(dbname):
+    subprocess.run([sys.executable, "-m", "logs_analysis", "--db", dbname,
+                    "--no-cache"], check=True, stdout=subprocess.DEVNULL,
+                   env=dict(os.environ,
+                            PYTHONPATH=os.pathsep.join(sys.path)))
+
+
+def _benchmark_scale(dbname, options, repeat):
+    generated = news_data_generator.generate(dbname, options)
+    with connection_provider.SingleConnectionProvider(dbname) as provider:
+        with provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute("analyze")
+        report = db_report.DbReport(dbname, provider)
+        timings = {
+            "articles": _time(lambda: report.get_most_popular_articles(3),
+                              repeat),
+            "authors": _time(report.get_most_popular_authors, repeat),
+            "errors": _time(
+                lambda: report.get_dates_wth_more_pct_errors(1.0), repeat),
+            "run_all": _time(lambda: report.run_all(3), repeat)}
+    timings["cli"] = _time(lambda: _run_cli(dbname), repeat)
+    return {"rows": options.rows, "generate_seconds": generated.seconds,
+            "timings": timings}
+
+
+def _regressions(baseline, results, tolerance):
+    """Returns descriptions of the median timings in results that are slower
+    than those of the same scale in baseline by more than the tolerance."""
+    old_scales = {scale["rows"]: scale for scale in baseline["scales"]}
+    found = []
+    for scale in results["scales"]:
+        old = old_scales.get(scale["rows"])
+        if old is None:
+            continue
+        for name, timing in scale["timings"].items():
+            old_timing = old["timings"].get(name)
+            if old_timing is not None and \
+                    timing["median"] > old_timing["median"] * (1 + tolerance):
+                found.append("{} at {:,d} rows: {:.1f}ms, was {:.1f}ms"
+                             .format(name, scale["rows"],
+                                     1000 * timing["median"],
+                                     1000 * old_timing["median"]))
+    return found
+
+
+def main():
+    """Runs the benchmark, prints a table of results and saves them."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news_test",
+                        help="database to fill and report upon "
+                        "(default 'news_test').")
+    parser.add_argument("--scales", default="10000,100000,1000000",
+                        help="comma separated numbers of log rows "
+                        "(default %(default)s).")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="number of times to run each report "
+                        "(default %(default)s).")
+    parser.add_argument("--output", default=None,
+                        help="file to which to save the JSON results.")
+    parser.add_argument("--compare", default=None,
+                        help="JSON results of an earlier run to compare "
+                        "against.")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="fraction by which a median time may slow "
+                        "before it is a regression (default %(default)s).")
+    news_data_generator.add_arguments(parser)
+    args = parser.parse_args()
+
+    # the options common to every scale
+    options = news_data_generator.options_from_args(args, None)
+    results = {
+        "created": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "options": options._asdict(),
+        "scales": []}
+    print("{:>12} {:<10} {:>12} {:>12}".format("rows", "report", "min ms",
+                                               "median ms"))
+    for rows in (int(scale) for scale in args.scales.split(",")):
+        scale = _benchmark_scale(args.db, options._replace(rows=rows),
+                                 args.repeat)
+        results["scales"].append(scale)
+        for name, timing in scale["timings"].items():
+            print("{:>12,d} {:<10} {:>12.1f} {:>12.1f}".format(
+                rows, name, 1000 * timing["min"], 1000 * timing["median"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = _regressions(baseline, results, args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the reports from a snapshot store against the database.
+
+Every completed day of the log is exported to a new snapshot store in a
+temporary directory, and the time taken printed. Then the median time of
+running all three reports is printed from the database, with DbReport, from
+the store, with a new SnapshotReport each run, which memory maps and reads
+the files, and from a SnapshotReport that has already read them. The size
+of the store is printed too.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/snapshot_report.py --db news
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+import logs_analysis.snapshot_store as snapshot_store
+
+
+def _timed(function, runs):
+    """Returns the median time in ms of running the function runs times."""
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return 1000 * statistics.median(seconds)
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news",
+                        help="database to report upon (default 'news').")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of times to run each report "
+                        "(default 5).")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as store, \
+            connection_provider.SingleConnectionProvider(args.db) as provider:
+        start = time.perf_counter()
+        result = snapshot_store.append_snapshot(provider, store)
+        export_ms = 1000 * (time.perf_counter() - start)
+        size = sum(os.path.getsize(os.path.join(store, name))
+                   for name in os.listdir(store))
+        print("{:<36} {:>10.1f}".format("export ms", export_ms))
+        print("{:<36} {:>10,d}".format("days", result.days))
+        print("{:<36} {:>10,d}".format("store bytes", size))
+
+        report = db_report.DbReport(args.db, provider)
+        read_report = snapshot_store.SnapshotReport(store)
+        read_report.load()
+        for label, function in [
+                ("database ms", lambda: report.run_all(None, None, 1.0)),
+                ("snapshot, mapping the files ms",
+                 lambda: snapshot_store.SnapshotReport(store).run_all(
+                     None, None, 1.0)),
+                ("snapshot, already read ms",
+                 lambda: read_report.run_all(None, None, 1.0))]:
+            print("{:<36} {:>10.1f}".format(label, _timed(function,
+                                                          args.runs)))
+
+
+if __name__ == '__main__':
+    main()
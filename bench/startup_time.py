@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the start up time of the command line application.
+
+'python3 -m logs_analysis' is run a number of times with each of three
+command lines, each in a new interpreter: --help, a usage error found once
+the command line has been parsed (--explain without --profile), and
+--snapshot over an empty snapshot store, which does not connect to the
+database. The median wall time of each is printed, along with the time
+taken to import logs_analysis.cmd_line_app as reported by 'python3 -X
+importtime'. The command line is checked before psycopg2 and the modules of
+the reports are imported, so none of the modules in _HEAVY_MODULES should be
+imported to show the help or the usage error, and none but psycopg2, which
+the text report imports for its errors, to report on the snapshot. The
+benchmark exits with status 1 if any of them is, or if the median time of
+--help is more than --max-ms.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/startup_time.py --max-ms 150
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# modules that are slow to import and not needed to parse the command line
+_HEAVY_MODULES = ["psycopg2", "numpy", "pkg_resources"]
+
+_COMMAND = [sys.executable, "-m", "logs_analysis"]
+
+
+def _run(args, returncode=0):
+    """Runs the command line application with python3 args, checks that it
+    exits with returncode, and returns its standard error."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    result = subprocess.run(args, env=env, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != returncode:
+        raise subprocess.CalledProcessError(result.returncode, args,
+                                            stderr=result.stderr)
+    return result.stderr
+
+
+def _median_ms(args, returncode, repeat):
+    """Returns the median wall time in ms of running python3 args repeat
+    times."""
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run(args, returncode)
+        seconds.append(time.perf_counter() - start)
+    return 1000 * statistics.median(seconds)
+
+
+def _import_times(stderr):
+    """Returns the cumulative import time, in microseconds, of each module
+    in the output of 'python3 -X importtime'."""
+    times = {}
+    for line in stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            times[fields[2].strip()] = int(fields[1])
+    return times
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="number of times to start the application "
+                        "(default %(default)s).")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="median time in ms above which start up has "
+                        "regressed (default none).")
+    args = parser.parse_args()
+
+    regressions = []
+    with tempfile.TemporaryDirectory() as store:
+        # (label, arguments, exit status, heavy modules allowed)
+        runs = [("--help", ["--help"], 0, []),
+                ("usage error", ["--explain"], 2, []),
+                ("--snapshot", ["--snapshot", store], 0, ["psycopg2"])]
+        for label, run_args, returncode, allowed in runs:
+            median_ms = _median_ms(_COMMAND + run_args, returncode,
+                                   args.repeat)
+            print("{:<36} {:>10.1f}".format(label + " median ms",
+                                            median_ms))
+            times = _import_times(_run(
+                _COMMAND[:1] + ["-X", "importtime"] + _COMMAND[1:]
+                + run_args, returncode))
+            if label == "--help":
+                print("{:<36} {:>10.1f}".format(
+                    "cmd_line_app import ms",
+                    times.get("logs_analysis.cmd_line_app", 0) / 1000))
+                if args.max_ms is not None and median_ms > args.max_ms:
+                    regressions.append(
+                        "median of {:.1f}ms is more than {:.1f}ms".format(
+                            median_ms, args.max_ms))
+            regressions.extend(
+                "{} is imported for {}".format(module, label)
+                for module in _HEAVY_MODULES
+                if module in times and module not in allowed)
+    for regression in regressions:
+        print("Regression: " + regression)
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
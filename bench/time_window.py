@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Benchmark comparing reports on a narrow time window with the whole log.
+
+Each report is run a number of times over the whole log and over the last
+day of the log, and the median times are printed. The window is applied as
+a range predicate on log.time, so with the log_time_idx index installed by
+'logs_analysis optimize-schema' a narrow window is read with an index range
+scan rather than a scan of the whole log. The rollups are not used.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/time_window.py --db news
+"""
+
+import argparse
+import datetime as dt
+import statistics
+import time
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+
+
+def _median_ms(function, runs):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return 1000 * statistics.median(seconds)
+
+
+def _reports(report):
+    return [("articles", lambda: report.get_most_popular_articles(3)),
+            ("authors", report.get_most_popular_authors),
+            ("errors", lambda: report.get_dates_wth_more_pct_errors(1.0))]
+
+
+def main():
+    """Runs the benchmark and prints a table of results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news",
+                        help="database to report upon (default 'news').")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="number of times to run each report "
+                        "(default 5).")
+    parser.add_argument("--window", type=float, default=1.0,
+                        help="days at the end of the log to report on "
+                        "(default 1).")
+    args = parser.parse_args()
+
+    with connection_provider.SingleConnectionProvider(args.db) as provider:
+        with provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute("select max(time) from log")
+                until = cursor.fetchone()[0]
+        if until is None:
+            print("The log is empty.")
+            return
+        until += dt.timedelta(microseconds=1)
+        since = until - dt.timedelta(days=args.window)
+
+        full = db_report.DbReport(args.db, provider, use_rollups=False)
+        window = db_report.DbReport(args.db, provider, since=since,
+                                    until=until)
+        print("{:<10} {:>12} {:>12} {:>9}".format(
+            "report", "full ms", "window ms", "speedup"))
+        for (name, run_full), (_, run_window) in zip(_reports(full),
+                                                     _reports(window)):
+            full_ms = _median_ms(run_full, args.runs)
+            window_ms = _median_ms(run_window, args.runs)
+            print("{:<10} {:>12.1f} {:>12.1f} {:>8.1f}x".format(
+                name, full_ms, window_ms, full_ms / window_ms))
+
+
+if __name__ == '__main__':
+    main()
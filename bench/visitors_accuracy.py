@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the estimated unique visitors against the exact counts.
+
+The unique visitors of each article and author are counted exactly, with
+count(distinct ip) over the log, and estimated from HyperLogLog sketches by
+VisitorsDbReport, computed from the log and, if the rollups are installed,
+merged from their daily sketches. The median time of each is printed, then
+the exact count, estimate and relative error of each article and author,
+and the largest and root mean square errors against the sketches' relative
+standard error. With --max-error, the benchmark exits with status 1 if any
+estimate is further than that from its exact count.
+
+Run from the project root, with the logs_analysis package on the python
+library path, e.g.:
+
+    PYTHONPATH=src python3 bench/visitors_accuracy.py --db news
+"""
+
+import argparse
+import math
+import statistics
+import sys
+import time
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.hyperloglog as hyperloglog
+import logs_analysis.rollup as rollup
+import logs_analysis.visitors_report as visitors_report
+
+_EXACT_ARTICLES_SQL = """
+select articles.title, count(distinct accessed_articles.ip)
+  from articles
+  left join accessed_articles
+    on accessed_articles.derived_slug = articles.slug
+  group by articles.id, articles.title"""
+
+_EXACT_AUTHORS_SQL = """
+select authors.name, count(distinct accessed_articles.ip)
+  from authors
+  left join articles on articles.author = authors.id
+  left join accessed_articles
+    on accessed_articles.derived_slug = articles.slug
+  group by authors.id, authors.name"""
+
+
+def _timed(function, runs):
+    """Returns the result of the function, and the median time in ms of
+    running it runs times."""
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        seconds.append(time.perf_counter() - start)
+    return result, 1000 * statistics.median(seconds)
+
+
+def _exact(provider):
+    with provider.connection() as news_db:
+        with news_db.cursor() as cursor:
+            counts = {}
+            for name, sql in [("articles", _EXACT_ARTICLES_SQL),
+                              ("authors", _EXACT_AUTHORS_SQL)]:
+                cursor.execute(sql)
+                counts[name] = dict(cursor.fetchall())
+            return counts
+
+
+def _estimated(report):
+    return {"articles": {row[0]: row[2]
+                         for row in report.get_most_popular_articles()},
+            "authors": {row[0]: row[2]
+                        for row in report.get_most_popular_authors()}}
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="news",
+                        help="database to report upon (default 'news').")
+    parser.add_argument("--runs", type=int, default=3,
+                        help="number of times to run each count "
+                        "(default 3).")
+    parser.add_argument("--max-error", type=float, default=None,
+                        help="relative error in %% above which an estimate "
+                        "has regressed (default none).")
+    args = parser.parse_args()
+
+    with connection_provider.SingleConnectionProvider(args.db) as provider:
+        exact, exact_ms = _timed(lambda: _exact(provider), args.runs)
+        print("{:<36} {:>10.1f}".format("count(distinct ip) ms", exact_ms))
+        methods = [("sketches from log", False)]
+        if rollup.Rollup(args.db, provider).is_installed():
+            methods.append(("sketches from rollups", True))
+        for label, use_rollups in methods:
+            report = visitors_report.VisitorsDbReport(
+                args.db, provider, use_rollups=use_rollups)
+            estimated, estimated_ms = _timed(lambda: _estimated(report),
+                                             args.runs)
+            print("{:<36} {:>10.1f}".format(label + " ms", estimated_ms))
+
+    print()
+    print("{:<10} {:<36} {:>10} {:>10} {:>8}".format(
+        "report", "name", "exact", "estimate", "error %"))
+    errors = []
+    for report_name in ["articles", "authors"]:
+        for name, count in sorted(exact[report_name].items(),
+                                  key=lambda item: -item[1]):
+            estimate = estimated[report_name][name]
+            error = (estimate - count) / count if count else 0.0
+            errors.append(error)
+            print("{:<10} {:<36} {:>10,d} {:>10,d} {:>8.2f}".format(
+                report_name, name[:36], count, estimate, 100 * error))
+    print()
+    max_error = max((abs(error) for error in errors), default=0.0)
+    rms_error = math.sqrt(statistics.mean(
+        [error * error for error in errors])) if errors else 0.0
+    for label, value in [("max error %", max_error),
+                         ("rms error %", rms_error),
+                         ("standard error % (expected)",
+                          hyperloglog.STANDARD_ERROR)]:
+        print("{:<36} {:>10.2f}".format(label, 100 * value))
+
+    if args.max_error is not None and 100 * max_error > args.max_error:
+        print("Regression: max error of {:.2f}% is more than {:.2f}%".format(
+            100 * max_error, args.max_error))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
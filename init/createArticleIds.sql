@@ -0,0 +1,48 @@
+-- Optional resolution of each log entry's article id. Adds an article_id column to the log table, which triggers fill
+-- in as entries are inserted and as articles are added or renamed, so that the articles and authors reports can count
+-- hits by integer id instead of joining the slug derived from each path to articles.slug. Entries logged before this
+-- script is run are resolved by the 'logs_analysis backfill-article-ids' command; the reports only use the column once
+-- that has finished. Adding or renaming an article scans the log once to resolve its entries.
+begin;
+
+-- the id of the article whose path was accessed, whatever the status, or null if the path is not that of an article
+alter table log add column article_id integer;
+
+create function log_resolve_article_id() returns trigger as $$
+begin
+  new.article_id := (select id from articles
+                       where new.path like '/article/%'
+                         and slug = substr(new.path, char_length('/article/') + 1));
+  return new;
+end;
+$$ language plpgsql;
+
+create trigger log_resolve_article_id
+  before insert or update of path on log
+  for each row execute procedure log_resolve_article_id();
+
+create function articles_resolve_log_article_ids() returns trigger as $$
+begin
+  if tg_op = 'UPDATE' then
+    update log set article_id = null where article_id = old.id;
+  end if;
+  update log set article_id = new.id where path = '/article/' || new.slug;
+  return null;
+end;
+$$ language plpgsql;
+
+create trigger articles_resolve_log_article_ids
+  after insert or update of id, slug on articles
+  for each row execute procedure articles_resolve_log_article_ids();
+
+-- single row holding the highest log id that has been backfilled, and the highest log id when the triggers were
+-- created, above which entries are resolved as they are inserted
+create table article_ids_state (
+  singleton boolean primary key default true check (singleton),
+  high_water integer not null,
+  target integer not null
+);
+
+insert into article_ids_state (high_water, target) select 0, coalesce(max(id), 0) from log;
+
+commit;
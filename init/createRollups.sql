@@ -0,0 +1,75 @@
+-- Optional daily and per minute rollups of the log table. When these tables exist the reports are answered from them,
+-- together with any log entries added since the last refresh, instead of from the views over the whole log table.
+-- Refresh the rollups with the 'logs_analysis refresh' command. Log entries with no time are rolled up under the date
+-- '-infinity'. This script can be run again over rollups created before request_status_minutely or
+-- article_visitors_daily were added, which creates and fills those tables up to the rollups' high water mark.
+begin;
+
+-- number of successful accesses to each article slug per day
+create table if not exists article_hits_daily (
+  date timestamp with time zone not null,
+  slug text not null,
+  hits bigint not null,
+  primary key (date, slug)
+);
+
+-- number of requests, and of those the number that failed, per day
+create table if not exists request_status_daily (
+  date timestamp with time zone not null primary key,
+  count_all bigint not null,
+  count_nok bigint not null
+);
+
+-- number of requests, and of those the number that failed, per minute, from which the errors report's finer buckets
+-- (5 minutes, hours) are summed
+create table if not exists request_status_minutely (
+  minute timestamp with time zone not null primary key,
+  count_all bigint not null,
+  count_nok bigint not null
+);
+
+-- HyperLogLog sketch of the visitors (by ip address) of each article slug per day: the highest rank of each of its
+-- 1024 registers that has one (see src/logs_analysis/hyperloglog.py, with which the expressions below must be kept in
+-- step), from which the unique visitors of the articles and authors are estimated over any range of days
+create table if not exists article_visitors_daily (
+  date timestamp with time zone not null,
+  slug text not null,
+  register smallint not null,
+  rank smallint not null,
+  primary key (date, slug, register)
+);
+
+-- single row holding the highest log id that has been rolled up
+create table if not exists rollup_state (
+  singleton boolean primary key default true check (singleton),
+  high_water integer not null
+);
+
+insert into rollup_state (high_water) values (0) on conflict do nothing;
+
+-- bring request_status_minutely up to the high water mark of rollups that predate it, holding off refreshes meanwhile
+-- (when it is already up to date, every minute conflicts and nothing changes)
+insert into request_status_minutely (minute, count_all, count_nok)
+  select coalesce(date_trunc('minute', time), '-infinity'), count(*),
+         count(case when status != '200 OK' then 1 else null end)
+    from log
+    where id <= (select high_water from rollup_state for update)
+    group by 1
+  on conflict (minute) do nothing;
+
+-- likewise bring article_visitors_daily up to the high water mark (merging sketches is idempotent, so running this
+-- again changes nothing)
+insert into article_visitors_daily (date, slug, register, rank)
+  select date, slug, substring(hash from 1 for 10)::bit(10)::int,
+         max(coalesce(nullif(position(B'1' in substring(hash from 11)), 0), 55))
+    from (select coalesce(date_trunc('day', time), '-infinity') as date,
+                 substr(path, char_length('/article/') + 1) as slug,
+                 hashtextextended(host(ip), 0)::bit(64) as hash
+            from log
+            where id <= (select high_water from rollup_state)
+              and path like '/article/%' and status = '200 OK' and ip is not null) as hashes
+    group by 1, 2, 3
+  on conflict (date, slug, register)
+    do update set rank = greatest(article_visitors_daily.rank, excluded.rank);
+
+commit;
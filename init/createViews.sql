@@ -1,4 +1,6 @@
 -- view of all the articles shown as accessed in the log augmented by the article slug which has been extracted from the path
+-- (the where clause and slug expression match the log_article_hits_idx index installed by 'logs_analysis optimize-schema',
+-- so must be kept in step with it)
 create view accessed_articles as
   select substr(path, char_length('/article/') + 1) as derived_slug, method, ip, time
     from log
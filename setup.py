@@ -1,7 +1,7 @@
 """Project build script. This uses setuptools to drive the build."""
 
 import unittest
-from setuptools import setup, find_packages
+from setuptools import setup, find_namespace_packages
 
 # configure test discovery
 TEST_DIR = "test"
@@ -18,14 +18,14 @@ def test_suite():
 setup(
     name="logs_analysis",
     version="1.0.0",
-    namespace_packages=["logs_analysis"],
     python_requires='>=3',
-    packages=find_packages("src"),
+    packages=find_namespace_packages("src", include=["logs_analysis"]),
     package_dir={"": "src"},
     install_requires=["psycopg2==2.7.1"],
+    extras_require={"columnar": ["numpy"]},
     entry_points={
         "console_scripts": [
-            "logs_analysis=logs_analysis:__main__.main"
+            "logs_analysis=logs_analysis.__main__:main"
         ]
     },
     test_suite="setup.test_suite"
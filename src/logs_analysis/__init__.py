@@ -1,4 +0,0 @@
-# package is split across src and test directories
-# ensure the package can include resources in other directories
-"""Module to analyse logs table in the news database"""
-__import__('pkg_resources').declare_namespace(__name__)
@@ -0,0 +1,152 @@
+"""Module that estimates the reports from a sample of the log."""
+
+import math
+import statistics
+
+import logs_analysis.db_report as db_report
+
+
+class ApproxDbReport(db_report.ComputedReportMixin, db_report.DbReport):
+    """Estimates the reports from a random sample of the log.
+
+    The log is read with TABLESAMPLE, so only about the given percentage of
+    it is read, and the counts found are scaled back up. Each estimate comes
+    with a confidence interval:
+    * views are estimated as hits / f, where f is the sampled fraction,
+      with a margin of z * sqrt(hits * (1 - f)) / f, the normal
+      approximation to the binomial distribution of the sampled hits.
+    * the percentage of errors on a day is the percentage in the sample,
+      with a Wilson score interval on the day's sampled requests.
+    These assume that each log entry is sampled independently, as by the
+    BERNOULLI method. The SYSTEM method samples whole pages of the table,
+    which is much faster but, as entries on a page are alike (the log is
+    written in time order), its true error can be wider than the interval.
+
+    The errors report includes every day whose interval reaches above the
+    threshold, and flags as uncertain those whose interval also reaches down
+    to it or below, so whether they are above the threshold is not known.
+
+    The rows of the reports differ from those of DbReport:
+    * articles and authors rows are (name, estimated views, margin).
+    * errors rows are (date, estimated percentage of errors, estimated
+      requests, lower bound of percentage, upper bound of percentage,
+      uncertain).
+    The streaming methods return iterators over the lists. The rollups are
+    never used.
+    """
+
+    # hits per article slug in a sample of the log, as _VIEW_HITS_SQL
+    _SAMPLE_HITS_SQL = """
+    select substr(path, char_length('/article/') + 1) as slug,
+           count(*) as hits
+      from log tablesample {method} (%(sample_pct)s) {repeatable}
+      where path like '/article/%%' and status = '200 OK' and {window}
+      group by 1"""
+
+    _SAMPLE_STATUS_SQL = """
+    select date_trunc('day', time) as date,
+           count(case when status != '200 OK' then 1 else NULL end),
+           count(*)
+      from log tablesample {method} (%(sample_pct)s) {repeatable}
+      where {window}
+      group by 1"""
+
+    _REPEATABLE_SQL = "repeatable (%(seed)s)"
+
+    METHODS = ("system", "bernoulli")
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, sample_pct, provider=None, method="system",
+                 confidence=0.95, seed=None, since=None, until=None,
+                 statement_timeout=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        sample_pct -- the percentage of the log to sample, above 0 and at
+                      most 100. Required.
+        provider -- as for db_report.DbReport.
+        method -- the sampling method, "system" or "bernoulli". Optional.
+                  Defaults to "system".
+        confidence -- the confidence level of the intervals. Optional.
+                      Defaults to 0.95.
+        seed -- the seed of the sample, so that the same sample is taken
+                each time while the log is unchanged. Optional. Defaults to
+                None, which means a different sample each time.
+        since, until, statement_timeout -- as for db_report.DbReport.
+        """
+        if not 0 < sample_pct <= 100:
+            raise ValueError("sample_pct must be above 0 and at most 100")
+        if method not in ApproxDbReport.METHODS:
+            raise ValueError("method must be one of {}".format(
+                ", ".join(ApproxDbReport.METHODS)))
+        # the sample is of slugs derived from the log, so neither the
+        # rollups nor the article ids are used
+        super().__init__(dbname, provider, False, since, until, False,
+                         statement_timeout=statement_timeout)
+        self._sample_pct = sample_pct
+        self._method = method
+        self._seed = seed
+        self._z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+
+    def get_most_popular_authors(self, top_n=None):
+        """Estimate the most popular authors, as (name, views, margin)
+        tuples."""
+        return self._scale_views(super().get_most_popular_authors(top_n))
+
+    def get_most_popular_articles(self, top_n=None):
+        """Estimate the most popular articles, as (title, views, margin)
+        tuples."""
+        return self._scale_views(super().get_most_popular_articles(top_n))
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
+        """Estimate the dates which may have more than the supplied percent
+        of response errors, as (date, percentage, requests, lower bound,
+        upper bound, uncertain) tuples in order of estimated percentage."""
+        sql = ApproxDbReport._SAMPLE_STATUS_SQL.format(
+            window=self._window_sql(), **self._sample_sql())
+        fraction = self._sample_pct / 100
+        dates = []
+        for date, count_nok, count_all in self._fetch_all(
+                lambda: (sql, self._window_params()), report="errors"):
+            low, high = self._wilson_interval(count_nok, count_all)
+            if high > pct_errors:
+                dates.append((date, 100 * count_nok / count_all,
+                              round(count_all / fraction), low, high,
+                              low <= pct_errors))
+        dates.sort(key=lambda date: date[1], reverse=True)
+        return dates
+
+    def _hits_sql(self):
+        return ApproxDbReport._SAMPLE_HITS_SQL.format(
+            window=self._window_sql(), **self._sample_sql())
+
+    def _window_params(self):
+        # the sample's parameters go wherever the window's do
+        return dict(super()._window_params(), sample_pct=self._sample_pct,
+                    seed=self._seed)
+
+    def _sample_sql(self):
+        return {"method": self._method,
+                "repeatable": "" if self._seed is None
+                              else ApproxDbReport._REPEATABLE_SQL}
+
+    def _scale_views(self, rows):
+        fraction = self._sample_pct / 100
+        return [(name, round(hits / fraction),
+                 round(self._z * math.sqrt(hits * (1 - fraction)) / fraction))
+                for name, hits in rows]
+
+    def _wilson_interval(self, successes, trials):
+        """Returns the Wilson score interval of a proportion, as
+        percentages."""
+        z_squared = self._z ** 2
+        proportion = successes / trials
+        centre = (proportion + z_squared / (2 * trials)) / \
+            (1 + z_squared / trials)
+        half_width = self._z * math.sqrt(
+            proportion * (1 - proportion) / trials +
+            z_squared / (4 * trials ** 2)) / (1 + z_squared / trials)
+        return (100 * max(0.0, centre - half_width),
+                100 * min(1.0, centre + half_width))
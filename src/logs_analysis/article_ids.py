@@ -0,0 +1,127 @@
+"""Module that backfills the optional article id column of the log table."""
+
+import collections
+
+import logs_analysis.connection_provider as connection_provider
+
+# Outcome of a backfill: the high water marks of log.id before and after the
+# backfill, the log id up to which entries need backfilling, and the number
+# of log entries whose article was resolved.
+BackfillResult = collections.namedtuple(
+    "BackfillResult",
+    ["old_high_water", "new_high_water", "target", "resolved"])
+
+
+class ArticleIds:
+    """Backfills the log.article_id column created by
+    init/createArticleIds.sql.
+
+    The column is filled in by triggers for entries inserted after the
+    script was run. The entries already in the log, up to the target id
+    recorded by the script, are resolved by backfill in chunks of ids, each
+    committed on its own, so a backfill can be interrupted and resumed
+    without redoing or locking the whole log. The column is ready to be
+    used by the reports once the backfill reaches the target.
+    """
+
+    _INSTALLED_SQL = "select to_regclass('article_ids_state') is not null"
+
+    _READY_SQL = "select high_water >= target from article_ids_state"
+
+    _LOCK_STATE_SQL = \
+        "select high_water, target from article_ids_state for update"
+
+    # resolves the entries as the accessed_articles view derives their slug
+    _BACKFILL_SQL = """
+    update log set article_id = articles.id
+      from articles
+      where log.id > %(low)s and log.id <= %(high)s
+        and log.path = '/article/' || articles.slug"""
+
+    _UPDATE_STATE_SQL = \
+        "update article_ids_state set high_water = %(high)s"
+
+    def __init__(self, dbname, provider=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every call.
+        """
+        self._dbname = dbname
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+
+    def is_installed(self):
+        """Returns True if the article id column and its triggers exist in
+        the database.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(ArticleIds._INSTALLED_SQL)
+                return cursor.fetchone()[0]
+
+    def is_ready(self):
+        """Returns True if the article id column exists and has been
+        backfilled, so that it resolves every log entry.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(ArticleIds._INSTALLED_SQL)
+                if not cursor.fetchone()[0]:
+                    return False
+                cursor.execute(ArticleIds._READY_SQL)
+                return cursor.fetchone()[0]
+
+    def backfill(self, chunk_size=10000, max_chunks=None):
+        """Resolves the article ids of the log entries not yet backfilled,
+        chunk_size log ids at a time.
+
+        Each chunk runs in a transaction of its own, and concurrent
+        backfills are serialised, so the column is always resolved up to
+        the high water mark.
+
+        Returns a BackfillResult.
+
+        Keyword arguments:
+        chunk_size -- the number of log ids to resolve in each transaction.
+                      Optional. Defaults to 10000.
+        max_chunks -- the number of chunks after which to stop. Optional.
+                      Defaults to None, which means until the target is
+                      reached.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database, including when the article id column has not been created.
+        """
+        result = None
+        chunks = 0
+        while True:
+            with self._provider.connection() as news_db:
+                with news_db.cursor() as cursor:
+                    cursor.execute(ArticleIds._LOCK_STATE_SQL)
+                    low, target = cursor.fetchone()
+                    if result is None:
+                        result = BackfillResult(low, low, target, 0)
+                    if low >= target or \
+                            (max_chunks is not None and chunks >= max_chunks):
+                        return result
+                    params = {"low": low,
+                              "high": min(low + chunk_size, target)}
+                    cursor.execute(ArticleIds._BACKFILL_SQL, params)
+                    resolved = result.resolved + cursor.rowcount
+                    cursor.execute(ArticleIds._UPDATE_STATE_SQL, params)
+            result = result._replace(new_high_water=params["high"],
+                                     resolved=resolved)
+            chunks += 1
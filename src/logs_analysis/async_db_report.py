@@ -0,0 +1,135 @@
+"""Module that runs report queries concurrently with asyncio."""
+
+import asyncio
+
+import psycopg2
+import psycopg2.extensions
+
+import logs_analysis.db_report as db_report
+
+
+class AsyncDbReport(db_report.DbReport):
+    """Reports on a database, running independent reports concurrently.
+
+    Adds coroutine versions of the report methods. Each runs its query on a
+    connection of its own, opened and driven with psycopg2's asynchronous
+    support from the asyncio event loop, so any number can run at once.
+    run_all and iter_all run the three reports on three connections at once,
+    so take about as long as the slowest of them, rather than the sum.
+    Unlike DbReport.run_all, the three reports are then not taken from a
+    single snapshot of the database. They must not be called from a running
+    event loop; await run_all_async instead.
+
+    The connection provider is only used to detect whether the rollups are
+    installed, and the other methods are as for DbReport.
+    """
+
+    # each coroutine's connection is its own, and in autocommit mode, so
+    # the timeout is set for its session rather than a transaction
+    _TIMEOUT_SQL = "set statement_timeout = {:d};"
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, provider=None, use_rollups=None, since=None,
+                 until=None, bucket="day", statement_timeout=None,
+                 **connect_kwargs):
+        """Constructor.
+
+        Keyword arguments:
+        dbname, provider, use_rollups, since, until, bucket,
+        statement_timeout -- as for db_report.DbReport.
+        connect_kwargs -- any further keyword arguments to pass to
+                          psycopg2.connect when opening the connections of
+                          the coroutines. Optional.
+        """
+        super().__init__(dbname, provider, use_rollups, since, until,
+                         bucket=bucket, statement_timeout=statement_timeout)
+        self._connect_kwargs = connect_kwargs
+
+    async def get_most_popular_authors_async(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors, as a coroutine."""
+        return await self._fetch_all_async(*self._authors_query(top_n))
+
+    async def get_most_popular_articles_async(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles, as a
+        coroutine."""
+        return await self._fetch_all_async(*self._articles_query(top_n))
+
+    async def get_dates_wth_more_pct_errors_async(self, pct_errors):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors, as a
+        coroutine."""
+        return await self._fetch_all_async(*self._errors_query(pct_errors))
+
+    async def run_all_async(self, articles_top_n=None, authors_top_n=None,
+                            pct_errors=1.0):
+        """Run all three reports concurrently, on three connections.
+
+        Returns a db_report.ReportResult. The keyword arguments are as for
+        db_report.DbReport.run_all.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        # detect the rollups, if need be, before the reports start
+        self.uses_rollups()
+        results = await asyncio.gather(
+            self.get_most_popular_articles_async(articles_top_n),
+            self.get_most_popular_authors_async(authors_top_n),
+            self.get_dates_wth_more_pct_errors_async(pct_errors))
+        return db_report.ReportResult(*results)
+
+    def run_all(self, articles_top_n=None, authors_top_n=None,
+                pct_errors=1.0):
+        """As db_report.DbReport.run_all, but with the three reports run
+        concurrently rather than from a single snapshot."""
+        return asyncio.run(self.run_all_async(articles_top_n, authors_top_n,
+                                              pct_errors))
+
+    # pylint: disable-msg=W0613
+    def iter_all(self, articles_top_n=None, authors_top_n=None,
+                 pct_errors=1.0, itersize=None):
+        """As db_report.DbReport.iter_all, but with the three reports run
+        concurrently rather than from a single snapshot. All rows are
+        fetched before the first is generated."""
+        result = self.run_all(articles_top_n, authors_top_n, pct_errors)
+        return ((name, row) for name, rows in zip(result._fields, result)
+                for row in rows)
+
+    async def _fetch_all_async(self, sql, params):
+        news_db = psycopg2.connect(dbname=self._dbname, async_=True,
+                                   **self._connect_kwargs)
+        try:
+            await self._wait(news_db)
+            cursor = news_db.cursor()
+            if self._statement_timeout is not None:
+                sql = AsyncDbReport._TIMEOUT_SQL.format(
+                    max(1, round(1000 * self._statement_timeout))) + sql
+            cursor.execute(sql, params)
+            await self._wait(news_db)
+            return cursor.fetchall()
+        finally:
+            news_db.close()
+
+    @staticmethod
+    async def _wait(conn):
+        """Waits, without blocking the event loop, until the asynchronous
+        connection has finished connecting or running a query."""
+        loop = asyncio.get_running_loop()
+        while True:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            if state == psycopg2.extensions.POLL_READ:
+                add, remove = loop.add_reader, loop.remove_reader
+            elif state == psycopg2.extensions.POLL_WRITE:
+                add, remove = loop.add_writer, loop.remove_writer
+            else:
+                raise psycopg2.OperationalError(
+                    "unexpected poll state {}".format(state))
+            ready = loop.create_future()
+            fileno = conn.fileno()
+            add(fileno, lambda: ready.done() or ready.set_result(None))
+            try:
+                await ready
+            finally:
+                remove(fileno)
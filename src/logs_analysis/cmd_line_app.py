@@ -3,8 +3,15 @@
 
 import sys
 import argparse
+import contextlib
+import datetime as dt
+import re
 
-import logs_analysis.news_text_report as news_text_report
+# psycopg2 and the modules of the reports and commands are imported by the
+# methods that use them, once the command line has been parsed, so that
+# --help and mistakes on the command line are answered without waiting for
+# them, and each command imports only what it needs
+# pylint: disable-msg=C0415
 
 # one public method is acceptable for this class, so ok to ignore pylint error
 # pylint: disable-msg=R0903
@@ -15,18 +22,379 @@ class CmdLineApp:
 
     _DEFAULT_DB_NAME = "news"
 
+    _DB_ERR_MSG = "There was a problem querying the database: {}"
+
+    _FILE_ERR_MSG = "There was a problem reading the files: {}"
+
+    _DURATION_RE = re.compile(r"^(\d+)([smhdw])$")
+
+    _DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours",
+                       "d": "days", "w": "weeks"}
+
+    # as approx_report.ApproxDbReport.METHODS, which is not imported to parse
+    # the command line
+    _APPROX_METHODS = ("system", "bernoulli")
+
+    # as sorted(report_writer.WRITERS), likewise
+    _FORMATS = ("csv", "jsonl", "text")
+
+    # as db_report.DbReport.BUCKETS, likewise
+    _BUCKETS = ("minute", "5m", "hour", "day")
+
     def __init__(self):
         self.args = {}
 
     def run(self):
         """Runs the command line application."""
         self._parse_cmd_line()
-        reporter = news_text_report.NewsTextReport(self.args.db)
-        print()  # line space to improve readability of output
+        import logs_analysis.connection_provider as connection_provider
+        interrupted = False
+        with contextlib.ExitStack() as stack:
+            # one connection is shared by everything done in a run
+            provider = stack.enter_context(
+                connection_provider.SingleConnectionProvider(self.args.db))
+            if self.args.replica is not None:
+                # the reports only read, so are taken from the replica
+                provider = stack.enter_context(
+                    connection_provider.ReplicaConnectionProvider(
+                        connection_provider.SingleConnectionProvider(
+                            self.args.db, dsn=self.args.replica),
+                        provider, self.args.max_replica_lag,
+                        fallback=self.args.replica_fallback))
+            try:
+                self.args.handler(self, provider)
+            except KeyboardInterrupt:
+                # caught within the providers, so that a report interrupted
+                # while writing rows ends its transaction before they close
+                interrupted = True
+        if interrupted:
+            print("Interrupted.", file=sys.stderr)
+            sys.exit(130)
+
+    @staticmethod
+    def _cancel_queries_on_interrupt():
+        """Makes Ctrl-C cancel the query in progress on the server, rather
+        than wait for it to finish. Not for use with COPY."""
+        import psycopg2.extensions
+        import logs_analysis.connection_provider as connection_provider
+        psycopg2.extensions.set_wait_callback(
+            connection_provider.wait_cancelling_on_interrupt)
+
+    def _run_report(self, provider):
+        import logs_analysis.news_text_report as news_text_report
+        if self.args.from_logs:
+            self._run_log_file_report(provider)
+            return
+        if self.args.snapshot is not None:
+            self._run_snapshot_report()
+            return
+        import psycopg2
+        cache = None
+        db_reporter = None
+        copies = False  # whether the reporter built reads with COPY
+        if self.args.approx is not None:
+            import logs_analysis.approx_report as approx_report
+            db_reporter = approx_report.ApproxDbReport(
+                self.args.db, self.args.approx, provider,
+                self.args.approx_method, since=self.args.since,
+                until=self.args.until,
+                statement_timeout=self.args.statement_timeout)
+        elif self.args.concurrent:
+            import logs_analysis.async_db_report as async_db_report
+            try:
+                # the coroutines connect as the provider's connections do
+                connect_kwargs = provider.connect_kwargs
+            except psycopg2.Error as exp:
+                print(CmdLineApp._DB_ERR_MSG.format(exp))
+                return
+            db_reporter = async_db_report.AsyncDbReport(
+                self.args.db, provider, since=self.args.since,
+                until=self.args.until, bucket=self.args.bucket,
+                statement_timeout=self.args.statement_timeout,
+                **connect_kwargs)
+        elif self.args.columnar:
+            # numpy is imported with the columnar report
+            import logs_analysis.columnar_report as columnar_report
+            try:
+                db_reporter = columnar_report.ColumnarDbReport(
+                    self.args.db, provider, self.args.since, self.args.until)
+            except ImportError as exp:
+                print(exp)
+                return
+            copies = True
+        elif self.args.visitors:
+            import logs_analysis.visitors_report as visitors_report
+            db_reporter = visitors_report.VisitorsDbReport(
+                self.args.db, provider, since=self.args.since,
+                until=self.args.until, bucket=self.args.bucket,
+                statement_timeout=self.args.statement_timeout)
+        elif not self.args.no_cache and self.args.last is None:
+            # the window of --last moves on every run, so its results would
+            # never be looked up again
+            import sqlite3
+            import logs_analysis.report_cache as report_cache
+            try:
+                cache = report_cache.ReportCache(
+                    report_cache.ReportCache.default_path())
+            except (sqlite3.Error, OSError):
+                pass  # report without the cache
+
+        if not copies:
+            self._cancel_queries_on_interrupt()
+        profiler = self._profiler()
+        if db_reporter is not None:
+            db_reporter.profiler = profiler
+        reporter = news_text_report.NewsTextReport(
+            self.args.db, provider, cache, db_reporter, self.args.since,
+            self.args.until, profiler, self.args.format, self.args.bucket,
+            self.args.statement_timeout, self.args.visitors)
+        self._print_line_space()
+
+        # all sections are taken from one snapshot of the database, unless
+        # run concurrently
+        try:
+            reporter.report_all(sys.stdout, self.args.articles,
+                                self.args.authors, self.args.errors)
+        finally:
+            if cache is not None:
+                cache.close()
+        self._write_profile(profiler)
+
+    # pylint: disable-msg=W0613
+    def _run_sharded_report(self, provider):
+        import psycopg2
+        import logs_analysis.connection_provider as connection_provider
+        import logs_analysis.news_text_report as news_text_report
+        import logs_analysis.sharded_report as sharded_report
+        # each shard has a connection of its own, as they are queried at once
+        try:
+            dbnames = sharded_report.expand_dbnames(self.args.dbs)
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        except ValueError as exp:
+            print(exp)
+            return
+        self._cancel_queries_on_interrupt()
+        with contextlib.ExitStack() as stack:
+            providers = [stack.enter_context(
+                connection_provider.SingleConnectionProvider(name))
+                         for name in dbnames]
+            db_reporter = sharded_report.ShardedDbReport(
+                dbnames, providers, self.args.since, self.args.until,
+                self.args.bucket, self.args.statement_timeout)
+            profiler = self._profiler()
+            db_reporter.profiler = profiler
+            reporter = news_text_report.NewsTextReport(
+                ", ".join(dbnames), db_reporter=db_reporter,
+                profiler=profiler, output_format=self.args.format,
+                bucket=self.args.bucket)
+            self._print_line_space()
+            reporter.report_all(sys.stdout, self.args.articles,
+                                self.args.authors, self.args.errors)
+        self._write_profile(profiler)
+
+    def _run_log_file_report(self, provider):
+        import psycopg2
+        import logs_analysis.log_file_report as log_file_report
+        import logs_analysis.news_text_report as news_text_report
+        try:
+            if self.args.metadata is None:
+                metadata = log_file_report.load_metadata_from_db(provider)
+            else:
+                metadata = log_file_report.load_metadata_from_csv(
+                    self.args.metadata)
+            db_reporter = log_file_report.LogFileReport(
+                self.args.from_logs, metadata, self.args.workers)
+            db_reporter.load()  # read the files, reporting errors here
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        except (OSError, KeyError) as exp:
+            print(CmdLineApp._FILE_ERR_MSG.format(exp))
+            return
+
+        profiler = self._profiler()
+        reporter = news_text_report.NewsTextReport(
+            self.args.db, db_reporter=db_reporter, profiler=profiler,
+            output_format=self.args.format)
+        self._print_line_space()
+        reporter.report_all(sys.stdout, self.args.articles,
+                            self.args.authors, self.args.errors)
+        self._write_profile(profiler)
+
+    def _run_snapshot_report(self):
+        import logs_analysis.news_text_report as news_text_report
+        import logs_analysis.snapshot_store as snapshot_store
+        db_reporter = snapshot_store.SnapshotReport(
+            self.args.snapshot, self.args.since, self.args.until)
+        try:
+            db_reporter.load()  # read the files, reporting errors here
+        except (OSError, ValueError) as exp:
+            print(CmdLineApp._FILE_ERR_MSG.format(exp))
+            return
+
+        profiler = self._profiler()
+        reporter = news_text_report.NewsTextReport(
+            self.args.snapshot, db_reporter=db_reporter, profiler=profiler,
+            output_format=self.args.format)
+        self._print_line_space()
+        reporter.report_all(sys.stdout, self.args.articles,
+                            self.args.authors, self.args.errors)
+        self._write_profile(profiler)
+
+    def _print_line_space(self):
+        if self.args.format == "text":
+            print()  # line space to improve readability of output
+
+    def _profiler(self):
+        import logs_analysis.query_profiler as query_profiler
+        if self.args.profile is None:
+            return None
+        return query_profiler.QueryProfiler(self.args.explain)
+
+    def _write_profile(self, profiler):
+        """Writes the profile, if any, to stderr, apart from the report."""
+        if profiler is None:
+            return
+        if self.args.profile == "json":
+            print(profiler.to_json(), file=sys.stderr)
+        else:
+            print(profiler.format_table(), file=sys.stderr)
+
+    def _run_refresh(self, provider):
+        import psycopg2
+        import logs_analysis.rollup as rollup
+        try:
+            result = rollup.Rollup(self.args.db, provider).refresh()
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        print("Rolled up {} log entries (log id {} to {})."
+              .format(format(result.entries, ",d"), result.old_high_water,
+                      result.new_high_water))
 
-        self._print_articles_report(reporter)
-        self._print_authors_report(reporter)
-        self._print_errors_report(reporter)
+    def _run_backfill_article_ids(self, provider):
+        import psycopg2
+        import logs_analysis.article_ids as article_ids
+        try:
+            result = article_ids.ArticleIds(self.args.db, provider).backfill(
+                self.args.chunk_size)
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        print("Resolved the articles of {} log entries (log id {} to {} of "
+              "{})."
+              .format(format(result.resolved, ",d"), result.old_high_water,
+                      result.new_high_water, result.target))
+
+    def _run_ingest(self, provider):
+        import psycopg2
+        import logs_analysis.log_ingest as log_ingest
+        ingester = log_ingest.LogIngester(
+            self.args.db, provider, self.args.batch_rows,
+            self.args.defer_indexes, self.args.defer_constraints)
+        try:
+            result = ingester.ingest_files(self.args.files)
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        except OSError as exp:
+            print(CmdLineApp._FILE_ERR_MSG.format(exp))
+            return
+        print("Loaded {} log entries in {:.2f}s ({} rows/second), skipping "
+              "{} unparseable lines."
+              .format(format(result.rows, ",d"), result.seconds,
+                      format(int(result.rows_per_second), ",d"),
+                      format(result.skipped, ",d")))
+
+    def _run_snapshot(self, provider):
+        import psycopg2
+        import logs_analysis.snapshot_store as snapshot_store
+        try:
+            result = snapshot_store.append_snapshot(provider,
+                                                    self.args.store)
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        except (OSError, ValueError) as exp:
+            print(CmdLineApp._FILE_ERR_MSG.format(exp))
+            return
+        if result.path is None:
+            print("No days have been completed since the last snapshot.")
+            return
+        print("Wrote {} days, with {} article hit records, to {}."
+              .format(format(result.days, ",d"), format(result.hits, ",d"),
+                      result.path))
+
+    def _run_watch(self, provider):
+        import psycopg2
+        import logs_analysis.log_watch as log_watch
+        import logs_analysis.news_text_report as news_text_report
+        watcher = log_watch.LogWatcher(self.args.db, provider)
+        reporter = news_text_report.NewsTextReport(
+            self.args.db, db_reporter=watcher,
+            output_format=self.args.format)
+        try:
+            # each report is shown when first taken, and again whenever
+            # what it shows, but for the counts, changes
+            for _ in watcher.watch(self.args.articles, self.args.authors,
+                                   self.args.errors, self.args.interval,
+                                   self.args.listen):
+                self._print_line_space()
+                if self.args.format == "text":
+                    print("As of log entry {}:".format(watcher.high_water))
+                reporter.report_all(sys.stdout, self.args.articles,
+                                    self.args.authors, self.args.errors)
+                sys.stdout.flush()
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+        except KeyboardInterrupt:
+            pass
+
+    # pylint: disable-msg=W0613
+    def _run_serve(self, provider):
+        import psycopg2
+        import logs_analysis.connection_provider as connection_provider
+        import logs_analysis.report_server as report_server
+        # requests are served by a thread each, so need a pool rather than
+        # the run's single connection
+        try:
+            with connection_provider.PooledConnectionProvider(
+                    self.args.db, max_size=self.args.pool_size) as pool:
+                server = report_server.ReportServer(
+                    self.args.db, pool, self.args.host, self.args.port,
+                    self.args.refresh_interval, self.args.poll_interval)
+                print("Serving reports on http://{}:{}/reports".format(
+                    *server.server_address))
+                try:
+                    server.serve_forever()
+                except KeyboardInterrupt:
+                    pass
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+        except OSError as exp:
+            print("There was a problem listening for requests: {}"
+                  .format(exp))
+
+    def _run_optimize_schema(self, provider):
+        import psycopg2
+        import logs_analysis.schema_optimizer as schema_optimizer
+        optimizer = schema_optimizer.SchemaOptimizer(self.args.db, provider)
+        try:
+            result = optimizer.optimize(self.args.articles, self.args.authors,
+                                        self.args.errors)
+        except psycopg2.Error as exp:
+            print(CmdLineApp._DB_ERR_MSG.format(exp))
+            return
+        print("Created: {}".format(", ".join(result.created) or
+                                   "None (already installed)"))
+        print()
+        print("{:<10} {:>15} {:>15}".format("report", "cost before",
+                                            "cost after"))
+        for name, cost_before in result.costs_before.items():
+            print("{:<10} {:>15.2f} {:>15.2f}".format(
+                name, cost_before, result.costs_after[name]))
 
     def _parse_cmd_line(self):
         parser = argparse.ArgumentParser(
@@ -43,25 +411,325 @@ class CmdLineApp:
                             default=1.0,
                             help="Show dates on which the %%age of errors " +
                             "is greater than F (default 1.0).")
-        parser.add_argument("--db", dest="db", type=str, metavar="name",
-                            default=CmdLineApp._DEFAULT_DB_NAME,
-                            help="sets the name of the database to report upon"
-                            + " (default '{}')."
-                            .format(CmdLineApp._DEFAULT_DB_NAME))
+        parser.add_argument("--bucket", dest="bucket",
+                            choices=CmdLineApp._BUCKETS, default="day",
+                            help="Count the errors per minute, 5 minutes, "
+                            "hour or day (the default), to show bursts of "
+                            "errors shorter than a day.")
+        # each of these builds the reports its own way, so only one can
+        source_group = parser.add_mutually_exclusive_group()
+        source_group.add_argument("--visitors", dest="visitors",
+                                  action="store_true",
+                                  help="Also show the unique visitors, by "
+                                  "ip address, of each article and author, "
+                                  "estimated with HyperLogLog sketches to "
+                                  "within about 3%%, bypassing the cache.")
+        parser.add_argument("--format", dest="format",
+                            choices=CmdLineApp._FORMATS,
+                            default="text",
+                            help="Write the reports as text (the default), "
+                            "CSV or JSON Lines, each row as it is fetched.")
+        parser.add_argument("--no-cache", dest="no_cache",
+                            action="store_true",
+                            help="Do not use or update the cache of report "
+                            "results shared between runs.")
+        window_group = parser.add_mutually_exclusive_group()
+        window_group.add_argument("--since", dest="since",
+                                  type=CmdLineApp._parse_time,
+                                  metavar="TIME", default=None,
+                                  help="Only report on requests from this "
+                                  "ISO 8601 date or time on (in the "
+                                  "database's time zone unless given).")
+        window_group.add_argument("--last", dest="last",
+                                  type=CmdLineApp._parse_duration,
+                                  metavar="DURATION", default=None,
+                                  help="Only report on requests in the last "
+                                  "DURATION, such as 30m, 12h, 7d or 2w, "
+                                  "bypassing the cache.")
+        parser.add_argument("--until", dest="until",
+                            type=CmdLineApp._parse_time, metavar="TIME",
+                            default=None,
+                            help="Only report on requests before this ISO "
+                            "8601 date or time.")
+        source_group.add_argument("--approx", dest="approx",
+                                  type=CmdLineApp._parse_sample_pct,
+                                  metavar="RATE", default=None,
+                                  help="Estimate the reports, with 95%% "
+                                  "confidence intervals, from a sample of "
+                                  "RATE percent of the log, bypassing the "
+                                  "cache.")
+        parser.add_argument("--approx-method", dest="approx_method",
+                            choices=CmdLineApp._APPROX_METHODS,
+                            default="system",
+                            help="With --approx, sample pages of the log "
+                            "(system, the default, fastest) or rows "
+                            "(bernoulli, whose intervals are reliable).")
+        source_group.add_argument("--concurrent", dest="concurrent",
+                                  action="store_true",
+                                  help="Run the three reports at once on "
+                                  "separate connections, rather than from "
+                                  "one snapshot, bypassing the cache.")
+        source_group.add_argument("--columnar", dest="columnar",
+                                  action="store_true",
+                                  help="Read the log once in bulk and "
+                                  "compute the reports in process with numpy "
+                                  "(which must be installed), bypassing the "
+                                  "cache.")
+        parser.add_argument("--profile", dest="profile", nargs="?",
+                            choices=["table", "json"], const="table",
+                            default=None,
+                            help="Write the time spent connecting, planning, "
+                            "executing, fetching and rendering, and the rows "
+                            "and bytes fetched, for each report to stderr, "
+                            "as a table (the default) or JSON.")
+        parser.add_argument("--explain", dest="explain",
+                            action="store_true",
+                            help="With --profile, also capture the EXPLAIN "
+                            "(ANALYZE, BUFFERS) output of each query, which "
+                            "runs each query twice.")
+        source_group.add_argument("--from-logs", dest="from_logs",
+                                  nargs="+", metavar="FILE", default=None,
+                                  help="Report on these access log files, "
+                                  "which may be gzip compressed, instead of "
+                                  "the log table.")
+        parser.add_argument("--metadata", dest="metadata", metavar="CSV",
+                            default=None,
+                            help="With --from-logs, take the articles and "
+                            "authors from this CSV file of slug, title and "
+                            "author columns instead of the database.")
+        parser.add_argument("--workers", dest="workers", type=int,
+                            metavar="N", default=None,
+                            help="With --from-logs, parse the files in N "
+                            "processes (default one per processor).")
+        source_group.add_argument("--snapshot", dest="snapshot",
+                                  metavar="DIR", default=None,
+                                  help="Report on the snapshot store in DIR "
+                                  "(see the snapshot command) instead of the "
+                                  "database, for the whole days in any time "
+                                  "window.")
+        parser.add_argument("--statement-timeout", dest="statement_timeout",
+                            type=float, metavar="SECONDS", default=None,
+                            help="Cancel the query of a report that runs for "
+                            "longer than SECONDS, and show the report as "
+                            "timed out (default the server's "
+                            "statement_timeout).")
+        parser.add_argument("--replica", dest="replica", metavar="DSN",
+                            default=None,
+                            help="Run the reports on the read replica at "
+                            "this connection string, such as 'host=replica "
+                            "port=5432', with the database name given by "
+                            "--db, rather than on the primary.")
+        parser.add_argument("--max-replica-lag", dest="max_replica_lag",
+                            type=float, metavar="SECONDS", default=30.0,
+                            help="With --replica, run the reports on the "
+                            "primary instead when the replica lags behind it "
+                            "by more than SECONDS or cannot be reached "
+                            "(default 30).")
+        parser.add_argument("--no-replica-fallback", dest="replica_fallback",
+                            action="store_false",
+                            help="With --replica, fail rather than run the "
+                            "reports on the primary.")
+        self._add_db_argument(parser, None, many=True)
+        parser.set_defaults(handler=CmdLineApp._run_report)
+
+        subparsers = parser.add_subparsers(title="commands", dest="command")
+        refresh_parser = subparsers.add_parser(
+            "refresh", help="Refresh the rollups of the log table "
+            "(see init/createRollups.sql).")
+        self._add_db_argument(refresh_parser)
+        refresh_parser.set_defaults(handler=CmdLineApp._run_refresh)
+
+        backfill_parser = subparsers.add_parser(
+            "backfill-article-ids", help="Resolve the article ids of the "
+            "log entries logged before the article id column was created "
+            "(see init/createArticleIds.sql), committing in chunks. An "
+            "interrupted backfill resumes where it stopped.")
+        backfill_parser.add_argument("--chunk-size", dest="chunk_size",
+                                     type=int, metavar="N", default=10000,
+                                     help="Resolve N log ids in each "
+                                     "transaction (default 10000).")
+        self._add_db_argument(backfill_parser)
+        backfill_parser.set_defaults(
+            handler=CmdLineApp._run_backfill_article_ids)
+
+        optimize_parser = subparsers.add_parser(
+            "optimize-schema", help="Install the indexes and statistics that "
+            "support the reports, and show the reports' estimated costs "
+            "before and after (for the report options given before the "
+            "command).")
+        self._add_db_argument(optimize_parser)
+        optimize_parser.set_defaults(
+            handler=CmdLineApp._run_optimize_schema)
+
+        ingest_parser = subparsers.add_parser(
+            "ingest", help="Bulk load access log files, which may be gzip "
+            "compressed, into the log table.")
+        ingest_parser.add_argument("files", nargs="+", metavar="FILE",
+                                   help="An access log file.")
+        ingest_parser.add_argument("--batch-rows", dest="batch_rows",
+                                   type=int, metavar="N", default=10000,
+                                   help="Send N rows in each COPY "
+                                   "(default 10000).")
+        ingest_parser.add_argument("--defer-indexes", dest="defer_indexes",
+                                   action="store_true",
+                                   help="Drop the log table's indexes "
+                                   "during the load and rebuild them after.")
+        ingest_parser.add_argument("--defer-constraints",
+                                   dest="defer_constraints",
+                                   action="store_true",
+                                   help="Drop the log table's constraints "
+                                   "during the load and add them back "
+                                   "after.")
+        self._add_db_argument(ingest_parser)
+        ingest_parser.set_defaults(handler=CmdLineApp._run_ingest)
+
+        snapshot_parser = subparsers.add_parser(
+            "snapshot", help="Append the days completed since the last "
+            "snapshot in a snapshot store (or every completed day of the "
+            "log), as a file of daily counts that can be reported on "
+            "without the database with --snapshot.")
+        snapshot_parser.add_argument("store", metavar="DIR",
+                                     help="The snapshot store's directory, "
+                                     "which is created if need be.")
+        self._add_db_argument(snapshot_parser)
+        snapshot_parser.set_defaults(handler=CmdLineApp._run_snapshot)
+
+        watch_parser = subparsers.add_parser(
+            "watch", help="Show the reports (for the report options given "
+            "before the command), then keep counting new log entries and "
+            "show them again whenever the top articles or authors, or the "
+            "days with errors, change.")
+        watch_parser.add_argument("--interval", dest="interval", type=float,
+                                  metavar="SECONDS", default=5.0,
+                                  help="Check for new log entries this "
+                                  "often (default 5).")
+        watch_parser.add_argument("--listen", dest="listen", metavar="CHANNEL",
+                                  default=None,
+                                  help="Also check as soon as a "
+                                  "notification is sent on CHANNEL, by a "
+                                  "NOTIFY trigger on the log for example.")
+        self._add_db_argument(watch_parser)
+        watch_parser.set_defaults(handler=CmdLineApp._run_watch)
+
+        serve_parser = subparsers.add_parser(
+            "serve", help="Serve the reports as JSON over HTTP, at /reports "
+            "with query parameters named as the report options, and "
+            "statistics at /stats, keeping results in memory and refreshing "
+            "them in the background.")
+        serve_parser.add_argument("--host", dest="host", default="127.0.0.1",
+                                  help="Address on which to listen (default "
+                                  "127.0.0.1).")
+        serve_parser.add_argument("--port", dest="port", type=int,
+                                  default=8080,
+                                  help="Port on which to listen (default "
+                                  "8080).")
+        serve_parser.add_argument("--refresh-interval",
+                                  dest="refresh_interval", type=float,
+                                  metavar="SECONDS", default=300.0,
+                                  help="Refresh the results at least this "
+                                  "often (default 300).")
+        serve_parser.add_argument("--poll-interval", dest="poll_interval",
+                                  type=float, metavar="SECONDS", default=5.0,
+                                  help="Check this often whether the log "
+                                  "has changed, and if so refresh the "
+                                  "results (default 5).")
+        serve_parser.add_argument("--pool-size", dest="pool_size", type=int,
+                                  metavar="N", default=4,
+                                  help="Open at most N connections to the "
+                                  "database (default 4).")
+        self._add_db_argument(serve_parser)
+        serve_parser.set_defaults(handler=CmdLineApp._run_serve)
+
         self.args = parser.parse_args()
+        if self.args.last is not None:
+            self.args.since = dt.datetime.now(dt.timezone.utc) - \
+                self.args.last
+        self.args.dbs = self.args.db or [CmdLineApp._DEFAULT_DB_NAME]
+        self.args.db = self.args.dbs[0]
+        import logs_analysis.db_names as db_names
+        if len(self.args.dbs) > 1 or db_names.is_pattern(self.args.db):
+            if self.args.command is not None:
+                parser.error("the {} command takes a single --db name"
+                             .format(self.args.command))
+            if self.args.from_logs or self.args.approx is not None or \
+                    self.args.concurrent or self.args.columnar or \
+                    self.args.replica is not None or self.args.visitors or \
+                    self.args.snapshot is not None:
+                parser.error("--from-logs, --approx, --concurrent, "
+                             "--columnar, --replica, --visitors and "
+                             "--snapshot take a single --db name")
+            self.args.handler = CmdLineApp._run_sharded_report
+        if self.args.replica is not None and (
+                self.args.command is not None or self.args.from_logs):
+            parser.error("--replica cannot be used with a command or "
+                         "--from-logs")
+        if self.args.statement_timeout is not None and (
+                self.args.command is not None or self.args.from_logs or
+                self.args.columnar):
+            parser.error("--statement-timeout cannot be used with a "
+                         "command, --from-logs or --columnar")
+        if self.args.statement_timeout is not None and \
+                self.args.statement_timeout <= 0:
+            parser.error("--statement-timeout must be more than 0")
+        if self.args.from_logs and (self.args.since or self.args.until):
+            parser.error("a time window cannot be used with --from-logs")
+        if self.args.bucket != "day" and (
+                self.args.command is not None or self.args.from_logs or
+                self.args.approx is not None or self.args.columnar):
+            parser.error("--bucket {} cannot be used with a command, "
+                         "--from-logs, --approx or --columnar"
+                         .format(self.args.bucket))
+        if self.args.visitors and self.args.command is not None:
+            parser.error("--visitors cannot be used with a command")
+        if self.args.snapshot is not None and (
+                self.args.command is not None or
+                self.args.replica is not None or
+                self.args.statement_timeout is not None or
+                self.args.bucket != "day"):
+            parser.error("--snapshot cannot be used with a command, "
+                         "--replica, --statement-timeout or --bucket")
+        if self.args.explain and self.args.profile is None:
+            parser.error("--explain can only be used with --profile")
 
-    def _print_articles_report(self, reporter):
-        print("The most popular {} articles are:".format(self.args.articles))
-        reporter.report_most_popular_articles(sys.stdout, self.args.articles)
+    @staticmethod
+    def _parse_time(value):
+        try:
+            return dt.datetime.fromisoformat(value)
+        except ValueError as exp:
+            raise argparse.ArgumentTypeError(
+                "invalid date or time: '{}'".format(value)) from exp
 
-    def _print_authors_report(self, reporter):
-        if self.args.authors is None:
-            print("The most popular authors are:")
-        else:
-            print("The most popular {} authors are:".format(self.args.authors))
-        reporter.report_most_popular_authors(sys.stdout, self.args.authors)
+    @staticmethod
+    def _parse_sample_pct(value):
+        try:
+            sample_pct = float(value)
+        except ValueError:
+            sample_pct = None
+        if sample_pct is None or not 0 < sample_pct <= 100:
+            raise argparse.ArgumentTypeError(
+                "invalid percentage: '{}'".format(value))
+        return sample_pct
 
-    def _print_errors_report(self, reporter):
-        print("The days on which more than {}% of requests led to errors:"
-              .format(self.args.errors))
-        reporter.report_get_dates_gt_errors_pct(sys.stdout, self.args.errors)
+    @staticmethod
+    def _parse_duration(value):
+        match = CmdLineApp._DURATION_RE.match(value)
+        if match is None:
+            raise argparse.ArgumentTypeError(
+                "invalid duration: '{}'".format(value))
+        return dt.timedelta(**{
+            CmdLineApp._DURATION_UNITS[match.group(2)]: int(match.group(1))})
+
+    @staticmethod
+    def _add_db_argument(parser, default=argparse.SUPPRESS, many=False):
+        # commands default to the value given before the command name, which
+        # in turn defaults to the default database. The value is a list, of
+        # the names given.
+        help_text = "sets the name of the database to report upon" \
+            " (default '{}').".format(CmdLineApp._DEFAULT_DB_NAME)
+        if many:
+            help_text += " Repeat, or give a glob pattern such as " \
+                "'news_*', to report on a log sharded across databases, " \
+                "bypassing the cache."
+        parser.add_argument("--db", dest="db", type=str, metavar="name",
+                            action="append", default=default,
+                            help=help_text)
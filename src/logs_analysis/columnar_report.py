@@ -0,0 +1,274 @@
+"""Module that computes the reports in process from one bulk read of the
+log."""
+
+import collections
+import os
+import threading
+
+try:
+    import numpy
+except ImportError:  # optional, see the "columnar" extra in setup.py
+    numpy = None
+
+import logs_analysis.db_report as db_report
+
+
+class _CopyDecoder:
+    """Decodes the rows of a binary COPY of fixed width (day, status,
+    article) rows, adding them to running counts."""
+
+    # PGCOPY\n\377\r\n\0, then the flags and header extension lengths
+    _SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+    _HEADER_SIZE = len(_SIGNATURE) + 8
+
+    # each row is its field count, then each field's length and value
+    _ROW_DTYPE = None if numpy is None else numpy.dtype([
+        ("fields", ">i2"), ("day_size", ">i4"), ("day", ">i4"),
+        ("status_size", ">i4"), ("status", ">i2"),
+        ("article_size", ">i4"), ("article", ">i4")])
+
+    _TRAILER = b"\xff\xff"
+
+    def __init__(self, counts):
+        self._counts = counts
+        self._buffer = bytearray()
+        self._header_read = False
+        self.rows = 0
+
+    def feed(self, data):
+        """Decodes the complete rows of the data so far."""
+        self._buffer += data
+        if not self._header_read:
+            if len(self._buffer) < _CopyDecoder._HEADER_SIZE:
+                return
+            if not self._buffer.startswith(_CopyDecoder._SIGNATURE):
+                raise ValueError("not binary COPY data")
+            extension = int.from_bytes(
+                self._buffer[_CopyDecoder._HEADER_SIZE - 4:
+                             _CopyDecoder._HEADER_SIZE], "big")
+            del self._buffer[:_CopyDecoder._HEADER_SIZE + extension]
+            self._header_read = True
+        row_count = len(self._buffer) // _CopyDecoder._ROW_DTYPE.itemsize
+        if row_count == 0:
+            return
+        rows = numpy.frombuffer(self._buffer, _CopyDecoder._ROW_DTYPE,
+                                row_count)
+        if (rows["fields"] != 3).any():
+            raise ValueError("unexpected row in binary COPY data")
+        self._counts.add(rows["day"], rows["status"], rows["article"])
+        self.rows += row_count
+        del rows  # release the buffer, so that it can be resized
+        del self._buffer[:row_count * _CopyDecoder._ROW_DTYPE.itemsize]
+
+    def close(self):
+        """Checks that the data ended with the trailer."""
+        if not self._header_read or \
+                bytes(self._buffer) != _CopyDecoder._TRAILER:
+            raise ValueError("unexpected end of binary COPY data")
+
+
+class _Counts:
+    """Running totals of the decoded rows."""
+
+    def __init__(self, article_count):
+        self.hits = numpy.zeros(article_count + 1, numpy.int64)
+        self.days = collections.defaultdict(lambda: [0, 0])
+
+    def add(self, days, statuses, articles):
+        """Adds arrays of day numbers, status classes and article codes."""
+        self.hits += numpy.bincount(articles, minlength=len(self.hits))
+        unique_days, inverse = numpy.unique(days, return_inverse=True)
+        requests = numpy.bincount(inverse, minlength=len(unique_days))
+        failures = numpy.bincount(inverse,
+                                  weights=statuses == ColumnarDbReport.NOK,
+                                  minlength=len(unique_days))
+        for day, day_requests, day_failures in zip(
+                unique_days.tolist(), requests.tolist(), failures.tolist()):
+            counts = self.days[day]
+            counts[0] += day_requests
+            counts[1] += int(day_failures)
+
+
+class ColumnarDbReport(db_report.ComputedReportMixin, db_report.DbReport):
+    """Reports on a database from one bulk read of the log.
+
+    The first report reads every log entry (in the time window, if any)
+    once, with a binary COPY of three fixed width columns: the day number,
+    the status class and the article, dictionary encoded on the server as
+    the article's position in the articles table. As every row has the same
+    width, each chunk of the stream is decoded with one numpy.frombuffer
+    call, and counted with numpy.bincount. The counts of hits per article
+    and requests and failures per day are kept, so all three reports, for
+    any top n and threshold, are then answered without querying again.
+    Call refresh to read the log again.
+
+    The articles, authors and log are read from a single snapshot. Reports
+    are as for DbReport, except that the order of rows with equal counts may
+    differ. The streaming methods return iterators over the lists, and the
+    rollups are never used.
+
+    This needs numpy, which is an optional dependency.
+    """
+
+    OK, NOK, NO_STATUS = 0, 1, 2
+
+    _NO_DAY = -2 ** 31
+
+    _ARTICLES_SQL = """
+    select articles.title, authors.name
+      from articles left join authors on authors.id = articles.author
+      order by articles.id"""
+
+    _AUTHORS_SQL = "select name from authors"
+
+    # day numbers are days since 1970 in the session's time zone, as
+    # date_trunc('day', time) would give, and article codes are positions,
+    # from 1, in _ARTICLES_SQL, or 0 for any other entry
+    _COPY_SQL = """
+    copy (
+      select coalesce(log.time::date - date '1970-01-01', {no_day})::int4,
+             (case when log.status = '200 OK' then {ok}
+                   when log.status is null then {no_status}
+                   else {nok} end)::int2,
+             coalesce(codes.code, 0)::int4
+        from log
+        left join (select slug, row_number() over (order by id)::int4 as code
+                     from articles) as codes
+          on log.path like '/article/%%' and log.status = '200 OK'
+             and codes.slug = substr(log.path, char_length('/article/') + 1)
+        where {window}
+    ) to stdout with (format binary)"""
+
+    _DAYS_SQL = """
+    select day, (date '1970-01-01' + day)::timestamptz
+      from unnest(%(days)s::int4[]) as day"""
+
+    _COPY_BUFFER_SIZE = 1 << 20
+
+    _DECODE_CHUNK_SIZE = 1 << 22
+
+    def __init__(self, dbname, provider=None, since=None, until=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname, provider, since, until -- as for db_report.DbReport.
+
+        Throws:
+        ImportError -- when numpy is not installed.
+        """
+        if numpy is None:
+            raise ImportError("ColumnarDbReport needs numpy, which is not "
+                              "installed")
+        super().__init__(dbname, provider, False, since, until)
+        self._loaded = None
+
+    @property
+    def rows_read(self):
+        """The number of log entries read, or None before the first
+        report."""
+        return None if self._loaded is None else self._loaded["rows"]
+
+    def refresh(self):
+        """Reads the log again, for the following reports.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(db_report.DbReport._SNAPSHOT_SQL)
+                cursor.execute(ColumnarDbReport._ARTICLES_SQL)
+                articles = cursor.fetchall()
+                cursor.execute(ColumnarDbReport._AUTHORS_SQL)
+                authors = [row[0] for row in cursor.fetchall()]
+                counts = _Counts(len(articles))
+                decoder = _CopyDecoder(counts)
+                # copy_expert does not interpolate parameters
+                sql = cursor.mogrify(
+                    ColumnarDbReport._COPY_SQL.format(
+                        no_day=ColumnarDbReport._NO_DAY,
+                        ok=ColumnarDbReport.OK, nok=ColumnarDbReport.NOK,
+                        no_status=ColumnarDbReport.NO_STATUS,
+                        window=self._window_sql()),
+                    self._window_params())
+                self._copy(cursor, sql, decoder)
+                cursor.execute(ColumnarDbReport._DAYS_SQL,
+                               {"days": sorted(counts.days)})
+                dates = dict(cursor.fetchall())
+        dates[ColumnarDbReport._NO_DAY] = None
+        self._loaded = {"articles": articles, "authors": authors,
+                        "counts": counts, "dates": dates,
+                        "rows": decoder.rows}
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors."""
+        loaded = self._load()
+        views = collections.OrderedDict((name, 0)
+                                        for name in loaded["authors"])
+        hits = loaded["counts"].hits.tolist()
+        for code, (_, author) in enumerate(loaded["articles"], 1):
+            if author is not None:
+                views[author] += hits[code]
+        return self._top(list(views.items()), top_n)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles."""
+        loaded = self._load()
+        hits = loaded["counts"].hits.tolist()
+        return self._top([(title, hits[code]) for code, (title, _)
+                          in enumerate(loaded["articles"], 1)], top_n)
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors."""
+        loaded = self._load()
+        dates = []
+        for day, (requests, failures) in loaded["counts"].days.items():
+            nok_pct = 100 * failures / requests
+            if nok_pct > pct_errors:
+                dates.append((loaded["dates"][day], nok_pct, requests))
+        dates.sort(key=lambda date: date[1], reverse=True)
+        return dates
+
+    @staticmethod
+    def _copy(cursor, sql, decoder):
+        """Runs the COPY, decoding its data in a thread as it arrives.
+
+        psycopg2 writes each row to the file separately, so it is given the
+        buffered end of a pipe, whose writes cost little, rather than a
+        python object, and the decoder reads the other end in large chunks.
+        """
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def decode():
+            with open(read_fd, "rb") as reader:
+                for data in iter(lambda: reader.read(
+                        ColumnarDbReport._DECODE_CHUNK_SIZE), b""):
+                    if errors:
+                        continue  # drain the pipe, so the COPY can finish
+                    try:
+                        decoder.feed(data)
+                    # pylint: disable-msg=W0703
+                    except Exception as exp:
+                        errors.append(exp)
+
+        thread = threading.Thread(target=decode, daemon=True)
+        thread.start()
+        try:
+            with open(write_fd, "wb",
+                      ColumnarDbReport._COPY_BUFFER_SIZE) as writer:
+                cursor.copy_expert(sql, writer,
+                                   ColumnarDbReport._COPY_BUFFER_SIZE)
+        finally:
+            thread.join()
+        if errors:
+            raise errors[0]
+        decoder.close()
+
+    def _load(self):
+        if self._loaded is None:
+            self.refresh()
+        return self._loaded
@@ -0,0 +1,510 @@
+"""Module providing database connections to the report classes."""
+
+import contextlib
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+class PoolError(psycopg2.Error):
+    """Raised when a connection cannot be obtained from a pool."""
+
+
+class ReplicaUnavailableError(psycopg2.Error):
+    """Raised when a read replica cannot be used and falling back to the
+    primary is not allowed."""
+
+
+class ConnectionProvider:
+    """Base class for providers of database connections.
+
+    Connections are borrowed using the connection() context manager. The
+    body of the with statement is run in a transaction that is committed on
+    success and rolled back on error, as with psycopg2's own connection
+    context manager. Subclasses decide how connections are opened and
+    whether they are reused.
+    """
+
+    def __init__(self, dbname, **connect_kwargs):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        connect_kwargs -- any further keyword arguments to pass to
+                          psycopg2.connect. Optional.
+        """
+        self._dbname = dbname
+        self._connect_kwargs = connect_kwargs
+        self._connect_count = 0
+        self._count_lock = threading.Lock()
+
+    @property
+    def dbname(self):
+        """The name of the database connected to."""
+        return self._dbname
+
+    @property
+    def connect_kwargs(self):
+        """The further keyword arguments passed to psycopg2.connect."""
+        return dict(self._connect_kwargs)
+
+    @property
+    def connect_count(self):
+        """The number of backend connections opened by this provider."""
+        return self._connect_count
+
+    @contextlib.contextmanager
+    def connection(self, autocommit=False):
+        """Context manager lending a connection for one transaction.
+
+        Keyword arguments:
+        autocommit -- lend the connection in autocommit mode instead, for
+                      statements that cannot be run in a transaction.
+                      Optional. Defaults to False.
+
+        Throws:
+        psycopg2.Error -- when a connection cannot be obtained or an error
+        occurs in the transaction.
+        """
+        conn = self._acquire()
+        try:
+            if autocommit:
+                conn.autocommit = True
+                try:
+                    yield conn
+                finally:
+                    if not conn.closed:
+                        conn.autocommit = False
+            else:
+                try:
+                    yield conn
+                except BaseException:
+                    # unless closed already, as psycopg2 does when a wait
+                    # callback is interrupted
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+                conn.commit()
+        finally:
+            self._release(conn)
+
+    def close(self):
+        """Closes any connections held by the provider."""
+
+    def _connect(self):
+        conn = psycopg2.connect(dbname=self._dbname, **self._connect_kwargs)
+        with self._count_lock:
+            self._connect_count += 1
+        return conn
+
+    def _acquire(self):
+        raise NotImplementedError
+
+    def _release(self, conn):
+        raise NotImplementedError
+
+    @staticmethod
+    def _is_reusable(conn):
+        """True if the connection is open and idle outside a transaction."""
+        return (not conn.closed and
+                conn.get_transaction_status() ==
+                psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DirectConnectionProvider(ConnectionProvider):
+    """Opens a new connection for every transaction and closes it after."""
+
+    def _acquire(self):
+        return self._connect()
+
+    def _release(self, conn):
+        conn.close()
+
+
+class SingleConnectionProvider(ConnectionProvider):
+    """Reuses one connection for every transaction.
+
+    The connection is opened on first use and reopened if it is found to be
+    closed. This provider is intended for single threaded use, such as the
+    command line application.
+    """
+
+    def __init__(self, dbname, **connect_kwargs):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        connect_kwargs -- any further keyword arguments to pass to
+                          psycopg2.connect. Optional.
+        """
+        super().__init__(dbname, **connect_kwargs)
+        self._conn = None
+
+    def close(self):
+        """Closes the connection, if open."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _acquire(self):
+        if self._conn is None or self._conn.closed:
+            self._conn = self._connect()
+        return self._conn
+
+    def _release(self, conn):
+        if not self._is_reusable(conn):
+            conn.close()
+            self._conn = None
+
+
+class PooledConnectionProvider(ConnectionProvider):
+    """Thread safe pool of reusable connections.
+
+    The pool opens min_size connections up front and grows on demand to at
+    most max_size. Connections that have been idle for longer than max_idle
+    seconds are closed, down to min_size. A connection that has been idle for
+    longer than health_check_interval seconds is checked with a trivial query
+    before it is lent out, and replaced if the check fails.
+    """
+
+    _HEALTH_CHECK_SQL = "select 1"
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, min_size=1, max_size=10, max_idle=300.0,
+                 health_check_interval=30.0, timeout=None, **connect_kwargs):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        min_size -- number of connections kept open. Optional. Defaults to 1.
+        max_size -- maximum number of connections open at once. Optional.
+                    Defaults to 10.
+        max_idle -- seconds after which an idle connection above min_size is
+                    closed. Optional. Defaults to 300. None means never.
+        health_check_interval -- seconds of idleness after which a
+                    connection is checked before reuse. Optional. Defaults
+                    to 30. None means never, 0 means always.
+        timeout -- seconds to wait for a connection when max_size are in
+                   use. Optional. Defaults to None, which means wait forever.
+        connect_kwargs -- any further keyword arguments to pass to
+                          psycopg2.connect. Optional.
+
+        Throws:
+        ValueError -- when the sizes are inconsistent.
+        psycopg2.Error -- when the initial connections cannot be opened.
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("require 0 <= min_size <= max_size and "
+                             "max_size >= 1")
+        super().__init__(dbname, **connect_kwargs)
+        self._min_size = min_size
+        self._max_size = max_size
+        self._max_idle = max_idle
+        self._health_check_interval = health_check_interval
+        self._timeout = timeout
+        self._cond = threading.Condition()
+        self._idle = []  # (connection, time returned), most recent last
+        self._size = 0  # idle plus lent out plus being opened
+        self._closed = False
+
+        for _ in range(min_size):
+            conn = self._connect()
+            self._idle.append((conn, time.monotonic()))
+            self._size += 1
+
+    @property
+    def size(self):
+        """The number of connections currently open or being opened."""
+        with self._cond:
+            return self._size
+
+    @property
+    def idle_count(self):
+        """The number of open connections not currently lent out."""
+        with self._cond:
+            return len(self._idle)
+
+    def close(self):
+        """Closes idle connections, and lent connections when returned."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def _acquire(self):
+        deadline = (None if self._timeout is None
+                    else time.monotonic() + self._timeout)
+        while True:
+            conn, idle_since = self._checkout(deadline)
+            if conn is None:
+                # a slot was reserved for a new connection
+                try:
+                    return self._connect()
+                except psycopg2.Error:
+                    self._discard(None)
+                    raise
+            if self._is_healthy(conn, idle_since):
+                return conn
+            self._discard(conn)
+
+    def _checkout(self, deadline):
+        """Takes an idle connection, or reserves a slot for a new one, in
+        which case None is returned as the connection."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+                evicted = self._evict_idle()
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self._max_size:
+                    self._size += 1
+                    conn, idle_since = None, None
+                    break
+                remaining = (None if deadline is None
+                             else deadline - time.monotonic())
+                if remaining is not None and remaining <= 0:
+                    raise PoolError("timed out waiting for a connection")
+                self._cond.wait(remaining)
+        for old_conn in evicted:
+            old_conn.close()
+        return conn, idle_since
+
+    def _evict_idle(self):
+        """Removes connections idle for too long. Must hold the lock."""
+        if self._max_idle is None:
+            return []
+        cutoff = time.monotonic() - self._max_idle
+        evicted = []
+        # oldest connections are at the front of the idle list
+        while (self._idle and self._size > self._min_size and
+               self._idle[0][1] < cutoff):
+            evicted.append(self._idle.pop(0)[0])
+            self._size -= 1
+        return evicted
+
+    def _is_healthy(self, conn, idle_since):
+        if conn.closed:
+            return False
+        if self._health_check_interval is None or \
+                time.monotonic() - idle_since < self._health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(PooledConnectionProvider._HEALTH_CHECK_SQL)
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        if conn is not None:
+            conn.close()
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _release(self, conn):
+        if not self._is_reusable(conn):
+            self._discard(conn)
+            return
+        with self._cond:
+            if not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+
+class ReplicaConnectionProvider(ConnectionProvider):
+    """Lends connections to a read replica of the database, or to the
+    primary when the replica cannot be reached or has fallen more than
+    max_lag seconds behind, so that reports do not load the primary. It is
+    for the reports, which only read; writes must be made through the
+    primary's own provider.
+
+    The replica's lag is checked, with one cheap query on the replica, when
+    a connection is first lent and then at most every check_interval
+    seconds, and connections are lent by whichever provider the latest
+    check chose. A replica that has replayed all the WAL it has received
+    has no lag, however long ago the primary last wrote, as does a database
+    that is not in recovery at all. This needs PostgreSQL 10 or later.
+    """
+
+    _LAG_SQL = """
+    select case
+             when not pg_is_in_recovery()
+               or pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+               then 0
+             else coalesce(extract(epoch from
+                                   now() - pg_last_xact_replay_timestamp()),
+                           'infinity')
+           end::float"""
+
+    # pylint: disable-msg=R0913
+    def __init__(self, replica, primary, max_lag=30.0, check_interval=5.0,
+                 fallback=True):
+        """Constructor.
+
+        Keyword arguments:
+        replica -- the ConnectionProvider of the read replica. Required.
+        primary -- the ConnectionProvider of the primary. Required.
+        max_lag -- the seconds by which the replica may lag behind the
+                   primary and still be used. Optional. Defaults to 30.
+        check_interval -- the seconds after which the lag is checked again.
+                          Optional. Defaults to 5.
+        fallback -- whether to lend connections to the primary when the
+                    replica cannot be used. Optional. Defaults to True. If
+                    False, ReplicaUnavailableError is raised instead.
+        """
+        super().__init__(replica.dbname, **replica.connect_kwargs)
+        self._replica = replica
+        self._primary = primary
+        self._max_lag = max_lag
+        self._check_interval = check_interval
+        self._fallback = fallback
+        self._lock = threading.Lock()
+        self._chosen = None
+        self._checked_at = None
+        self._lag = None
+        self._lenders = {}  # the provider that lent each connection
+
+    @property
+    def connect_kwargs(self):
+        """The further keyword arguments passed to psycopg2.connect by the
+        provider currently lending connections."""
+        return self._choose().connect_kwargs
+
+    @property
+    def connect_count(self):
+        """The number of backend connections opened to the replica and the
+        primary."""
+        return self._replica.connect_count + self._primary.connect_count
+
+    @property
+    def lag(self):
+        """The replica's lag in seconds at the latest check, or None if it
+        has not been checked or could not be reached."""
+        return self._lag
+
+    def uses_replica(self):
+        """Returns True if connections are currently lent to the replica.
+
+        Throws:
+        ReplicaUnavailableError -- when the replica cannot be used and
+        falling back is not allowed.
+        """
+        return self._choose() is self._replica
+
+    def connection(self, autocommit=False):
+        """As ConnectionProvider.connection, from the replica or, when it
+        cannot be used, the primary.
+
+        Throws:
+        ReplicaUnavailableError -- when the replica cannot be used and
+        falling back is not allowed.
+        psycopg2.Error -- when a connection cannot be obtained or an error
+        occurs in the transaction.
+        """
+        return super().connection(autocommit)
+
+    def close(self):
+        """Closes the connections held by the replica's and the primary's
+        providers."""
+        self._replica.close()
+        self._primary.close()
+
+    # pylint: disable-msg=W0212
+    def _acquire(self):
+        provider = self._choose()
+        conn = provider._acquire()
+        with self._lock:
+            self._lenders[conn] = provider
+        return conn
+
+    def _release(self, conn):
+        # to the provider that lent it, whichever is chosen now
+        with self._lock:
+            provider = self._lenders.pop(conn)
+        provider._release(conn)
+
+    def _choose(self):
+        """Returns the provider to lend connections, checking the replica's
+        lag if it is due."""
+        with self._lock:
+            now = time.monotonic()
+            if self._chosen is None or \
+                    now - self._checked_at >= self._check_interval:
+                self._chosen = self._check()
+                self._checked_at = now
+            return self._chosen
+
+    def _check(self):
+        try:
+            with self._replica.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(ReplicaConnectionProvider._LAG_SQL)
+                    self._lag = cursor.fetchone()[0]
+        except psycopg2.OperationalError as exp:
+            self._lag = None
+            problem = "the replica cannot be reached: {}".format(
+                str(exp).strip())
+        else:
+            if self._lag <= self._max_lag:
+                return self._replica
+            problem = "the replica lags by {:.1f}s, more than {:.1f}s" \
+                .format(self._lag, self._max_lag)
+        if not self._fallback:
+            raise ReplicaUnavailableError(problem)
+        return self._primary
+
+
+def wait_cancelling_on_interrupt(conn):
+    """Waits for the server, as a psycopg2 wait callback, such that a
+    KeyboardInterrupt, as from Ctrl-C, cancels the query in progress.
+
+    Installed with psycopg2.extensions.set_wait_callback, the blocking
+    calls of every connection can be interrupted. The interrupt sends a
+    cancel request to the server, and is then raised once the server has
+    stopped the query, rather than left running after the client has gone.
+    psycopg2 closes the connection, which a provider reopens on next use.
+    COPY cannot be used while a wait callback is installed.
+    """
+    interrupted = False
+    while True:
+        try:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                break
+            if state == psycopg2.extensions.POLL_READ:
+                select.select([conn.fileno()], [], [])
+            elif state == psycopg2.extensions.POLL_WRITE:
+                select.select([], [conn.fileno()], [])
+            else:
+                raise psycopg2.OperationalError(
+                    "unexpected poll state {}".format(state))
+        except KeyboardInterrupt:
+            if interrupted:
+                raise
+            interrupted = True
+            conn.cancel()
+        except psycopg2.extensions.QueryCanceledError:
+            if interrupted:
+                # the cancel was ours, so is not what went wrong
+                raise KeyboardInterrupt from None
+            raise
+    if interrupted:
+        raise KeyboardInterrupt
@@ -0,0 +1,11 @@
+"""Module that recognises glob patterns of database names, such as news_*,
+without importing psycopg2, so the command line can be checked before the
+database layer is imported."""
+
+_GLOB_CHARS = "*?["
+
+
+def is_pattern(dbname):
+    """Returns True if the database name is a glob pattern, such as
+    news_*."""
+    return any(char in dbname for char in _GLOB_CHARS)
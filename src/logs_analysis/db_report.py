@@ -1,45 +1,328 @@
 """Module that runs report queries against the database"""
-import psycopg2
+import collections
+import concurrent.futures
+import contextlib
+import functools
+import itertools
+import re
+
+import logs_analysis.connection_provider as connection_provider
+
+# Results of all three reports, taken from a single snapshot of the database.
+# Each item is a list of tuples as returned by the corresponding DbReport
+# method.
+ReportResult = collections.namedtuple("ReportResult",
+                                      ["articles", "authors", "errors"])
 
 
 class DbReport:
     """Reports on a database."""
 
+    # the requests are grouped by the bucket of their time, so the time
+    # window stays a range predicate on log.time itself
+    _DATES_WITH_PCT_ERRORS_SQL = """
+    select * from (
+      select {bucket} as date,
+            100 * count(case when status != '200 OK'
+                       then 1
+                       else NULL end)::float/count(*) as nok_pct,
+             count (*) as count_all
+          from log where {window} group by 1) as nok_table
+      where nok_pct > %(nok_pct)s
+      order by nok_pct desc"""
+
+    # the popular articles and authors reports are built over a relation of
+    # hits per article, keyed by its slug or its id, which is much smaller
+    # than the log, so that the join to articles is over a few rows per
+    # article rather than one per access
     _POPULAR_AUTHORS_SQL = """
     select authors.name as author_name,
-           count(aae.derived_slug) as article_count
-      from accessed_articles_ext as aae
-      right join authors on aae.author = authors.id
+           coalesce(sum(hits.hits), 0)::bigint as article_count
+      from authors
+      left join (articles join ({hits}) as hits on hits.{key} = articles.{key})
+        on articles.author = authors.id
       group by authors.name
       order by article_count desc"""
 
     _POPULAR_ARTICLES_SQL = """
-    select articles.title, count(aae.derived_slug) as access_count
-      from accessed_articles_ext aae
-      right join articles on aae.article = articles.id
-      group by aae.article, articles.title
+    select articles.title,
+           coalesce(sum(hits.hits), 0)::bigint as access_count
+      from articles
+      left join ({hits}) as hits on hits.{key} = articles.{key}
+      group by articles.id, articles.title
       order by access_count desc"""
 
-    _DATES_WITH_PCT_ERRORS_SQL = """
+    # hits per article slug from the log. accessed_articles filters and
+    # derives the slug exactly as indexed by the log_article_hits_idx index
+    # (see schema_optimizer), so that index and its statistics can be used.
+    _VIEW_HITS_SQL = """
+    select derived_slug as slug, count(*) as hits
+      from accessed_articles
+      where {window}
+      group by derived_slug"""
+
+    # hits per article id, from the article ids resolved as the log entries
+    # were inserted (see article_ids), counted and joined as integers
+    _ARTICLE_ID_HITS_SQL = """
+    select article_id as id, count(*) as hits
+      from log
+      where article_id is not null and status = '200 OK' and {window}
+      group by article_id"""
+
+    # hits per article slug, from the daily rollups of the days wholly
+    # within the time window, plus the log entries on the days it cuts short
+    # or added since the rollups were last refreshed
+    _ROLLUP_HITS_SQL = """
+    select slug, hits from article_hits_daily
+      where {whole_days}
+    union all
+    select substr(path, char_length('/article/') + 1) as slug, 1 as hits
+      from log
+      where path like '/article/%%' and status = '200 OK' and {log_where}"""
+
+    _ROLLUP_DATES_WITH_PCT_ERRORS_SQL = """
     select * from (
-      select date,
-            100 * count(case when status_nok = true
-                       then 1
-                       else NULL end)::float/count(*) as nok_pct,
-             count (*) as count_all
-          from log_ext group by date) as nok_table
+      select date, 100 * count_nok::float/count_all as nok_pct, count_all
+        from ({counts}) as counts) as nok_table
       where nok_pct > %(nok_pct)s
       order by nok_pct desc"""
 
+    # the requests and errors per bucket, of the whole log or of one shard of
+    # it, counted as by _DATES_WITH_PCT_ERRORS_SQL
+    _COUNTS_SQL = """
+    select {bucket} as date,
+           count(*),
+           count(case when status != '200 OK' then 1 else NULL end)
+      from log
+      where {window}
+      group by 1"""
+
+    # the requests and errors per bucket, summed from the rows of the
+    # rollup table of that granularity, or a finer one, wholly within the
+    # time window, plus the log entries in the spans it cuts short or added
+    # since the rollups were last refreshed
+    _ROLLUP_COUNTS_SQL = """
+    select nullif(date, '-infinity') as date,
+           sum(count_all)::bigint as count_all,
+           sum(count_nok)::bigint as count_nok
+      from (select coalesce({rollup_bucket}, '-infinity') as date,
+                   count_all, count_nok
+              from {rollup_table}
+              where {whole_spans}
+            union all
+            select coalesce({bucket}, '-infinity'), 1,
+                   case when status != '200 OK' then 1 else 0 end
+              from log
+              where {log_where}) as status_counts
+      group by date"""
+
+    # the log entries to add to the rollups: those in the time window that
+    # were added since the rollups were last refreshed, or that are in the
+    # spans of the rollups cut short by the window. The entries added since
+    # the refresh are a range of ids, bounded above as well as below so that
+    # the planner estimates it as narrow and an index on id serves it, and
+    # each span cut short is a range of time, which an index on time serves.
+    _ROLLUP_LOG_WHERE_SQL = """
+    {window}
+      and ((id > (select high_water from rollup_state)
+            and id <= (select max(id) from log)){parts})"""
+
+    # the start of the first span of a rollup's unit wholly within the time
+    # window, and the end of the last. The rollup rows of the spans between
+    # them, which start on a boundary of the unit, are wholly within it.
+    _FIRST_WHOLE_SQL = "date_trunc('{unit}', %(since)s - " \
+        "interval '1 microsecond') + interval '1 {unit}'"
+
+    _LAST_WHOLE_SQL = "date_trunc('{unit}', %(until)s)"
+
+    _WHOLE_SINCE_SQL = "{column} >= {first}"
+
+    # as well as excluding the log entries with no time, rolled up under
+    # -infinity, as the window does
+    _WHOLE_UNTIL_SQL = "isfinite({column}) and {column} < {last}"
+
+    _PART_SINCE_SQL = " or time < {first}"
+
+    _PART_UNTIL_SQL = " or time >= {last}"
+
+    # the names of the errors report's buckets, from the finest
+    BUCKETS = ("minute", "5m", "hour", "day")
+
+    # the start of the bucket of a time, by bucket name. Each bucket starts
+    # on a boundary of every finer one, so can be summed from them.
+    _BUCKET_SQL = {
+        "minute": "date_trunc('minute', {time})",
+        "5m": "date_trunc('hour', {time})"
+              " + floor(date_part('minute', {time}) / 5)"
+              " * interval '5 minutes'",
+        "hour": "date_trunc('hour', {time})",
+        "day": "date_trunc('day', {time})"}
+
+    # the rollup table, its time column and the unit of time of its rows,
+    # from which each bucket is summed
+    _ROLLUP_BUCKET_TABLES = {
+        "minute": ("request_status_minutely", "minute", "minute"),
+        "5m": ("request_status_minutely", "minute", "minute"),
+        "hour": ("request_status_minutely", "minute", "minute"),
+        "day": ("request_status_daily", "date", "day")}
+
+    _SHARD_RANGE_SQL = "time >= %(low)s and time < %(high)s"
+
+    _SHARD_NULL_SQL = "time is null"
+
+    # the starts of the day aligned shards of the log, and the end of the
+    # last, in the session's time zone
+    _SHARD_BOUNDS_SQL = """
+    select low + make_interval(days => step * shard)
+      from (select date_trunc('day', min(time)) as low,
+                   ceil((max(time)::date - min(time)::date + 1)::float
+                        / %(shards)s)::int as step
+              from log
+              where {window}) as bounds,
+           generate_series(0, %(shards)s) as shard
+      where low is not null"""
+
+    _EXPORT_SNAPSHOT_SQL = "select pg_export_snapshot()"
+
+    _IMPORT_SNAPSHOT_SQL = """
+    set transaction isolation level repeatable read, read only;
+    set transaction snapshot %(snapshot)s"""
+
+    # shards per degree of parallelism, so that shards with more traffic
+    # than others are evened out over the workers
+    _SHARDS_PER_WORKER = 4
+
+    # the bounds of the time window, as predicates on log.time that an index
+    # on time can answer with a range scan
+    _SINCE_SQL = "time >= %(since)s"
+
+    _UNTIL_SQL = "time < %(until)s"
+
     _LIMIT_SQL = " limit %(top_n)s"
 
-    def __init__(self, dbname):
+    _SNAPSHOT_SQL = \
+        "set transaction isolation level repeatable read, read only;"
+
+    # the milliseconds for which each report's query may run, set for the
+    # transaction running it
+    _TIMEOUT_SQL = "set local statement_timeout = {:d};"
+
+    # each report becomes one section of a single union query, with its
+    # columns mapped onto (label, day, pct, count) and its own ordering kept
+    _RUN_ALL_SECTION_SQL = """
+    select {section} as section, row_number() over () as ord, {columns}
+      from ({sql}) as s({aliases})"""
+
+    _RUN_ALL_SECTIONS = (
+        ("articles", "label, null::timestamptz, null::float8, n",
+         "label, n"),
+        ("authors", "label, null::timestamptz, null::float8, n",
+         "label, n"),
+        ("errors", "null::text, day, pct, n", "day, pct, n"))
+
+    _EXPLAIN_SQL = "explain (format json) "
+
+    # whether the rollups and the article id column are installed, found out
+    # on the connection of the first report that needs to know, before its
+    # own query. Whether the article ids have been backfilled is then read
+    # from article_ids_state, which can only be named once it exists.
+    _FEATURES_SQL = """
+    select to_regclass('rollup_state') is not null,
+           to_regclass('article_ids_state') is not null"""
+
+    _ARTICLE_IDS_READY_SQL = \
+        "select high_water >= target from article_ids_state"
+
+    # number of rows fetched per round trip by the streaming methods
+    _DEFAULT_ITERSIZE = 2000
+
+    _CURSOR_NAME = "logs_analysis_cursor_{}"
+
+    _CURSOR_NUMBERS = itertools.count()
+
+    _PARAM_RE = re.compile(r"%\((\w+)\)s")
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, provider=None, use_rollups=None, since=None,
+                 until=None, use_article_ids=None, bucket="day",
+                 statement_timeout=None):
         """Constructor.
 
          Keyword arguments:
          dbname -- name of the psql database to connect to. Required.
+         provider -- the connection_provider.ConnectionProvider used to
+                     obtain connections to the database. Optional. Defaults
+                     to None, which means a new connection is opened for
+                     every report.
+         use_rollups -- whether to answer the reports from the daily rollup
+                        tables (see init/createRollups.sql). Optional.
+                        Defaults to None, which means use them if they
+                        exist in the database. With a time window, only the
+                        rollups of the days, or minutes, wholly within it
+                        are used, and the rest of the window is read from
+                        the log.
+         since -- the datetime from which (inclusive) to report on the log.
+                  Optional. Defaults to None, which means from the start.
+                  A naive datetime is in the session's time zone.
+         until -- the datetime until which (exclusive) to report on the log.
+                  Optional. Defaults to None, which means to the end.
+         use_article_ids -- whether to count the articles' hits by the
+                            log.article_id column (see
+                            init/createArticleIds.sql), when the rollups are
+                            not used. Optional. Defaults to None, which means
+                            use it if it exists and has been backfilled.
+         bucket -- the name, in BUCKETS, of the span of time over which the
+                   errors report counts requests. Optional. Defaults to
+                   "day".
+         statement_timeout -- the seconds for which the query of each
+                              report may run before the server cancels it,
+                              which raises
+                              psycopg2.extensions.QueryCanceledError.
+                              Optional. Defaults to None, which means the
+                              server's own statement_timeout.
+
+         Throws:
+         ValueError -- when the bucket is unknown.
          """
+        if bucket not in DbReport.BUCKETS:
+            raise ValueError("unknown bucket: '{}', not one of {}".format(
+                bucket, ", ".join(DbReport.BUCKETS)))
         self._dbname = dbname
+        self._since = since
+        self._until = until
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+        self._use_rollups = use_rollups
+        self._rollups_installed = None
+        self._use_article_ids = use_article_ids
+        self._article_ids_ready = None
+        self._bucket = bucket
+        self._statement_timeout = statement_timeout
+        self._profiler = None
+
+    @property
+    def provider(self):
+        """The connection provider used by this instance."""
+        return self._provider
+
+    @property
+    def bucket(self):
+        """The name of the errors report's buckets."""
+        return self._bucket
+
+    @property
+    def profiler(self):
+        """The query_profiler.QueryProfiler recording the phases of the
+        reports, or None, the default, when they are not profiled. The
+        reports are named "articles", "authors", "errors" and "all" (for
+        run_all and iter_all). AsyncDbReport's coroutines are not
+        profiled."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
 
     def get_most_popular_authors(self, top_n=None):
         """Report the most popular authors.
@@ -57,18 +340,8 @@ class DbReport:
         psycopg2.Error --  when an error occurs with accessing or querying the
         database.
         """
-        authors = []
-
-        with psycopg2.connect(dbname=self._dbname) as news_db:
-            with news_db.cursor() as cursor:
-                sql = DbReport._POPULAR_AUTHORS_SQL
-                if top_n is not None:
-                    sql += DbReport._LIMIT_SQL
-                cursor.execute(sql, {"top_n": top_n})
-                authors = cursor.fetchall()
-
-        news_db.close()
-        return authors
+        return self._fetch_all(functools.partial(self._authors_query, top_n),
+                               report="authors")
 
     def get_most_popular_articles(self, top_n=None):
         """Report the most popular articles.
@@ -86,43 +359,629 @@ class DbReport:
         psycopg2.Error --  when an error occurs with accessing or querying the
         database.
         """
-        articles = []
-
-        with psycopg2.connect(dbname=self._dbname) as news_db:
-            with news_db.cursor() as cursor:
-                sql = DbReport._POPULAR_ARTICLES_SQL
-                if top_n is not None:
-                    sql += DbReport._LIMIT_SQL
-                cursor.execute(sql, {"top_n": top_n})
-                articles = cursor.fetchall()
-
-        news_db.close()
-        return articles
+        return self._fetch_all(
+            functools.partial(self._articles_query, top_n),
+            report="articles")
 
-    def get_dates_wth_more_pct_errors(self, pct_errors):
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
         """Report the dates which have more than the supplied percent of
         response errors.
 
         Returns a list of tuples in order of most error prone. The tuples
         in the list contain date (as datetime), percentage of error requests
-        on that date, and total number of requests on that date.
+        on that date, and total number of requests on that date. The dates
+        are those of the days of the log by default, or the starts of its
+        minutes, 5 minutes or hours with the bucket given to the
+        constructor. Buckets finer than a day are summed from the per minute
+        rollups, when the rollups are used.
+
+        With a parallelism above 1, the log is split into shards of whole
+        days, whose requests are counted on up to that many connections at
+        once, all reading the same snapshot of the database. The counts are
+        merged and the percentages computed here, with the same results as
+        the single query. Days with the same percentage of errors are then
+        in date order. The shards are scanned by time, so this is best
+        supported by the log_time_idx index (see schema_optimizer). The
+        rollups, when used, are already small and are read by a single
+        query.
 
         Keyword arguments:
         pct_errors -- the percentage of errors that is our lower bound
                       (exclusive). Required.
+        parallelism -- the number of connections on which to count the
+                       requests. Optional. Defaults to 1.
 
         Throws:
         psycopg2.Error --  when an error occurs with accessing or querying the
         database.
         """
+        if parallelism > 1 and not self.uses_rollups():
+            return self._parallel_dates_wth_more_pct_errors(pct_errors,
+                                                            parallelism)
+        return self._fetch_all(
+            functools.partial(self._errors_query, pct_errors),
+            report="errors")
 
-        dates = []
+    def get_daily_request_counts(self):
+        """Report the number of requests, and of those the number that led
+        to errors, on each date, or in each bucket of the log's time when
+        the bucket is finer than a day.
+
+        Returns a list of (date, requests, errors) tuples, in no particular
+        order, from which the errors report is computed. These are the
+        counts to add up when merging the errors reports of several logs.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        return self._fetch_all(self._counts_query, report="errors")
+
+    def iter_most_popular_authors(self, top_n=None,
+                                  itersize=_DEFAULT_ITERSIZE):
+        """Report the most popular authors as a stream.
 
-        with psycopg2.connect(dbname=self._dbname) as news_db:
+        As get_most_popular_authors, but returns a generator of the tuples,
+        which are fetched from a server side cursor itersize rows at a time.
+        The connection is held until the generator is exhausted or closed.
+
+        Keyword arguments:
+        top_n -- the number of authors to which to limit the returned list.
+        Optional. Defaults to None, which means unlimited.
+        itersize -- the number of rows to fetch per round trip. Optional.
+        Defaults to 2000.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        return self._iter_rows(functools.partial(self._authors_query, top_n),
+                               itersize=itersize, report="authors")
+
+    def iter_most_popular_articles(self, top_n=None,
+                                   itersize=_DEFAULT_ITERSIZE):
+        """Report the most popular articles as a stream.
+
+        As get_most_popular_articles, but returns a generator of the tuples,
+        which are fetched from a server side cursor itersize rows at a time.
+        The connection is held until the generator is exhausted or closed.
+
+        Keyword arguments:
+        top_n -- the number of articles to which to limit the returned list.
+        Optional. Defaults to None, which means unlimited.
+        itersize -- the number of rows to fetch per round trip. Optional.
+        Defaults to 2000.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        return self._iter_rows(
+            functools.partial(self._articles_query, top_n),
+            itersize=itersize, report="articles")
+
+    def iter_dates_wth_more_pct_errors(self, pct_errors,
+                                       itersize=_DEFAULT_ITERSIZE):
+        """Report the dates which have more than the supplied percent of
+        response errors as a stream.
+
+        As get_dates_wth_more_pct_errors, but returns a generator of the
+        tuples, which are fetched from a server side cursor itersize rows at
+        a time. The connection is held until the generator is exhausted or
+        closed.
+
+        Keyword arguments:
+        pct_errors -- the percentage of errors that is our lower bound
+                      (exclusive). Required.
+        itersize -- the number of rows to fetch per round trip. Optional.
+        Defaults to 2000.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        return self._iter_rows(
+            functools.partial(self._errors_query, pct_errors),
+            itersize=itersize, report="errors")
+
+    def run_all(self, articles_top_n=None, authors_top_n=None,
+                pct_errors=1.0):
+        """Run all three reports against a single snapshot of the database.
+
+        The reports are combined into one statement, run in a read only,
+        repeatable read transaction, so they need a single round trip and
+        are consistent with each other even while the log is written to.
+
+        Returns a ReportResult whose articles, authors and errors items are
+        as returned by get_most_popular_articles, get_most_popular_authors
+        and get_dates_wth_more_pct_errors respectively.
+
+        Keyword arguments:
+        articles_top_n -- the number of articles to which to limit the
+                          articles report. Optional. Defaults to None, which
+                          means unlimited.
+        authors_top_n -- the number of authors to which to limit the
+                         authors report. Optional. Defaults to None, which
+                         means unlimited.
+        pct_errors -- the percentage of errors that is the lower bound
+                      (exclusive) of the errors report. Optional. Defaults
+                      to 1.0.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        query = functools.partial(self._run_all_query, articles_top_n,
+                                  authors_top_n, pct_errors)
+        results = collections.OrderedDict(
+            (name, []) for name, _, _ in DbReport._RUN_ALL_SECTIONS)
+        for row in self._fetch_all(query, report="all", snapshot=True):
+            name, report_row = self._run_all_row(row)
+            results[name].append(report_row)
+        return ReportResult(*results.values())
+
+    def iter_all(self, articles_top_n=None, authors_top_n=None,
+                 pct_errors=1.0, itersize=_DEFAULT_ITERSIZE):
+        """Run all three reports against a single snapshot of the database,
+        as a stream.
+
+        As run_all, but returns a generator of (report name, row) tuples,
+        which are fetched from a server side cursor itersize rows at a time.
+        The report names are "articles", "authors" and "errors", and the
+        rows of each report are as for the corresponding
+        iter_most_popular_articles, iter_most_popular_authors and
+        iter_dates_wth_more_pct_errors methods. All rows of one report are
+        generated before any of the next, in that order. Reports with no
+        rows generate nothing. The connection is held until the generator is
+        exhausted or closed.
+
+        Keyword arguments:
+        articles_top_n, authors_top_n, pct_errors -- as for run_all.
+        itersize -- the number of rows to fetch per round trip. Optional.
+        Defaults to 2000.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        query = functools.partial(self._run_all_query, articles_top_n,
+                                  authors_top_n, pct_errors)
+        rows = self._iter_rows(query, itersize=itersize, snapshot=True,
+                               report="all")
+        return (self._run_all_row(row) for row in rows)
+
+    def explain_costs(self, articles_top_n=None, authors_top_n=None,
+                      pct_errors=1.0):
+        """Report the planner's estimated cost of each report's query.
+
+        Returns an ordered dictionary of total estimated cost, keyed by
+        report name ("articles", "authors" and "errors"). The keyword
+        arguments are as for run_all.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        queries = [functools.partial(self._articles_query, articles_top_n),
+                   functools.partial(self._authors_query, authors_top_n),
+                   functools.partial(self._errors_query, pct_errors)]
+        costs = collections.OrderedDict()
+        for (name, _, _), query in zip(DbReport._RUN_ALL_SECTIONS, queries):
+            plan = self._fetch_all(
+                functools.partial(self._explain_query, query))[0][0]
+            costs[name] = plan[0]["Plan"]["Total Cost"]
+        return costs
+
+    def uses_rollups(self):
+        """Returns True if the reports are answered from the daily rollups.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        if self._use_rollups is None:
+            self._use_rollups = self._installed_features()
+        return self._use_rollups
+
+    def uses_article_ids(self):
+        """Returns True if the articles' hits are counted by the
+        log.article_id column rather than by the slugs derived from the log
+        paths. The column is not used when the rollups are.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        if self.uses_rollups():
+            return False
+        if self._use_article_ids is None:
+            self._installed_features()
+            self._use_article_ids = self._article_ids_ready
+        return self._use_article_ids
+
+    def _installed_features(self):
+        """Returns whether the rollups are installed, having found out, with
+        whether the article ids are ready, if need be. Reports find out on
+        their own connection before their queries are built, so this only
+        queries, on a connection of its own, when asked before any
+        report."""
+        if self._rollups_installed is None:
+            with self._provider.connection() as news_db:
+                with news_db.cursor() as cursor:
+                    self._find_features(cursor)
+        return self._rollups_installed
+
+    def _find_features(self, cursor, prefix=""):
+        """Finds out what is installed, on a cursor of the connection of a
+        report, after the prefix statements of its transaction."""
+        cursor.execute(prefix + DbReport._FEATURES_SQL)
+        self._rollups_installed, self._article_ids_ready = cursor.fetchone()
+        if self._article_ids_ready:
+            cursor.execute(DbReport._ARTICLE_IDS_READY_SQL)
+            self._article_ids_ready = cursor.fetchone()[0]
+
+    def _needs_features(self):
+        """Returns True if building a report's query needs to know what is
+        installed, and that is not yet known."""
+        if self._rollups_installed is not None:
+            return False
+        if self._use_rollups:
+            return False  # the article ids are not used with the rollups
+        return self._use_rollups is None or self._use_article_ids is None
+
+    def _hits_sql(self):
+        if self.uses_rollups():
+            return DbReport._ROLLUP_HITS_SQL.format(
+                whole_days=self._whole_spans_sql("date", "day"),
+                log_where=self._rollup_log_where_sql("day"))
+        return DbReport._VIEW_HITS_SQL.format(window=self._window_sql())
+
+    def _hits(self):
+        """Returns the hits per article relation, and the column of
+        articles on which it is keyed, as format arguments for the popular
+        articles and authors queries."""
+        if self.uses_article_ids():
+            return {"hits": DbReport._ARTICLE_ID_HITS_SQL.format(
+                window=self._window_sql()), "key": "id"}
+        return {"hits": self._hits_sql(), "key": "slug"}
+
+    def _window_sql(self):
+        """Returns the predicate restricting log entries to the time
+        window."""
+        predicates = []
+        if self._since is not None:
+            predicates.append(DbReport._SINCE_SQL)
+        if self._until is not None:
+            predicates.append(DbReport._UNTIL_SQL)
+        return " and ".join(predicates) or "true"
+
+    def _window_params(self):
+        return {"since": self._since, "until": self._until}
+
+    def _whole_spans_sql(self, column, unit):
+        """Returns the predicate restricting the rows of a rollup, of spans
+        of the unit starting at the column, to those wholly within the time
+        window."""
+        predicates = []
+        if self._since is not None:
+            predicates.append(DbReport._WHOLE_SINCE_SQL.format(
+                column=column,
+                first=DbReport._FIRST_WHOLE_SQL.format(unit=unit)))
+        if self._until is not None:
+            predicates.append(DbReport._WHOLE_UNTIL_SQL.format(
+                column=column,
+                last=DbReport._LAST_WHOLE_SQL.format(unit=unit)))
+        return " and ".join(predicates) or "true"
+
+    def _rollup_log_where_sql(self, unit):
+        """Returns the predicate restricting log entries to those to add to
+        the rows of a rollup of spans of the unit."""
+        parts = ""
+        if self._since is not None:
+            parts += DbReport._PART_SINCE_SQL.format(
+                first=DbReport._FIRST_WHOLE_SQL.format(unit=unit))
+        if self._until is not None:
+            parts += DbReport._PART_UNTIL_SQL.format(
+                last=DbReport._LAST_WHOLE_SQL.format(unit=unit))
+        return DbReport._ROLLUP_LOG_WHERE_SQL.format(
+            window=self._window_sql(), parts=parts)
+
+    def _run_all_query(self, articles_top_n, authors_top_n, pct_errors,
+                       run_all_sections=_RUN_ALL_SECTIONS):
+        queries = [self._articles_query(articles_top_n),
+                   self._authors_query(authors_top_n),
+                   self._errors_query(pct_errors)]
+        sections = []
+        params = {}
+        for index, (name, columns, aliases) in \
+                enumerate(run_all_sections):
+            sql, section_params = self._namespaced(name, *queries[index])
+            sections.append(DbReport._RUN_ALL_SECTION_SQL.format(
+                section=index, columns=columns, sql=sql, aliases=aliases))
+            params.update(section_params)
+        return (" union all ".join(sections) + " order by section, ord",
+                params)
+
+    @staticmethod
+    def _run_all_row(row):
+        """Converts a row of the combined query into a (report name, report
+        row) tuple."""
+        section, _, label, day, pct, count = row
+        name = DbReport._RUN_ALL_SECTIONS[section][0]
+        if name == "errors":
+            return name, (day, pct, count)
+        return name, (label, count)
+
+    def _parallel_dates_wth_more_pct_errors(self, pct_errors, parallelism):
+        shard_count = parallelism * DbReport._SHARDS_PER_WORKER
+        with self._provider.connection() as news_db:
             with news_db.cursor() as cursor:
-                sql = DbReport._DATES_WITH_PCT_ERRORS_SQL
-                cursor.execute(sql, {"nok_pct": pct_errors})
-                dates = cursor.fetchall()
+                # the transaction exporting the snapshot must stay open
+                # until the shards have imported it
+                cursor.execute(self._prefix(snapshot=True))
+                cursor.execute(DbReport._EXPORT_SNAPSHOT_SQL)
+                snapshot = cursor.fetchone()[0]
+                cursor.execute(
+                    DbReport._SHARD_BOUNDS_SQL.format(
+                        window=self._window_sql()),
+                    dict(self._window_params(), shards=shard_count))
+                bounds = [row[0] for row in cursor.fetchall()]
+                window = self._window_sql()
+                shards = [("{} and {}".format(where, window),
+                           dict(self._window_params(), **params))
+                          for where, params in
+                          [(DbReport._SHARD_NULL_SQL, {})] +
+                          [(DbReport._SHARD_RANGE_SQL,
+                            {"low": low, "high": high})
+                           for low, high in zip(bounds, bounds[1:])]]
+                with connection_provider.PooledConnectionProvider(
+                        self._dbname, min_size=0, max_size=parallelism,
+                        **self._provider.connect_kwargs) as pool, \
+                        concurrent.futures.ThreadPoolExecutor(
+                            parallelism) as executor:
+                    counts = list(executor.map(
+                        lambda shard: self._count_shard(pool, snapshot,
+                                                        *shard),
+                        shards))
+        return self.dates_wth_more_pct_errors(itertools.chain(*counts),
+                                              pct_errors)
 
-        news_db.close()
+    @staticmethod
+    def dates_wth_more_pct_errors(counts, pct_errors):
+        """Computes the errors report from daily request counts.
+
+        Returns a list of tuples as returned by
+        get_dates_wth_more_pct_errors, with days with the same percentage
+        of errors in date order.
+
+        Keyword arguments:
+        counts -- an iterable of (date, requests, errors) tuples, as
+                  returned by get_daily_request_counts. The counts of a date
+                  given more than once are added up. Required.
+        pct_errors -- the percentage of errors that is our lower bound
+                      (exclusive). Required.
+        """
+        merged = collections.OrderedDict()
+        for date, count_all, count_nok in counts:
+            merged_all, merged_nok = merged.get(date, (0, 0))
+            merged[date] = (merged_all + count_all, merged_nok + count_nok)
+        dates = []
+        for date, (count_all, count_nok) in merged.items():
+            nok_pct = 100 * count_nok / count_all
+            if nok_pct > pct_errors:
+                dates.append((date, nok_pct, count_all))
+        # the null date of entries with no time sorts before other dates
+        dates.sort(key=lambda date: (-date[1], date[0] is not None,
+                                     date[0]))
         return dates
+
+    def _count_shard(self, pool, snapshot, where, params):
+        with self._connection("errors", pool) as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(DbReport._IMPORT_SNAPSHOT_SQL,
+                               {"snapshot": snapshot})
+                return self._execute(cursor, self._counts_sql(where), params,
+                                     "errors", self._prefix())
+
+    def _authors_query(self, top_n):
+        sql = DbReport._POPULAR_AUTHORS_SQL.format(**self._hits())
+        if top_n is not None:
+            sql += DbReport._LIMIT_SQL
+        return sql, dict(self._window_params(), top_n=top_n)
+
+    def _articles_query(self, top_n):
+        sql = DbReport._POPULAR_ARTICLES_SQL.format(**self._hits())
+        if top_n is not None:
+            sql += DbReport._LIMIT_SQL
+        return sql, dict(self._window_params(), top_n=top_n)
+
+    def _counts_query(self):
+        if self.uses_rollups():
+            sql = self._rollup_counts_sql()
+        else:
+            sql = self._counts_sql(self._window_sql())
+        return sql, self._window_params()
+
+    @staticmethod
+    def _explain_query(query):
+        sql, params = query()
+        return DbReport._EXPLAIN_SQL + sql, params
+
+    def _errors_query(self, pct_errors):
+        if self.uses_rollups():
+            sql = DbReport._ROLLUP_DATES_WITH_PCT_ERRORS_SQL.format(
+                counts=self._rollup_counts_sql())
+        else:
+            sql = DbReport._DATES_WITH_PCT_ERRORS_SQL.format(
+                bucket=self._bucket_sql(), window=self._window_sql())
+        return sql, dict(self._window_params(), nok_pct=pct_errors)
+
+    def _bucket_sql(self, column="time"):
+        """Returns the expression of the start of the bucket of the time in
+        the column."""
+        return DbReport._BUCKET_SQL[self._bucket].format(time=column)
+
+    def _counts_sql(self, window):
+        return DbReport._COUNTS_SQL.format(bucket=self._bucket_sql(),
+                                           window=window)
+
+    def _rollup_counts_sql(self):
+        table, column, unit = DbReport._ROLLUP_BUCKET_TABLES[self._bucket]
+        return DbReport._ROLLUP_COUNTS_SQL.format(
+            rollup_bucket=self._bucket_sql(column), rollup_table=table,
+            whole_spans=self._whole_spans_sql(column, unit),
+            bucket=self._bucket_sql(),
+            log_where=self._rollup_log_where_sql(unit))
+
+    @staticmethod
+    def _namespaced(prefix, sql, params):
+        """Prefixes the named parameters of a query so that queries can be
+        combined without their parameter names clashing."""
+        sql = DbReport._PARAM_RE.sub(
+            lambda match: "%({}_{})s".format(prefix, match.group(1)), sql)
+        params = {"{}_{}".format(prefix, name): value
+                  for name, value in params.items()}
+        return sql, params
+
+    def _fetch_all(self, query, report="query", snapshot=False):
+        """Returns all rows of the query, a function returning its sql and
+        params, which is called on the report's connection."""
+        with self._connection(report) as news_db:
+            with news_db.cursor() as cursor:
+                prefix = self._begin(cursor, snapshot)
+                return self._execute(cursor, *query(), report, prefix)
+
+    def _iter_rows(self, query, itersize, snapshot=False, report="query"):
+        """Generates the rows of the query, as for _fetch_all, from a server
+        side cursor."""
+        with self._connection(report) as news_db:
+            with news_db.cursor() as cursor:
+                prefix = self._begin(cursor, snapshot)
+                sql, params = query()
+                prefix = self._plan(cursor, sql, params, report, prefix)
+                if prefix:
+                    cursor.execute(prefix)
+            name = DbReport._CURSOR_NAME.format(
+                next(DbReport._CURSOR_NUMBERS))
+            with news_db.cursor(name=name) as cursor:
+                cursor.itersize = itersize
+                with self._phase(report, "execute"):
+                    cursor.execute(sql, params)
+                if self._profiler is None:
+                    yield from cursor
+                    return
+                rows = iter(cursor)
+                while True:
+                    with self._phase(report, "fetch"):
+                        row = next(rows, None)
+                    if row is None:
+                        return
+                    self._profiler.add_rows(report, [row])
+                    yield row
+
+    def _prefix(self, snapshot=False):
+        """Returns the statements to run at the start of the transaction of
+        a report: those taking a snapshot, if need be, and setting the
+        statement timeout, if any."""
+        prefix = DbReport._SNAPSHOT_SQL if snapshot else ""
+        if self._statement_timeout is not None:
+            # at least a millisecond, as 0 would mean no timeout
+            prefix += DbReport._TIMEOUT_SQL.format(
+                max(1, round(1000 * self._statement_timeout)))
+        return prefix
+
+    def _begin(self, cursor, snapshot):
+        """Returns the prefix statements of a report's transaction. If the
+        report's query needs to know what is installed, the prefix is run
+        first, as it must start the transaction, then the features are
+        found out on the same connection, and no prefix is left to run."""
+        prefix = self._prefix(snapshot)
+        if not self._needs_features():
+            return prefix
+        self._find_features(cursor, prefix)
+        return ""
+
+    @contextlib.contextmanager
+    def _connection(self, report, provider=None):
+        """Returns a context manager for a connection from the provider,
+        by default this instance's, profiling obtaining it."""
+        provider = self._provider if provider is None else provider
+        with contextlib.ExitStack() as stack:
+            with self._phase(report, "connect"):
+                news_db = stack.enter_context(provider.connection())
+            yield news_db
+
+    def _execute(self, cursor, sql, params, report, prefix=""):
+        """Runs the prefix statements, if any, then the statement, and
+        returns all its rows, profiling each phase."""
+        prefix = self._plan(cursor, sql, params, report, prefix)
+        with self._phase(report, "execute"):
+            cursor.execute(prefix + sql, params)
+        with self._phase(report, "fetch"):
+            rows = cursor.fetchall()
+        if self._profiler is not None:
+            self._profiler.add_rows(report, rows)
+        return rows
+
+    def _plan(self, cursor, sql, params, report, prefix):
+        """When profiling, runs the prefix statements, if any, then the
+        EXPLAIN of the statement, and returns the prefix left to run before
+        the statement. Statements that are themselves EXPLAINs are not
+        explained."""
+        if self._profiler is None or sql.lstrip().startswith("explain"):
+            return prefix
+        cursor.execute(prefix + self._profiler.explain_sql + sql, params)
+        self._profiler.add_plan(report, cursor.fetchone()[0])
+        return ""
+
+    def _phase(self, report, phase):
+        if self._profiler is None:
+            return contextlib.nullcontext()
+        return self._profiler.phase(report, phase)
+
+
+class ComputedReportMixin:
+    """Mixin for the reports whose rows are all computed before any is
+    returned, such as from counts held in memory.
+
+    Derives run_all and the iter_* methods from the get_* methods of the
+    class it is mixed into, ahead of any DbReport base, and ranks (name,
+    views) rows with _top.
+    """
+
+    def run_all(self, articles_top_n=None, authors_top_n=None,
+                pct_errors=1.0):
+        """As DbReport.run_all, but with the reports computed one after the
+        other, so not from a single snapshot of a database."""
+        return ReportResult(
+            self.get_most_popular_articles(articles_top_n),
+            self.get_most_popular_authors(authors_top_n),
+            self.get_dates_wth_more_pct_errors(pct_errors))
+
+    # pylint: disable-msg=W0613
+    def iter_most_popular_authors(self, top_n=None, itersize=None):
+        """As get_most_popular_authors, as an iterator."""
+        return iter(self.get_most_popular_authors(top_n))
+
+    def iter_most_popular_articles(self, top_n=None, itersize=None):
+        """As get_most_popular_articles, as an iterator."""
+        return iter(self.get_most_popular_articles(top_n))
+
+    def iter_dates_wth_more_pct_errors(self, pct_errors, itersize=None):
+        """As get_dates_wth_more_pct_errors, as an iterator."""
+        return iter(self.get_dates_wth_more_pct_errors(pct_errors))
+
+    def iter_all(self, articles_top_n=None, authors_top_n=None,
+                 pct_errors=1.0, itersize=None):
+        """As run_all, as an iterator of (report name, row) tuples."""
+        result = self.run_all(articles_top_n, authors_top_n, pct_errors)
+        return ((name, row) for name, rows in zip(result._fields, result)
+                for row in rows)
+
+    @staticmethod
+    def _top(rows, top_n):
+        """Sorts a list of (name, views) rows by views, and those with the
+        same views by name, and returns the first top_n of them, or all for
+        None."""
+        rows.sort(key=lambda row: (-row[1], row[0]))
+        return rows if top_n is None else rows[:top_n]
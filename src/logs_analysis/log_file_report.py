@@ -0,0 +1,399 @@
+"""Module that runs the reports over access log files, without the log table.
+
+The files are in the common (or combined) log format written by web servers,
+for example:
+
+    127.0.0.1 - - [17/Jul/2016:10:15:32 +0000] "GET /article/slug HTTP/1.1"
+    200 512
+
+(on one line) and may be gzip compressed. An access is successful if its
+status code is 200, as "200 OK" in the log table. Days are UTC days.
+"""
+
+import collections
+import concurrent.futures
+import csv
+import datetime as dt
+import gzip
+import http
+import ipaddress
+import os
+import re
+
+import logs_analysis.db_report as db_report
+
+# Articles and authors metadata. articles is a list of (id, author id, slug,
+# title) tuples and authors a list of (id, name) tuples.
+Metadata = collections.namedtuple("Metadata", ["articles", "authors"])
+
+# Aggregated counts from log lines: a Counter of successful accesses by
+# article slug, a dictionary of [requests, failed requests] lists by UTC day
+# ordinal, and the number of lines that could not be parsed.
+LogCounts = collections.namedtuple("LogCounts",
+                                   ["hits", "days", "bad_lines"])
+
+_ARTICLE_PREFIX = "/article/"
+
+_OK_STATUS = "200"
+
+# ip ident user [time] "method path protocol" status ...
+_LINE_RE = re.compile(
+    r'\S+ \S+ \S+ '
+    r'\[(\d\d)/(\w{3})/(\d{4}):(\d\d):(\d\d):\d\d ([+-])(\d\d)(\d\d)\] '
+    r'"\S+ (\S+)[^"]*" (\d{3})\b')
+
+# as _LINE_RE, capturing every column of the log table
+_RECORD_RE = re.compile(
+    r'(\S+) \S+ \S+ '
+    r'\[(\d\d)/(\w{3})/(\d{4}):(\d\d):(\d\d):(\d\d) ([+-]\d\d)(\d\d)\] '
+    r'"(\S+) (\S+)[^"]*" (\d{3})\b')
+
+_MONTHS = {name: number for number, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+     "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], 1)}
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+# plain files larger than this are split into chunks of this size
+_CHUNK_SIZE = 64 * 1024 * 1024
+
+_METADATA_ARTICLES_SQL = "select id, author, slug, title from articles"
+
+_METADATA_AUTHORS_SQL = "select id, name from authors"
+
+
+def load_metadata_from_db(provider):
+    """Loads the articles and authors metadata from the database.
+
+    Returns a Metadata tuple.
+
+    Keyword arguments:
+    provider -- the connection_provider.ConnectionProvider used to obtain a
+                connection to the database. Required.
+
+    Throws:
+    psycopg2.Error --  when an error occurs with accessing or querying the
+    database.
+    """
+    with provider.connection() as news_db:
+        with news_db.cursor() as cursor:
+            cursor.execute(_METADATA_ARTICLES_SQL)
+            articles = cursor.fetchall()
+            cursor.execute(_METADATA_AUTHORS_SQL)
+            authors = cursor.fetchall()
+    return Metadata(articles, authors)
+
+
+def load_metadata_from_csv(path):
+    """Loads the articles and authors metadata from a CSV file.
+
+    The file has a header row and the columns slug, title and author (the
+    author's name). An author without articles can be listed in a row with
+    an empty slug and title.
+
+    Returns a Metadata tuple.
+
+    Keyword arguments:
+    path -- the CSV file. Required.
+
+    Throws:
+    OSError -- when the file cannot be read.
+    KeyError -- when the file does not have the required columns.
+    """
+    articles = []
+    author_ids = collections.OrderedDict()
+    with open(path, newline="") as csv_file:
+        for row in csv.DictReader(csv_file):
+            author_id = author_ids.setdefault(row["author"],
+                                              len(author_ids) + 1)
+            if row["slug"]:
+                articles.append((len(articles) + 1, author_id, row["slug"],
+                                 row["title"]))
+    authors = [(author_id, name) for name, author_id in author_ids.items()]
+    return Metadata(articles, authors)
+
+
+def parse_lines(lines):
+    """Parses access log lines.
+
+    Returns a generator of (path, ok, day) tuples, where ok is True for a
+    successful access and day is the UTC day ordinal, and None for each
+    line that cannot be parsed.
+
+    Keyword arguments:
+    lines -- an iterable of log lines, as strings. Required.
+    """
+    day_cache = {}
+    for line in lines:
+        match = _LINE_RE.match(line)
+        if match is None:
+            yield None
+            continue
+        (day, month, year, hour, minute, sign, offset_hours,
+         offset_minutes, path, status) = match.groups()
+        key = (day, month, year, hour, minute, sign, offset_hours,
+               offset_minutes)
+        ordinal = day_cache.get(key)
+        if ordinal is None:
+            ordinal = _utc_day_ordinal(key)
+            if ordinal is None:
+                yield None
+                continue
+            day_cache[key] = ordinal
+        yield path, status == _OK_STATUS, ordinal
+
+
+def parse_records(lines):
+    """Parses access log lines into rows of the log table.
+
+    Returns a generator of (path, ip, method, status, time) tuples, as for
+    the columns of the log table, and None for each line that cannot be
+    parsed. The status is the code and reason phrase, such as "404 NOT
+    FOUND", and the ip is None if it is not an IP address.
+
+    Keyword arguments:
+    lines -- an iterable of log lines, as strings. Required.
+    """
+    statuses = {}
+    zones = {}
+    for line in lines:
+        match = _RECORD_RE.match(line)
+        month = None if match is None else _MONTHS.get(match.group(3))
+        if month is None:
+            yield None
+            continue
+        (ip, day, _, year, hour, minute, second, offset_hours,
+         offset_minutes, method, path, code) = match.groups()
+        status = statuses.get(code)
+        if status is None:
+            try:
+                status = "{} {}".format(
+                    code, http.HTTPStatus(int(code)).phrase.upper())
+            except ValueError:
+                status = code
+            statuses[code] = status
+        zone = zones.get((offset_hours, offset_minutes))
+        if zone is None:
+            minutes = int(offset_minutes)
+            zone = zones[(offset_hours, offset_minutes)] = dt.timezone(
+                dt.timedelta(hours=int(offset_hours),
+                             minutes=-minutes if offset_hours[0] == "-"
+                             else minutes))
+        try:
+            time = dt.datetime(int(year), month, int(day), int(hour),
+                               int(minute), int(second), tzinfo=zone)
+        except ValueError:
+            yield None
+            continue
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            ip = None
+        yield path, ip, method, status, time
+
+
+def read_lines(path):
+    """Generates the lines of an access log file, which may be gzip
+    compressed.
+
+    Keyword arguments:
+    path -- the file. Required.
+
+    Throws:
+    OSError -- when the file cannot be read.
+    """
+    with open(path, "rb") as log_file:
+        is_gzip = log_file.read(2) == _GZIP_MAGIC
+    return _open_lines(path, 0, None if is_gzip else os.path.getsize(path))
+
+
+def count_lines(lines):
+    """Aggregates access log lines in a single pass.
+
+    Returns a LogCounts tuple.
+
+    Keyword arguments:
+    lines -- an iterable of log lines, as strings. Required.
+    """
+    hits = collections.Counter()
+    days = {}
+    bad_lines = 0
+    prefix_length = len(_ARTICLE_PREFIX)
+    for record in parse_lines(lines):
+        if record is None:
+            bad_lines += 1
+            continue
+        path, is_ok, ordinal = record
+        counts = days.get(ordinal)
+        if counts is None:
+            counts = days[ordinal] = [0, 0]
+        counts[0] += 1
+        if is_ok:
+            if path.startswith(_ARTICLE_PREFIX):
+                hits[path[prefix_length:]] += 1
+        else:
+            counts[1] += 1
+    return LogCounts(hits, days, bad_lines)
+
+
+def merge_counts(all_counts):
+    """Merges LogCounts tuples into one.
+
+    Keyword arguments:
+    all_counts -- an iterable of LogCounts tuples. Required.
+    """
+    hits = collections.Counter()
+    days = {}
+    bad_lines = 0
+    for counts in all_counts:
+        hits.update(counts.hits)
+        for ordinal, (requests, failures) in counts.days.items():
+            merged = days.setdefault(ordinal, [0, 0])
+            merged[0] += requests
+            merged[1] += failures
+        bad_lines += counts.bad_lines
+    return LogCounts(hits, days, bad_lines)
+
+
+def _utc_day_ordinal(key):
+    day, month, year, hour, minute, sign, offset_hours, offset_minutes = key
+    month_number = _MONTHS.get(month)
+    if month_number is None:
+        return None
+    try:
+        ordinal = dt.date(int(year), month_number, int(day)).toordinal()
+    except ValueError:
+        return None
+    offset = int(offset_hours) * 60 + int(offset_minutes)
+    minutes = int(hour) * 60 + int(minute) - (offset if sign == "+"
+                                              else -offset)
+    return ordinal + minutes // (24 * 60)
+
+
+def _open_lines(path, start, end):
+    """Generates the lines of a file that start within [start, end), or all
+    lines of a gzip file if end is None."""
+    if end is None:
+        with gzip.open(path, "rt", errors="replace") as log_file:
+            for line in log_file:
+                yield line
+        return
+    with open(path, "rb") as log_file:
+        if start > 0:
+            # skip the line straddling the start, which the previous chunk
+            # reads
+            log_file.seek(start - 1)
+            log_file.readline()
+        while log_file.tell() < end:
+            line = log_file.readline()
+            if not line:
+                break
+            yield line.decode("utf-8", errors="replace")
+
+
+def _count_chunk(chunk):
+    return count_lines(_open_lines(*chunk))
+
+
+def _chunks(paths, chunk_size):
+    """Generates (path, start, end) chunks of the files. Gzip files cannot
+    be split, so are a single chunk with an end of None."""
+    for path in paths:
+        with open(path, "rb") as log_file:
+            is_gzip = log_file.read(2) == _GZIP_MAGIC
+        if is_gzip:
+            yield path, 0, None
+            continue
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), chunk_size):
+            yield path, start, min(start + chunk_size, size)
+
+
+class LogFileReport(db_report.ComputedReportMixin):
+    """Reports on access log files, with the same interface as DbReport.
+
+    The files are read once, on the first report, in chunks that are
+    parsed and aggregated in parallel across a pool of processes. The
+    aggregated counts are kept, so further reports need no further reading.
+    """
+
+    def __init__(self, paths, metadata, workers=None,
+                 chunk_size=_CHUNK_SIZE):
+        """Constructor.
+
+        Keyword arguments:
+        paths -- the access log files, which may be gzip compressed.
+                 Required.
+        metadata -- the articles and authors Metadata. Required.
+        workers -- the number of processes in which to parse the files.
+                   Optional. Defaults to None, which means the number of
+                   processors. 1 means parse in this process.
+        chunk_size -- the size in bytes of the chunks into which plain files
+                      are split. Optional. Defaults to 64MB.
+        """
+        self._paths = list(paths)
+        self._metadata = metadata
+        self._workers = workers
+        self._chunk_size = chunk_size
+        self._counts = None
+
+    @property
+    def counts(self):
+        """The LogCounts aggregated from the files, which are read on first
+        use.
+
+        Throws:
+        OSError -- when a file cannot be read.
+        """
+        return self.load()
+
+    def load(self):
+        """Reads the files, unless already read, and returns the aggregated
+        LogCounts.
+
+        Throws:
+        OSError -- when a file cannot be read.
+        """
+        if self._counts is None:
+            chunks = list(_chunks(self._paths, self._chunk_size))
+            if self._workers == 1 or len(chunks) == 1:
+                self._counts = merge_counts(
+                    _count_chunk(chunk) for chunk in chunks)
+            else:
+                with concurrent.futures.ProcessPoolExecutor(
+                        self._workers) as executor:
+                    self._counts = merge_counts(
+                        executor.map(_count_chunk, chunks))
+        return self._counts
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors."""
+        names = dict(self._metadata.authors)
+        views = collections.OrderedDict(
+            (name, 0) for _, name in self._metadata.authors)
+        hits = self.counts.hits
+        for _, author_id, slug, _ in self._metadata.articles:
+            if author_id in names:
+                views[names[author_id]] += hits[slug]
+        return self._top(list(views.items()), top_n)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles."""
+        hits = self.counts.hits
+        return self._top([(title, hits[slug])
+                          for _, _, slug, title in self._metadata.articles],
+                         top_n)
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=None):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors."""
+        dates = []
+        for ordinal, (requests, failures) in self.counts.days.items():
+            nok_pct = 100 * failures / requests
+            if nok_pct > pct_errors:
+                day = dt.date.fromordinal(ordinal)
+                dates.append((dt.datetime(day.year, day.month, day.day,
+                                          tzinfo=dt.timezone.utc),
+                              nok_pct, requests))
+        dates.sort(key=lambda date: date[1], reverse=True)
+        return dates
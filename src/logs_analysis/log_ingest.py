@@ -0,0 +1,191 @@
+"""Module that bulk loads access log records into the log table."""
+
+import collections
+import io
+import itertools
+import time
+
+import psycopg2.sql
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.log_file_report as log_file_report
+
+# Outcome of a load: the number of rows loaded, the number of COPY batches
+# they were sent in, the number of records skipped as unparseable, the
+# seconds taken, including any rebuilding of indexes and constraints, and
+# the rows loaded per second.
+IngestResult = collections.namedtuple(
+    "IngestResult",
+    ["rows", "batches", "skipped", "seconds", "rows_per_second"])
+
+
+class LogIngester:
+    """Loads access log records into the log table with COPY FROM STDIN.
+
+    Records are sent in batches of a fixed number of rows, so memory use is
+    bounded however many records are loaded. The whole load is one
+    transaction: either every record is loaded or, on error, none is.
+
+    Optionally, the log table's indexes (other than those of constraints)
+    and its constraints are dropped before the load and recreated after it,
+    in the same transaction, which is faster for loads that are large
+    compared to the table. The table is locked against reads and writes for
+    the duration of such a load.
+    """
+
+    _COPY_SQL = """
+    copy log (path, ip, method, status, time) from stdin"""
+
+    _INDEXES_SQL = """
+    select indexrelid::regclass::text, pg_get_indexdef(indexrelid)
+      from pg_index
+      where indrelid = 'log'::regclass
+        and not exists (select 1 from pg_constraint
+                          where conindid = indexrelid)"""
+
+    _CONSTRAINTS_SQL = """
+    select conname, pg_get_constraintdef(oid)
+      from pg_constraint
+      where conrelid = 'log'::regclass and contype in ('p', 'u', 'c', 'f')
+      order by contype, conname"""
+
+    _DROP_INDEX_SQL = "drop index {}"
+
+    _DROP_CONSTRAINT_SQL = "alter table log drop constraint {}"
+
+    _ADD_CONSTRAINT_SQL = "alter table log add constraint {} {}"
+
+    _DEFAULT_BATCH_ROWS = 10000
+
+    def __init__(self, dbname, provider=None,
+                 batch_rows=_DEFAULT_BATCH_ROWS, defer_indexes=False,
+                 defer_constraints=False):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every call.
+        batch_rows -- the number of rows sent in each COPY. Optional.
+                      Defaults to 10,000.
+        defer_indexes -- whether to drop the log table's indexes before the
+                         load and recreate them after. Optional. Defaults to
+                         False.
+        defer_constraints -- whether to drop the log table's constraints,
+                             such as its primary key, before the load and
+                             add them back after. Optional. Defaults to
+                             False.
+        """
+        if batch_rows < 1:
+            raise ValueError("batch_rows must be at least 1")
+        self._dbname = dbname
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+        self._batch_rows = batch_rows
+        self._defer_indexes = defer_indexes
+        self._defer_constraints = defer_constraints
+
+    def ingest(self, records):
+        """Loads records into the log table.
+
+        Returns an IngestResult.
+
+        Keyword arguments:
+        records -- an iterable of (path, ip, method, status, time) tuples, as
+                   generated by log_file_report.parse_records. None records
+                   are skipped. Required.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        start = time.monotonic()
+        rows = batches = 0
+        skipped = [0]
+
+        def counted(records):
+            for record in records:
+                if record is None:
+                    skipped[0] += 1
+                else:
+                    yield record
+
+        records = counted(records)
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                indexes, constraints = self._drop_deferred(cursor)
+                while True:
+                    batch = list(itertools.islice(records, self._batch_rows))
+                    if not batch:
+                        break
+                    cursor.copy_expert(LogIngester._COPY_SQL,
+                                       self._copy_data(batch))
+                    rows += len(batch)
+                    batches += 1
+                for name, definition in constraints:
+                    cursor.execute(psycopg2.sql.SQL(
+                        LogIngester._ADD_CONSTRAINT_SQL).format(
+                            psycopg2.sql.Identifier(name),
+                            psycopg2.sql.SQL(definition)))
+                for _, definition in indexes:
+                    cursor.execute(definition)
+        seconds = time.monotonic() - start
+        return IngestResult(rows, batches, skipped[0], seconds,
+                            rows / seconds if seconds > 0 else 0.0)
+
+    def ingest_files(self, paths):
+        """Loads the records of access log files into the log table.
+
+        Returns an IngestResult, in which skipped is the number of lines
+        that could not be parsed.
+
+        Keyword arguments:
+        paths -- the access log files, which may be gzip compressed.
+                 Required.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        OSError -- when a file cannot be read.
+        """
+        return self.ingest(log_file_report.parse_records(
+            itertools.chain.from_iterable(
+                log_file_report.read_lines(path) for path in paths)))
+
+    def _drop_deferred(self, cursor):
+        """Drops the indexes and constraints that are to be deferred, and
+        returns lists of their (name, definition) tuples."""
+        indexes = []
+        constraints = []
+        if self._defer_constraints:
+            cursor.execute(LogIngester._CONSTRAINTS_SQL)
+            constraints = cursor.fetchall()
+            for name, _ in constraints:
+                cursor.execute(psycopg2.sql.SQL(
+                    LogIngester._DROP_CONSTRAINT_SQL).format(
+                        psycopg2.sql.Identifier(name)))
+        if self._defer_indexes:
+            cursor.execute(LogIngester._INDEXES_SQL)
+            indexes = cursor.fetchall()
+            for name, _ in indexes:
+                cursor.execute(LogIngester._DROP_INDEX_SQL.format(name))
+        return indexes, constraints
+
+    @staticmethod
+    def _copy_data(batch):
+        """Returns a file of the rows in COPY's text format."""
+        return io.StringIO("".join(
+            "\t".join(LogIngester._copy_value(value) for value in record)
+            + "\n" for record in batch))
+
+    @staticmethod
+    def _copy_value(value):
+        if value is None:
+            return "\\N"
+        if not isinstance(value, str):
+            value = value.isoformat() if hasattr(value, "isoformat") \
+                else str(value)
+        return value.replace("\\", "\\\\").replace("\t", "\\t") \
+            .replace("\n", "\\n").replace("\r", "\\r")
@@ -0,0 +1,240 @@
+"""Module that keeps the reports up to date as the log grows, reading only
+the new log entries."""
+
+import collections
+import select
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+
+
+class LogWatcher(db_report.ComputedReportMixin):
+    """Keeps the three reports up to date by tailing the log.
+
+    A snapshot reads the articles and authors, and counts the hits of every
+    article slug and the requests and errors of every day in the whole log,
+    up to its highest id. Each poll then counts only the log entries above
+    that id, which are found with a range scan of the primary key, so its
+    cost is in proportion to the number of new entries rather than the size
+    of the log, and adds them to the counts. As for rollup.Rollup, entries
+    are assumed to be inserted with increasing ids, and articles and authors
+    added after the snapshot are not seen until the next snapshot.
+
+    The reports are answered from the counts, with the interface of
+    db_report.DbReport, so a watcher can be given to
+    news_text_report.NewsTextReport. Articles with the same views are in
+    title order, and authors with the same views in name order.
+    """
+
+    _HIGH_WATER_SQL = "select coalesce(max(id), 0) from log"
+
+    _ARTICLES_SQL = """
+    select articles.slug, articles.title, authors.name
+      from articles left join authors on authors.id = articles.author
+      order by articles.id"""
+
+    _AUTHORS_SQL = "select name from authors"
+
+    _HITS_SQL = """
+    select substr(path, char_length('/article/') + 1), count(*)
+      from log
+      where id > %(low)s and id <= %(high)s
+        and path like '/article/%%' and status = '200 OK'
+      group by 1"""
+
+    _STATUS_SQL = """
+    select date_trunc('day', time),
+           count(*),
+           count(case when status != '200 OK' then 1 else NULL end)
+      from log
+      where id > %(low)s and id <= %(high)s
+      group by 1"""
+
+    _LISTEN_SQL = "listen {}"
+
+    def __init__(self, dbname, provider=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every call.
+        """
+        self._dbname = dbname
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+        self._high_water = None
+        self._articles = []  # (slug, title, author name)
+        self._authors = []
+        self._hits = collections.Counter()
+        self._days = collections.defaultdict(lambda: [0, 0])
+
+    @property
+    def high_water(self):
+        """The highest log id counted, or None before the snapshot."""
+        return self._high_water
+
+    def snapshot(self):
+        """Reads the articles and authors and counts the whole log, from a
+        single snapshot of the database.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(db_report.DbReport._SNAPSHOT_SQL)
+                cursor.execute(LogWatcher._ARTICLES_SQL)
+                articles = cursor.fetchall()
+                cursor.execute(LogWatcher._AUTHORS_SQL)
+                authors = [row[0] for row in cursor.fetchall()]
+                high_water, hits, days = self._count_above(cursor, 0)
+        self._articles = articles
+        self._authors = authors
+        self._hits.clear()
+        self._days.clear()
+        self._add(high_water, hits, days)
+
+    def poll(self):
+        """Counts the log entries added since the snapshot or last poll,
+        taking the snapshot first if there has been none.
+
+        Returns the number of log entries counted.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        if self._high_water is None:
+            self.snapshot()
+            return sum(count_all for count_all, _ in self._days.values())
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(db_report.DbReport._SNAPSHOT_SQL)
+                counts = self._count_above(cursor, self._high_water)
+        return self._add(*counts)
+
+    def watch(self, articles_top_n=None, authors_top_n=None, pct_errors=1.0,
+              interval=5.0, channel=None):
+        """Generates a db_report.ReportResult, as from run_all, after the
+        snapshot, and then after each poll in which the top articles or
+        authors, or the days above the percentage of errors, changed.
+
+        Polls every interval seconds, or, with a channel, as soon as a
+        notification is sent on it (by a trigger on the log, for example),
+        and at least every interval seconds. Generates forever.
+
+        Keyword arguments:
+        articles_top_n, authors_top_n, pct_errors -- as for
+        db_report.DbReport.run_all.
+        interval -- seconds between polls. Optional. Defaults to 5.
+        channel -- the name of the channel on which to LISTEN. Optional.
+                   Defaults to None, which means only poll.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        listener = None if channel is None else self._listen(channel)
+        try:
+            self.snapshot()
+            shown = None
+            while True:
+                result = self.run_all(articles_top_n, authors_top_n,
+                                      pct_errors)
+                if self._signature(result) != shown:
+                    shown = self._signature(result)
+                    yield result
+                self._wait(listener, interval)
+                self.poll()
+        finally:
+            if listener is not None:
+                listener.close()
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors."""
+        views = collections.OrderedDict((name, 0) for name in self._authors)
+        for slug, _, author in self._articles:
+            if author is not None:
+                views[author] += self._hits[slug]
+        return self._top(list(views.items()), top_n)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles."""
+        return self._top([(title, self._hits[slug])
+                          for slug, title, _ in self._articles], top_n)
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors."""
+        return db_report.DbReport.dates_wth_more_pct_errors(
+            ((date, count_all, count_nok)
+             for date, (count_all, count_nok) in self._days.items()),
+            pct_errors)
+
+    @staticmethod
+    def _count_above(cursor, low):
+        """Counts the log entries with an id above low.
+
+        Returns the highest id, and the (slug, hits) and (date, requests,
+        errors) rows of the entries.
+        """
+        cursor.execute(LogWatcher._HIGH_WATER_SQL)
+        params = {"low": low, "high": cursor.fetchone()[0]}
+        if params["high"] <= low:
+            return low, [], []
+        cursor.execute(LogWatcher._HITS_SQL, params)
+        hits = cursor.fetchall()
+        cursor.execute(LogWatcher._STATUS_SQL, params)
+        return params["high"], hits, cursor.fetchall()
+
+    def _add(self, high_water, hits, days):
+        """Adds counts of log entries to those held. Returns the number of
+        entries added."""
+        for slug, slug_hits in hits:
+            self._hits[slug] += slug_hits
+        entries = 0
+        for date, count_all, count_nok in days:
+            counts = self._days[date]
+            counts[0] += count_all
+            counts[1] += count_nok
+            entries += count_all
+        self._high_water = high_water
+        return entries
+
+    def _listen(self, channel):
+        listener = psycopg2.connect(dbname=self._dbname,
+                                    **self._provider.connect_kwargs)
+        listener.set_isolation_level(
+            psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with listener.cursor() as cursor:
+            cursor.execute(LogWatcher._LISTEN_SQL.format(
+                psycopg2.extensions.quote_ident(channel, cursor)))
+        return listener
+
+    @staticmethod
+    def _wait(listener, interval):
+        """Waits for the interval, or until a notification arrives on the
+        listener, if any."""
+        if listener is None:
+            time.sleep(interval)
+            return
+        if select.select([listener], [], [], interval)[0]:
+            listener.poll()
+            del listener.notifies[:]
+
+    @staticmethod
+    def _signature(result):
+        """Returns what is shown of the results, but for the counts: the
+        top articles and authors in order, and the days above the
+        threshold."""
+        return (tuple(title for title, _ in result.articles),
+                tuple(name for name, _ in result.authors),
+                frozenset(date for date, _, _ in result.errors))
@@ -1,23 +1,110 @@
 """Module for reporting statistics on the news articles as text output."""
 
+import contextlib
+import itertools
+
 import psycopg2
+import psycopg2.extensions
 import logs_analysis.db_report as db_report
+import logs_analysis.report_cache as report_cache
+import logs_analysis.report_writer as report_writer
+import logs_analysis.visitors_report as visitors_report
 
 
 class NewsTextReport:
-    """Text reporter for news articles."""
+    """Text reporter for news articles.
+
+    The reports are written as text by default, or in any of the formats of
+    report_writer.WRITERS, and each row is written as it is fetched. A
+    report whose query is cancelled by the server, as when it runs for
+    longer than its statement timeout, is written as timed out.
+    """
 
     _DB_ERR_MSG = "There was a problem querying the database: {}"
 
-    def __init__(self, dbname):
+    # the plural of each of db_report.DbReport.BUCKETS finer than a day
+    _BUCKET_NAMES = {"minute": "minutes", "5m": "5 minute spans",
+                     "hour": "hours"}
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, provider=None, cache=None, db_reporter=None,
+                 since=None, until=None, profiler=None,
+                 output_format="text", bucket="day",
+                 statement_timeout=None, visitors=False):
         """Constructor.
 
         Keyword arguments:
         dbname -- the name of the database to report on.
                   Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every report.
+        cache -- the report_cache.ReportCache in which to cache report
+                 results. Optional. Defaults to None, which means results
+                 are not cached.
+        db_reporter -- the object, with the interface of
+                       db_report.DbReport, from which to take report results,
+                       such as a log_file_report.LogFileReport. Optional.
+                       Defaults to None, which means a DbReport on the
+                       database, and if given then provider, cache, since
+                       and until are ignored, and it should have been
+                       created with the same bucket.
+        since, until -- the time window of the log to report on, as for
+                        db_report.DbReport. Optional. Default to None, which
+                        means all of the log.
+        profiler -- the query_profiler.QueryProfiler in which to record the
+                    time spent rendering each report, and which is given to
+                    the DbReport, if one is created here. Optional.
+                    Defaults to None, which means no profiling.
+        output_format -- the name of the format, in report_writer.WRITERS,
+                         in which to write the reports. Optional. Defaults
+                         to "text".
+        bucket -- the name, in db_report.DbReport.BUCKETS, of the span of
+                  time over which the errors report counts requests, which
+                  is also shown in its heading and, when finer than a day,
+                  by the time of each row in the text format. Optional.
+                  Defaults to "day".
+        statement_timeout -- the seconds for which the query of each report
+                             may run, as for db_report.DbReport, after which
+                             the report is written as timed out. Optional.
+                             Defaults to None, which means the server's own
+                             statement_timeout. Ignored if db_reporter is
+                             given.
+        visitors -- whether to report the estimated unique visitors of the
+                    articles and authors, from a
+                    visitors_report.VisitorsDbReport, which is created here
+                    unless given as db_reporter. Optional. Defaults to
+                    False. If True, cache is ignored.
+
+        Throws:
+        ValueError -- when the output format or bucket is unknown.
         """
+        if output_format not in report_writer.WRITERS:
+            raise ValueError("unknown output format: '{}'".format(
+                output_format))
+        if bucket not in db_report.DbReport.BUCKETS:
+            raise ValueError("unknown bucket: '{}'".format(bucket))
         self._dbname = dbname  # stored for diagnostic purposes
-        self._db_reporter = db_report.DbReport(self._dbname)
+        if db_reporter is not None:
+            self._db_reporter = db_reporter
+        elif visitors:
+            self._db_reporter = visitors_report.VisitorsDbReport(
+                self._dbname, provider, since=since, until=until,
+                bucket=bucket, statement_timeout=statement_timeout)
+        elif cache is None:
+            self._db_reporter = db_report.DbReport(
+                self._dbname, provider, since=since, until=until,
+                bucket=bucket, statement_timeout=statement_timeout)
+        else:
+            self._db_reporter = report_cache.CachedDbReport(
+                self._dbname, cache, provider, since=since, until=until,
+                bucket=bucket, statement_timeout=statement_timeout)
+        if db_reporter is None:
+            self._db_reporter.profiler = profiler
+        self._profiler = profiler
+        self._writer_class = report_writer.WRITERS[output_format]
+        self._bucket = bucket
+        self._visitors = visitors
 
     def report_most_popular_articles(self, out, limit=None):
         """Outputs list of most popular articles.
@@ -27,15 +114,13 @@ class NewsTextReport:
         limit -- the maximum number of articles to output. Optional. Defaults
                  to None, which means unlimited.
         """
+        writer = self._writer(out)
         try:
-            articles = self._db_reporter.get_most_popular_articles(limit)
-            msg = ""
-            for article in articles:
-                views_str = format(article[1], ",d")
-                msg += "'{}' - {} views\n".format(article[0], views_str)
-            if not msg:
-                msg = "None"
-            print(msg, file=out)
+            articles = self._db_reporter.iter_most_popular_articles(limit)
+            with self._render("articles"):
+                self._write_report(writer, "articles", articles)
+        except psycopg2.extensions.QueryCanceledError:
+            writer.timed_out("articles")
         except psycopg2.Error as exp:
             print(NewsTextReport._DB_ERR_MSG.format(exp))
 
@@ -47,15 +132,13 @@ class NewsTextReport:
         limit -- the maximum number of authors to output. Optional. Defaults
                  to None, which means unlimited.
         """
+        writer = self._writer(out)
         try:
-            authors = self._db_reporter.get_most_popular_authors(limit)
-            msg = ""
-            for author in authors:
-                views_str = format(author[1], ",d")
-                msg += "'{}' - {} views\n".format(author[0], views_str)
-            if not msg:
-                msg = "None"
-            print(msg, file=out)
+            authors = self._db_reporter.iter_most_popular_authors(limit)
+            with self._render("authors"):
+                self._write_report(writer, "authors", authors)
+        except psycopg2.extensions.QueryCanceledError:
+            writer.timed_out("authors")
         except psycopg2.Error as exp:
             print(NewsTextReport._DB_ERR_MSG.format(exp))
 
@@ -69,18 +152,100 @@ class NewsTextReport:
         pct_errors -- the percentage of errors that is our lower bound
                       (exclusive). Required.
         """
+        writer = self._writer(out)
         try:
-            days = self._db_reporter.get_dates_wth_more_pct_errors(pct_errors)
-            msg = ""
-            for day in days:
-                date_str = day[0].strftime("%a %d %B %Y")
-                pct_str = format(day[1], ".2f")
-                total_str = format(day[2], ",d")
-                msg += "{} - {}% errors out of {} requests\n".format(date_str,
-                                                                     pct_str,
-                                                                     total_str)
-            if not msg:
-                msg = "None"
-            print(msg, file=out)
+            days = self._db_reporter.iter_dates_wth_more_pct_errors(
+                pct_errors)
+            with self._render("errors"):
+                self._write_report(writer, "errors", days)
+        except psycopg2.extensions.QueryCanceledError:
+            writer.timed_out("errors")
         except psycopg2.Error as exp:
             print(NewsTextReport._DB_ERR_MSG.format(exp))
+
+    def report_all(self, out, articles_limit=None, authors_limit=None,
+                   pct_errors=1.0):
+        """Outputs the articles, authors and errors reports, each with a
+        heading in the text format, all taken from a single snapshot of the
+        database. Rows are output as they are fetched from the database.
+
+        Keyword arguments:
+        out -- the stream to which to output. Required.
+        articles_limit -- the maximum number of articles to output.
+                          Optional. Defaults to None, which means unlimited.
+        authors_limit -- the maximum number of authors to output. Optional.
+                         Defaults to None, which means unlimited.
+        pct_errors -- the percentage of errors that is our lower bound
+                      (exclusive). Optional. Defaults to 1.0.
+        """
+        sections = [
+            ("articles", self.articles_heading(articles_limit)),
+            ("authors", self.authors_heading(authors_limit)),
+            ("errors", self.errors_heading(pct_errors, self._bucket))]
+        writer = self._writer(out)
+        written = 0
+        try:
+            rows = self._db_reporter.iter_all(articles_limit, authors_limit,
+                                              pct_errors)
+            # the rows of each report are contiguous and in section order,
+            # but reports with no rows are absent from the stream
+            groups = itertools.groupby(rows, key=lambda item: item[0])
+            group = next(groups, None)
+            for name, heading in sections:
+                with self._render(name):
+                    if group is not None and group[0] == name:
+                        self._write_report(writer, name,
+                                           (row for _, row in group[1]),
+                                           heading)
+                        group = next(groups, None)
+                    else:
+                        self._write_report(writer, name, [], heading)
+                written += 1
+        except psycopg2.extensions.QueryCanceledError:
+            # the reports are run together, so those not yet written, and
+            # any cut short, all timed out
+            for name, heading in sections[written:]:
+                writer.timed_out(name, heading)
+        except psycopg2.Error as exp:
+            print(NewsTextReport._DB_ERR_MSG.format(exp))
+
+    def _writer(self, out):
+        return self._writer_class(out, self._bucket, self._visitors)
+
+    def _render(self, report):
+        if self._profiler is None:
+            return contextlib.nullcontext()
+        return self._profiler.phase(report, "render")
+
+    @staticmethod
+    def articles_heading(limit=None):
+        """Returns the heading of the articles report."""
+        if limit is None:
+            return "The most popular articles are:"
+        return "The most popular {} articles are:".format(limit)
+
+    @staticmethod
+    def authors_heading(limit=None):
+        """Returns the heading of the authors report."""
+        if limit is None:
+            return "The most popular authors are:"
+        return "The most popular {} authors are:".format(limit)
+
+    @staticmethod
+    def errors_heading(pct_errors, bucket="day"):
+        """Returns the heading of the errors report, on buckets of the named
+        span of time."""
+        if bucket == "day":
+            return ("The days on which more than {}% of requests led to "
+                    "errors:".format(pct_errors))
+        return ("The {} in which more than {}% of requests led to errors:"
+                .format(NewsTextReport._BUCKET_NAMES[bucket], pct_errors))
+
+    @staticmethod
+    def _write_report(writer, report, rows, heading=None):
+        """Writes the named report's rows with the writer, as they are
+        generated."""
+        writer.begin(report, heading)
+        for row in rows:
+            writer.row(report, row)
+        writer.end(report)
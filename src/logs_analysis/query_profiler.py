@@ -0,0 +1,180 @@
+"""Module that records where the time taken by reports goes."""
+
+import collections
+import contextlib
+import json
+import threading
+import time
+
+# The profile of one report. phases maps each phase in PHASES to the
+# seconds spent in it, rows and bytes are the number of rows fetched and
+# the approximate bytes of their values in text form, statements is the
+# number of SQL statements run, and plans is a list of the EXPLAIN (FORMAT
+# JSON) output of each statement, when captured.
+ReportProfile = collections.namedtuple(
+    "ReportProfile",
+    ["report", "phases", "rows", "bytes", "statements", "plans"])
+
+
+class QueryProfiler:
+    """Records the time reports spend in each phase of their work.
+
+    The phases are:
+    * connect -- obtaining a connection from the connection provider.
+    * plan -- planning the SQL statements, as reported by the server.
+    * execute -- running the statements, including sending any rows of
+      client side cursors over the network. This includes planning them,
+      so plan is the part of execute spent planning, and is not added to
+      the total.
+    * fetch -- fetching and converting the rows into python objects. The
+      streaming methods read from server side cursors, which run as their
+      rows are fetched, so most of their execution is counted here.
+    * render -- formatting the rows as text, in news_text_report.
+    Phases may be nested, such as fetching rows while rendering them, and
+    the time of a phase excludes that of the phases nested in it, so the
+    phases of a report, but for plan, add up to the time taken by it.
+
+    The planning time is taken by running each statement's EXPLAIN first,
+    which costs one more round trip per statement. With explain, that is
+    EXPLAIN (ANALYZE, BUFFERS), which also runs the statement, so doubles
+    its cost, and the plans, with their actual times and buffer counts, are
+    kept.
+
+    A profiler may be used by any number of threads at once.
+    """
+
+    PHASES = ("connect", "plan", "execute", "fetch", "render")
+
+    _PLAN_SQL = "explain (summary, format json) "
+
+    _ANALYZE_SQL = "explain (analyze, buffers, format json) "
+
+    def __init__(self, explain=False):
+        """Constructor.
+
+        Keyword arguments:
+        explain -- whether to capture the EXPLAIN (ANALYZE, BUFFERS) output
+                   of each statement. Optional. Defaults to False.
+        """
+        self._explain = explain
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._profiles = collections.OrderedDict()
+
+    @property
+    def explain(self):
+        """Whether the EXPLAIN (ANALYZE, BUFFERS) output is captured."""
+        return self._explain
+
+    @property
+    def explain_sql(self):
+        """The prefix of the EXPLAIN statement to run before each
+        statement."""
+        if self._explain:
+            return QueryProfiler._ANALYZE_SQL
+        return QueryProfiler._PLAN_SQL
+
+    @contextlib.contextmanager
+    def phase(self, report, phase):
+        """Returns a context manager timing the phase of the report that it
+        encloses.
+
+        Keyword arguments:
+        report -- the name of the report. Required.
+        phase -- one of PHASES. Required.
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        # the time of the phases nested in this one
+        nested = [0.0]
+        stack.append(nested)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1][0] += elapsed
+            with self._lock:
+                self._profile(report)["phases"][phase] += \
+                    elapsed - nested[0]
+
+    def add_rows(self, report, rows):
+        """Adds fetched rows to the counts of the report."""
+        size = sum(len(str(value)) for row in rows for value in row
+                   if value is not None)
+        with self._lock:
+            profile = self._profile(report)
+            profile["rows"] += len(rows)
+            profile["bytes"] += size
+
+    def add_plan(self, report, plan):
+        """Adds the EXPLAIN (FORMAT JSON) output of a statement of the
+        report, and its planning time to the plan phase."""
+        planning = plan[0]["Planning Time"] / 1000
+        with self._lock:
+            profile = self._profile(report)
+            profile["statements"] += 1
+            profile["phases"]["plan"] += planning
+            if self._explain:
+                profile["plans"].append(plan)
+
+    def profiles(self):
+        """Returns a list of ReportProfile, one per report, in the order in
+        which the reports started."""
+        with self._lock:
+            return [ReportProfile(report,
+                                  collections.OrderedDict(profile["phases"]),
+                                  profile["rows"], profile["bytes"],
+                                  profile["statements"],
+                                  list(profile["plans"]))
+                    for report, profile in self._profiles.items()]
+
+    def format_table(self):
+        """Returns the profiles as a text table, in milliseconds, followed
+        by a summary of each captured plan."""
+        header = ["report"] + list(QueryProfiler.PHASES) + \
+            ["total", "rows", "bytes"]
+        lines = [("{:<10}" + " {:>9}" * (len(header) - 1)).format(*header)]
+        for profile in self.profiles():
+            times = list(profile.phases.values())
+            lines.append(("{:<10}" + " {:>9.1f}" * (len(times) + 1) +
+                          " {:>9,d} {:>9,d}").format(
+                              profile.report,
+                              *[1000 * seconds for seconds in times],
+                              1000 * self._total(profile), profile.rows,
+                              profile.bytes))
+        for profile in self.profiles():
+            for plan in profile.plans:
+                root = plan[0]["Plan"]
+                lines.append(
+                    "{}: planning {:.1f} ms, execution {:.1f} ms, shared "
+                    "buffers {:,d} hit, {:,d} read".format(
+                        profile.report, plan[0]["Planning Time"],
+                        plan[0]["Execution Time"],
+                        root.get("Shared Hit Blocks", 0),
+                        root.get("Shared Read Blocks", 0)))
+        return "\n".join(lines)
+
+    def to_json(self):
+        """Returns the profiles as a JSON document, with times in seconds."""
+        return json.dumps(
+            {"reports": [dict(profile._asdict(),
+                              total=self._total(profile))
+                         for profile in self.profiles()]},
+            indent=2)
+
+    @staticmethod
+    def _total(profile):
+        return sum(seconds for phase, seconds in profile.phases.items()
+                   if phase != "plan")
+
+    def _profile(self, report):
+        if report not in self._profiles:
+            self._profiles[report] = {
+                "phases": collections.OrderedDict(
+                    (phase, 0.0) for phase in QueryProfiler.PHASES),
+                "rows": 0, "bytes": 0, "statements": 0, "plans": []}
+        return self._profiles[report]
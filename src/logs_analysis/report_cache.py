@@ -0,0 +1,311 @@
+"""Module providing a cache of report results in front of DbReport."""
+
+import collections
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+import logs_analysis.db_report as db_report
+
+# Counts of cache lookups: those answered from memory, those answered from
+# disk, and those that missed, including those whose entry was out of date.
+CacheStats = collections.namedtuple("CacheStats",
+                                    ["memory_hits", "disk_hits", "misses"])
+
+
+class ReportCache:
+    """Two tier cache of report results.
+
+    The first tier is an in-process least recently used cache. The optional
+    second tier is a sqlite database on disk, which can be shared between
+    processes. Each entry is stored with a version, and is only returned
+    when looked up with the same version and before its time to live has
+    passed. Errors reading or writing the on disk tier are treated as
+    misses, as are entries on disk that cannot be unpickled, which are
+    removed, so the cache never stops a report from being run. This class is
+    thread safe.
+
+    Values are stored on disk using pickle, so the cache file must only be
+    writable by trusted users.
+    """
+
+    _CREATE_SQL = """
+    create table if not exists report_cache (
+      key text primary key,
+      version text not null,
+      expires real not null,
+      value blob not null)"""
+
+    _GET_SQL = """
+    select value, expires from report_cache
+      where key = ? and version = ? and expires > ?"""
+
+    _PUT_SQL = """
+    insert or replace into report_cache (key, version, expires, value)
+      values (?, ?, ?, ?)"""
+
+    _DELETE_SQL = "delete from report_cache where key = ?"
+
+    _PURGE_SQL = "delete from report_cache where expires <= ?"
+
+    _CLEAR_SQL = "delete from report_cache"
+
+    def __init__(self, path=None, max_entries=128, ttl=60.0):
+        """Constructor.
+
+        Keyword arguments:
+        path -- the file of the on disk tier, which is created if needed.
+                Optional. Defaults to None, which means no on disk tier.
+        max_entries -- the maximum number of entries held in memory.
+                       Optional. Defaults to 128.
+        ttl -- the number of seconds for which an entry is kept. Optional.
+               Defaults to 60.
+
+        Throws:
+        sqlite3.Error, OSError -- when the on disk tier cannot be opened.
+        """
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._memory = collections.OrderedDict()  # most recently used last
+        self._stats = CacheStats(0, 0, 0)
+        self._disk = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._disk = sqlite3.connect(path, timeout=5.0,
+                                         check_same_thread=False)
+            with self._disk:
+                self._disk.execute(ReportCache._CREATE_SQL)
+
+    @staticmethod
+    def default_path():
+        """Returns the default file for the on disk tier, in the user's cache
+        directory."""
+        cache_home = os.environ.get("XDG_CACHE_HOME") or \
+            os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "logs_analysis", "report_cache.db")
+
+    @property
+    def stats(self):
+        """The CacheStats of lookups made so far."""
+        with self._lock:
+            return self._stats
+
+    def get(self, key, version):
+        """Looks up an entry.
+
+        Returns a (found, value) tuple, where value is None if no entry was
+        found.
+
+        Keyword arguments:
+        key -- the key of the entry, a string. Required.
+        version -- the version that the entry must have, a string. Required.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] == version and entry[1] > now:
+                self._memory.move_to_end(key)
+                self._stats = self._stats._replace(
+                    memory_hits=self._stats.memory_hits + 1)
+                return True, entry[2]
+
+            if self._disk is not None:
+                try:
+                    row = self._disk.execute(ReportCache._GET_SQL,
+                                             (key, version, now)).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row is not None:
+                    try:
+                        value = pickle.loads(row[0])
+                    except (pickle.UnpicklingError, AttributeError, EOFError,
+                            ImportError, IndexError, TypeError, ValueError):
+                        # corrupt, or written by an incompatible version
+                        self._forget(key)
+                    else:
+                        self._remember(key, version, row[1], value)
+                        self._stats = self._stats._replace(
+                            disk_hits=self._stats.disk_hits + 1)
+                        return True, value
+
+            self._stats = self._stats._replace(
+                misses=self._stats.misses + 1)
+            return False, None
+
+    def put(self, key, version, value):
+        """Stores an entry, replacing any with the same key.
+
+        Keyword arguments:
+        key -- the key of the entry, a string. Required.
+        version -- the version of the entry, a string. Required.
+        value -- the value to store, which must be picklable. Required.
+        """
+        now = time.time()
+        expires = now + self._ttl
+        with self._lock:
+            self._remember(key, version, expires, value)
+            if self._disk is not None:
+                try:
+                    with self._disk:
+                        self._disk.execute(ReportCache._PURGE_SQL, (now,))
+                        self._disk.execute(
+                            ReportCache._PUT_SQL,
+                            (key, version, expires, pickle.dumps(value)))
+                except sqlite3.Error:
+                    pass  # the entry is still cached in memory
+
+    def clear(self):
+        """Removes all entries, from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute(ReportCache._CLEAR_SQL)
+
+    def close(self):
+        """Closes the on disk tier, if any."""
+        with self._lock:
+            if self._disk is not None:
+                self._disk.close()
+                self._disk = None
+
+    def _forget(self, key):
+        """Removes an entry from the on disk tier. Must hold the lock."""
+        try:
+            with self._disk:
+                self._disk.execute(ReportCache._DELETE_SQL, (key,))
+        except sqlite3.Error:
+            pass  # the entry is still read as a miss
+
+    def _remember(self, key, version, expires, value):
+        """Stores an entry in memory. Must hold the lock."""
+        self._memory[key] = (version, expires, value)
+        self._memory.move_to_end(key)
+        now = time.time()
+        for old_key in [old_key for old_key, entry in self._memory.items()
+                        if entry[1] <= now]:
+            del self._memory[old_key]
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CachedDbReport(db_report.DbReport):
+    """DbReport whose results are cached in a ReportCache.
+
+    Results are keyed by server (the host and port connected to),
+    database, report and parameters, and versioned by the state of the log
+    table: its storage (which changes when it is truncated), its highest
+    id, and its count of inserted less deleted rows from the cumulative
+    statistics. Checking the version takes one cheap query, which needs
+    log.id to be indexed, as it is by the primary key of the news database.
+
+    The version is a heuristic, suited to a log that is only appended to.
+    Appends and truncation are seen at once. Deletes that leave the highest
+    id alone are only seen once other sessions have flushed their
+    statistics, which the server does asynchronously, up to a second or so
+    after they commit. Updates of log rows, and changes to the articles and
+    authors tables, are not seen at all until cached results expire.
+
+    The streaming methods return iterators over the cached lists.
+    """
+
+    _LOG_VERSION_SQL = """
+    select pg_relation_filenode('log'),
+           (select max(id) from log),
+           (select n_tup_ins - n_tup_del from pg_stat_user_tables
+              where relid = 'log'::regclass)"""
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, cache, provider=None, use_rollups=None,
+                 since=None, until=None, bucket="day",
+                 statement_timeout=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        cache -- the ReportCache in which to cache results. Required.
+        provider, use_rollups, since, until, bucket, statement_timeout -- as
+        for db_report.DbReport.
+        """
+        super().__init__(dbname, provider, use_rollups, since, until,
+                         bucket=bucket, statement_timeout=statement_timeout)
+        self._cache = cache
+
+    @property
+    def cache(self):
+        """The ReportCache used by this instance."""
+        return self._cache
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors, but cached."""
+        return self._cached("authors", (top_n,),
+                            super().get_most_popular_authors)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles, but cached."""
+        return self._cached("articles", (top_n,),
+                            super().get_most_popular_articles)
+
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors, but
+        cached."""
+        return self._cached(
+            "errors", (pct_errors,),
+            lambda pct_errors: super(CachedDbReport, self)
+            .get_dates_wth_more_pct_errors(pct_errors, parallelism))
+
+    def run_all(self, articles_top_n=None, authors_top_n=None,
+                pct_errors=1.0):
+        """As db_report.DbReport.run_all, but cached."""
+        return self._cached("all",
+                            (articles_top_n, authors_top_n, pct_errors),
+                            super().run_all)
+
+    # pylint: disable-msg=W0613
+    def iter_most_popular_authors(self, top_n=None, itersize=None):
+        """As db_report.DbReport.iter_most_popular_authors, but cached."""
+        return iter(self.get_most_popular_authors(top_n))
+
+    def iter_most_popular_articles(self, top_n=None, itersize=None):
+        """As db_report.DbReport.iter_most_popular_articles, but cached."""
+        return iter(self.get_most_popular_articles(top_n))
+
+    def iter_dates_wth_more_pct_errors(self, pct_errors, itersize=None):
+        """As db_report.DbReport.iter_dates_wth_more_pct_errors, but
+        cached."""
+        return iter(self.get_dates_wth_more_pct_errors(pct_errors))
+
+    def iter_all(self, articles_top_n=None, authors_top_n=None,
+                 pct_errors=1.0, itersize=None):
+        """As db_report.DbReport.iter_all, but cached."""
+        result = self.run_all(articles_top_n, authors_top_n, pct_errors)
+        return ((name, row) for name, rows in zip(result._fields, result)
+                for row in rows)
+
+    def _cached(self, report, args, compute):
+        with self._connection("cache") as news_db:
+            # a database of the same name on another server is another
+            # database
+            server = (news_db.info.host, news_db.info.port)
+            with news_db.cursor() as cursor:
+                version = repr(self._execute(
+                    cursor, CachedDbReport._LOG_VERSION_SQL, None, "cache",
+                    self._begin(cursor, False))[0])
+        key = repr((server, self._dbname, report, args, self._since,
+                    self._until, self._bucket))
+        found, value = self._cache.get(key, version)
+        if not found:
+            value = compute(*args)
+            self._cache.put(key, version, value)
+        return value
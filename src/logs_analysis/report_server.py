@@ -0,0 +1,353 @@
+"""Module that serves the reports as JSON over HTTP from a long running
+process."""
+
+import collections
+import datetime as dt
+import http.server
+import json
+import math
+import re
+import threading
+import time
+import urllib.parse
+
+import psycopg2
+
+import logs_analysis.article_ids as article_ids
+import logs_analysis.db_report as db_report
+import logs_analysis.rollup as rollup
+
+# The parameters of a report request, as given in its query string. since,
+# until and last are kept as given, so that a window relative to now is
+# moved along each time the results are refreshed.
+ReportParams = collections.namedtuple(
+    "ReportParams", ["articles", "authors", "errors", "since", "until",
+                     "last", "bucket"])
+
+DEFAULT_PARAMS = ReportParams(articles=3, authors=None, errors=1.0,
+                              since=None, until=None, last=None,
+                              bucket="day")
+
+
+class ReportServer:
+    """Serves the reports as JSON over HTTP, from results held in memory.
+
+    GET /reports runs all three reports, as by db_report.DbReport.run_all,
+    with the query parameters articles, authors, errors, since, until, last
+    and bucket, which are as for the command line flags of the same names,
+    such as /reports?articles=5&last=1d&bucket=hour. The results of each
+    distinct set of parameters are kept, up to max_results of them, least
+    recently used first out, so only the first request for them waits for
+    the database.
+    The results for the default parameters are computed on start.
+
+    A background thread refreshes all the results held every
+    refresh_interval seconds, and as soon as the log has grown (or been
+    truncated), which it checks every poll_interval seconds with one cheap
+    query. Requests are answered from the results held while they are
+    refreshed.
+
+    GET /stats returns the counts of requests, results computed and
+    refreshes, and the 50th and 99th percentile latencies of the last
+    latency_window requests for reports, in milliseconds.
+
+    The connection provider should be a
+    connection_provider.PooledConnectionProvider, as requests are served
+    by a thread each.
+    """
+
+    # the log's storage, which changes when it is truncated, and its
+    # highest id, which is cheap to find as log.id is indexed
+    _LOG_VERSION_SQL = """
+    select pg_relation_filenode('log'), (select max(id) from log)"""
+
+    _DURATION_RE = re.compile(r"^(\d+)([smhdw])$")
+
+    _DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours",
+                       "d": "days", "w": "weeks"}
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbname, provider, host="127.0.0.1", port=8080,
+                 refresh_interval=300.0, poll_interval=5.0, max_results=64,
+                 latency_window=1000):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to report on. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Required.
+        host -- the address on which to listen. Optional. Defaults to
+                127.0.0.1, so only local clients can connect.
+        port -- the port on which to listen, or 0 for any free port.
+                Optional. Defaults to 8080.
+        refresh_interval -- seconds between refreshes of the results when
+                            the log does not change. Optional. Defaults to
+                            300.
+        poll_interval -- seconds between checks of whether the log has
+                         changed. Optional. Defaults to 5.
+        max_results -- the number of sets of results to keep. Optional.
+                       Defaults to 64.
+        latency_window -- the number of latest requests whose latencies
+                          are reported. Optional. Defaults to 1000.
+
+        Throws:
+        OSError -- when the address cannot be listened on.
+        """
+        self._dbname = dbname
+        self._provider = provider
+        self._refresh_interval = refresh_interval
+        self._poll_interval = poll_interval
+        self._max_results = max_results
+        self._lock = threading.Lock()
+        self._results = collections.OrderedDict()  # params: (result, time)
+        self._log_version = None
+        self._last_refresh = None
+        self._latencies = collections.deque(maxlen=latency_window)
+        self._counts = collections.Counter()
+        self._stopping = threading.Event()
+        self._refresher = threading.Thread(target=self._refresh_loop,
+                                           daemon=True)
+        self._httpd = http.server.ThreadingHTTPServer((host, port),
+                                                      _RequestHandler)
+        self._httpd.report_server = self
+
+    @property
+    def server_address(self):
+        """The (host, port) on which the server listens."""
+        return self._httpd.server_address
+
+    def serve_forever(self):
+        """Computes the default results, then serves requests until
+        shutdown is called.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database on start.
+        """
+        self._log_version = self._query_log_version()
+        self._compute(DEFAULT_PARAMS)
+        self._last_refresh = time.monotonic()
+        self._refresher.start()
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def shutdown(self):
+        """Stops serving requests and refreshing results, from another
+        thread."""
+        self._stopping.set()
+        self._httpd.shutdown()
+
+    def report(self, params):
+        """Returns the reports for the ReportParams as a dict for JSON, from
+        the results held if there are any.
+
+        Throws:
+        ValueError -- when a parameter is invalid.
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._lock:
+            held = self._results.get(params)
+            if held is None:
+                self._counts["misses"] += 1
+            else:
+                self._results.move_to_end(params)
+                self._counts["hits"] += 1
+        if held is None:
+            held = self._compute(params)
+        result, computed = held
+        return {"articles": [{"title": title, "views": views}
+                             for title, views in result.articles],
+                "authors": [{"name": name, "views": views}
+                            for name, views in result.authors],
+                "errors": [{"date": ReportServer._isoformat(date),
+                            "pct_errors": pct_errors, "requests": requests}
+                           for date, pct_errors, requests in result.errors],
+                "computed_at": computed.isoformat()}
+
+    def refresh(self):
+        """Recomputes all the results held.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._lock:
+            params = list(self._results)
+        use_rollups = rollup.Rollup(self._dbname,
+                                    self._provider).is_installed()
+        use_article_ids = article_ids.ArticleIds(self._dbname,
+                                                 self._provider).is_ready()
+        for each in params:
+            self._compute(each, use_rollups, use_article_ids)
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            self._counts["refreshes"] += 1
+
+    def poll(self):
+        """Refreshes the results if the log has changed, or they are older
+        than the refresh interval.
+
+        Returns True if they were refreshed.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        version = self._query_log_version()
+        if version == self._log_version and \
+                self._last_refresh is not None and \
+                time.monotonic() - self._last_refresh < \
+                self._refresh_interval:
+            return False
+        self._log_version = version
+        self.refresh()
+        return True
+
+    def stats(self):
+        """Returns the server's statistics as a dict for JSON."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            stats = {name: self._counts[name] for name in
+                     ("requests", "hits", "misses", "refreshes")}
+            stats["results"] = len(self._results)
+        stats["p50_ms"] = self._percentile(latencies, 50)
+        stats["p99_ms"] = self._percentile(latencies, 99)
+        return stats
+
+    @staticmethod
+    def parse_params(query):
+        """Returns the ReportParams of a URL query string, with defaults as
+        for the command line.
+
+        Throws:
+        ValueError -- when a parameter is unknown or invalid, or both since
+        and last are given.
+        """
+        values = urllib.parse.parse_qs(query, keep_blank_values=True,
+                                       strict_parsing=bool(query))
+        unknown = set(values) - set(ReportParams._fields)
+        if unknown:
+            raise ValueError("unknown parameters: {}".format(
+                ", ".join(sorted(unknown))))
+        given = {name: value[-1] for name, value in values.items()}
+        params = DEFAULT_PARAMS._replace(**{
+            name: value or None for name, value in given.items()})
+        if params.since is not None and params.last is not None:
+            raise ValueError("since and last cannot both be given")
+        if params.bucket not in db_report.DbReport.BUCKETS:
+            raise ValueError("unknown bucket: '{}'".format(params.bucket))
+        # check the values now, rather than each time they are used
+        ReportServer._window(params)
+        return params._replace(
+            articles=None if params.articles is None
+            else int(params.articles),
+            authors=None if params.authors is None else int(params.authors),
+            errors=float(params.errors))
+
+    def _compute(self, params, use_rollups=None, use_article_ids=None):
+        since, until = self._window(params)
+        report = db_report.DbReport(self._dbname, self._provider,
+                                    use_rollups, since, until,
+                                    use_article_ids, params.bucket)
+        held = (report.run_all(params.articles, params.authors,
+                               params.errors),
+                dt.datetime.now(dt.timezone.utc))
+        with self._lock:
+            self._results[params] = held
+            self._results.move_to_end(params)
+            while len(self._results) > self._max_results:
+                self._results.popitem(last=False)
+        return held
+
+    def _query_log_version(self):
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(ReportServer._LOG_VERSION_SQL)
+                return cursor.fetchone()
+
+    def _refresh_loop(self):
+        while not self._stopping.wait(self._poll_interval):
+            try:
+                self.poll()
+            except psycopg2.Error:
+                pass  # keep serving the results held, and try again
+
+    def record_latency(self, seconds):
+        """Records the time taken to answer a request for reports."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self._counts["requests"] += 1
+
+    @staticmethod
+    def _window(params):
+        """Returns the (since, until) datetimes of the ReportParams."""
+        since = None if params.since is None \
+            else dt.datetime.fromisoformat(params.since)
+        until = None if params.until is None \
+            else dt.datetime.fromisoformat(params.until)
+        if params.last is not None:
+            match = ReportServer._DURATION_RE.match(params.last)
+            if match is None:
+                raise ValueError("invalid duration: '{}'".format(
+                    params.last))
+            since = dt.datetime.now(dt.timezone.utc) - dt.timedelta(**{
+                ReportServer._DURATION_UNITS[match.group(2)]:
+                    int(match.group(1))})
+        return since, until
+
+    @staticmethod
+    def _isoformat(date):
+        """Returns the date in ISO 8601 format, or None if it is None, as
+        for the entries of the log with no time."""
+        return None if date is None else date.isoformat()
+
+    @staticmethod
+    def _percentile(ordered, pct):
+        """Returns the nearest rank percentile of the sorted latencies, in
+        milliseconds, or None if there are none."""
+        if not ordered:
+            return None
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return 1000 * ordered[rank - 1]
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    """Handles a request to a ReportServer."""
+
+    # pylint: disable-msg=C0103
+    def do_GET(self):
+        """Serves /reports and /stats."""
+        start = time.perf_counter()
+        report_server = self.server.report_server
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/stats":
+            self._send(200, report_server.stats())
+            return
+        if url.path != "/reports":
+            self._send(404, {"error": "not found: {}".format(url.path)})
+            return
+        try:
+            body = report_server.report(report_server.parse_params(url.query))
+        except ValueError as exp:
+            self._send(400, {"error": str(exp)})
+            return
+        except psycopg2.Error as exp:
+            self._send(503, {"error": str(exp)})
+            return
+        self._send(200, body)
+        report_server.record_latency(time.perf_counter() - start)
+
+    # pylint: disable-msg=W0622
+    def log_message(self, format, *args):
+        pass  # a dashboard's polling would flood the terminal
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
@@ -0,0 +1,193 @@
+"""Module defining the formats in which the reports are written."""
+
+import csv
+import json
+
+
+class ReportWriter:
+    """Writes the rows of one or more reports to a stream, each as it is
+    given, so the output does not build up in memory.
+
+    A report is written by a call to begin, one to row for each of its rows,
+    then one to end. The rows are as for db_report.DbReport: (name, views)
+    for the "articles" and "authors" reports, and (date, percentage of
+    errors, requests) for the "errors" report, the estimated rows of
+    approx_report.ApproxDbReport, or, when the writer is created with
+    visitors, the (name, views, visitors) rows of
+    visitors_report.VisitorsDbReport. The stream is flushed after the first row
+    of each report, so output starts as soon as the report does, and at the
+    end of each report, leaving the stream's own buffering in between.
+
+    A report whose query timed out, before or after some of its rows were
+    written, is ended by a call to timed_out instead of end.
+    """
+
+    def __init__(self, out, bucket="day", visitors=False):
+        """Constructor.
+
+        Keyword arguments:
+        out -- the stream to which to write. Required.
+        bucket -- the name of the span of time of the dates of the "errors"
+                  report, as for db_report.DbReport. Optional. Defaults to
+                  "day".
+        visitors -- whether the third item of the rows of the "articles"
+                    and "authors" reports is their estimated visitors
+                    rather than the margin of their views. Optional.
+                    Defaults to False.
+        """
+        self._out = out
+        self._bucket = bucket
+        self._visitors = visitors
+        self._rows = 0
+        self._report = None
+
+    # pylint: disable-msg=W0613
+    def begin(self, report, heading=None):
+        """Starts the named report, with the heading, if any, shown by the
+        formats that show headings."""
+        self._rows = 0
+        self._report = report
+
+    def row(self, report, row):
+        """Writes a row of the named report."""
+        self._write_row(report, row)
+        self._rows += 1
+        if self._rows == 1:
+            self._out.flush()
+
+    def end(self, report):
+        """Ends the named report."""
+        self._report = None
+        self._out.flush()
+
+    def timed_out(self, report, heading=None):
+        """Ends the named report as having timed out, starting it first,
+        with the heading, if it has not been started."""
+        if self._report != report:
+            self.begin(report, heading)
+        self._write_timed_out(report)
+        self._report = None
+        self._out.flush()
+
+    def _write_row(self, report, row):
+        raise NotImplementedError
+
+    def _write_timed_out(self, report):
+        raise NotImplementedError
+
+
+class TextWriter(ReportWriter):
+    """Writes each report as lines of text, after its heading, followed by a
+    blank line, or "None" if it has no rows, and "Timed out" if it timed
+    out. The dates of the "errors" report are shown with their time when
+    the bucket is finer than a day."""
+
+    def begin(self, report, heading=None):
+        super().begin(report, heading)
+        if heading is not None:
+            self._out.write(heading + "\n")
+
+    def end(self, report):
+        self._out.write("\n" if self._rows else "None\n")
+        super().end(report)
+
+    def _write_timed_out(self, report):
+        self._out.write("Timed out\n\n" if self._rows else "Timed out\n")
+
+    def _write_row(self, report, row):
+        if report == "errors":
+            line = self._errors_line(row, self._bucket != "day")
+        else:
+            line = self._views_line(row, self._visitors)
+        self._out.write(line + "\n")
+
+    @staticmethod
+    def _views_line(row, visitors=False):
+        """Formats a (name, views) row, as for articles and authors, an
+        estimated (name, views, margin) row, or, if visitors, a (name,
+        views, visitors) row."""
+        if len(row) == 2:
+            return "'{}' - {} views".format(row[0], format(row[1], ",d"))
+        if visitors:
+            return "'{}' - {} views by about {} visitors".format(
+                row[0], format(row[1], ",d"), format(row[2], ",d"))
+        return "'{}' - {} \u00b1 {} views".format(
+            row[0], format(row[1], ",d"), format(row[2], ",d"))
+
+    @staticmethod
+    def _errors_line(day, with_time=False):
+        """Formats a (date, error percentage, total requests) row, or an
+        estimated (date, error percentage, total requests, lower bound,
+        upper bound, uncertain) row, with the time of the date if
+        with_time."""
+        date = day[0].strftime("%a %d %B %Y %H:%M" if with_time
+                               else "%a %d %B %Y")
+        if len(day) == 3:
+            return "{} - {}% errors out of {} requests".format(
+                date, format(day[1], ".2f"), format(day[2], ",d"))
+        return ("{} - {}% ({}% to {}%) errors out of about {} requests{}"
+                .format(date,
+                        format(day[1], ".2f"), format(day[3], ".2f"),
+                        format(day[4], ".2f"), format(day[2], ",d"),
+                        " (uncertain)" if day[5] else ""))
+
+
+class CsvWriter(ReportWriter):
+    """Writes the reports as CSV, one row per report row under a single
+    header row, with the report's name in the first column and empty cells
+    for the columns that do not apply to it. A report that timed out ends
+    with a row with only its name and timed_out set."""
+
+    COLUMNS = ["report", "name", "views", "margin", "visitors", "date",
+               "pct_errors", "requests", "pct_errors_low", "pct_errors_high",
+               "uncertain", "timed_out"]
+
+    def __init__(self, out, bucket="day", visitors=False):
+        super().__init__(out, bucket, visitors)
+        self._writer = csv.writer(out)
+        self._writer.writerow(CsvWriter.COLUMNS)
+
+    def _write_row(self, report, row):
+        self._write_fields(report, _fields(report, row, self._visitors))
+
+    def _write_timed_out(self, report):
+        self._write_fields(report, {"timed_out": True})
+
+    def _write_fields(self, report, fields):
+        self._writer.writerow([report] + [
+            fields.get(column, "") for column in CsvWriter.COLUMNS[1:]])
+
+
+class JsonLinesWriter(ReportWriter):
+    """Writes each report row as a JSON object on a line of its own, with
+    the report's name under "report", and fields named as by
+    report_server.ReportServer. A report that timed out ends with an object
+    with only its name and "timed_out": true."""
+
+    def _write_row(self, report, row):
+        fields = _fields(report, row, self._visitors)
+        if report == "articles":
+            fields = dict(title=fields.pop("name"), **fields)
+        self._out.write(json.dumps(dict(report=report, **fields)) + "\n")
+
+    def _write_timed_out(self, report):
+        self._out.write(json.dumps({"report": report, "timed_out": True})
+                        + "\n")
+
+
+# writers by the name of their format
+WRITERS = {"text": TextWriter, "csv": CsvWriter, "jsonl": JsonLinesWriter}
+
+
+def _fields(report, row, visitors=False):
+    """Returns the fields of a report row by name, with dates as ISO 8601
+    strings, and the third item of an articles or authors row as their
+    visitors if visitors."""
+    if report != "errors":
+        return dict(zip(["name", "views",
+                         "visitors" if visitors else "margin"], row))
+    fields = dict(zip(["date", "pct_errors", "requests", "pct_errors_low",
+                       "pct_errors_high", "uncertain"], row))
+    if fields["date"] is not None:
+        fields["date"] = fields["date"].isoformat()
+    return fields
@@ -0,0 +1,150 @@
+"""Module that maintains the optional daily and per minute rollups of the
+log table."""
+
+import collections
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.hyperloglog as hyperloglog
+
+# Outcome of a refresh: the high water marks of log.id before and after the
+# refresh, and the number of log entries that were rolled up.
+RefreshResult = collections.namedtuple(
+    "RefreshResult", ["old_high_water", "new_high_water", "entries"])
+
+
+class Rollup:
+    """Refreshes the rollup tables created by init/createRollups.sql.
+
+    Refreshes are incremental: only log entries with an id above the high
+    water mark recorded by the previous refresh are rolled up. Log entries
+    are assumed to be inserted with increasing ids; an entry committed with
+    a lower id than one already rolled up is not picked up.
+    """
+
+    # pylint: disable-msg=R0903
+
+    _INSTALLED_SQL = "select to_regclass('rollup_state') is not null"
+
+    _LOCK_STATE_SQL = "select high_water from rollup_state for update"
+
+    _MAX_LOG_ID_SQL = "select max(id) from log"
+
+    _ROLLUP_ARTICLES_SQL = """
+    insert into article_hits_daily (date, slug, hits)
+      select coalesce(date_trunc('day', time), '-infinity'),
+             substr(path, char_length('/article/') + 1), count(*)
+        from log
+        where id > %(low)s and id <= %(high)s
+          and path like '/article/%%' and status = '200 OK'
+        group by 1, 2
+      on conflict (date, slug)
+        do update set hits = article_hits_daily.hits + excluded.hits"""
+
+    # the requests are rolled up per minute, and the minutes summed into
+    # days, so that the two rollups always agree
+    _ROLLUP_STATUS_SQL = """
+    with rolled as (
+      select coalesce(date_trunc('minute', time), '-infinity') as minute,
+             count(*) as count_all,
+             count(case when status != '200 OK' then 1 else NULL end)
+               as count_nok
+        from log
+        where id > %(low)s and id <= %(high)s
+        group by 1),
+    merged_minutely as (
+      insert into request_status_minutely (minute, count_all, count_nok)
+        select minute, count_all, count_nok from rolled
+        on conflict (minute)
+          do update set count_all = request_status_minutely.count_all
+                                    + excluded.count_all,
+                        count_nok = request_status_minutely.count_nok
+                                    + excluded.count_nok),
+    merged as (
+      insert into request_status_daily (date, count_all, count_nok)
+        select date_trunc('day', minute), sum(count_all), sum(count_nok)
+          from rolled
+          group by 1
+        on conflict (date)
+          do update set count_all = request_status_daily.count_all
+                                    + excluded.count_all,
+                        count_nok = request_status_daily.count_nok
+                                    + excluded.count_nok)
+    select coalesce(sum(count_all), 0)::bigint from rolled"""
+
+    # the daily sketch of each article's visitors (see hyperloglog), merged
+    # into by keeping the highest rank of each register
+    _ROLLUP_VISITORS_SQL = """
+    insert into article_visitors_daily (date, slug, register, rank)
+      select date, slug, {register}, max({rank})
+        from (select coalesce(date_trunc('day', time), '-infinity') as date,
+                     substr(path, char_length('/article/') + 1) as slug,
+                     {hash} as hash
+                from log
+                where id > %(low)s and id <= %(high)s
+                  and path like '/article/%%' and status = '200 OK'
+                  and ip is not null) as hashes
+        group by 1, 2, 3
+      on conflict (date, slug, register)
+        do update set rank = greatest(article_visitors_daily.rank,
+                                      excluded.rank)""".format(
+        register=hyperloglog.REGISTER_SQL.format(hash="hash"),
+        rank=hyperloglog.RANK_SQL.format(hash="hash"),
+        hash=hyperloglog.HASH_SQL.format(ip="ip"))
+
+    _UPDATE_STATE_SQL = "update rollup_state set high_water = %(high)s"
+
+    def __init__(self, dbname, provider=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every call.
+        """
+        self._dbname = dbname
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+
+    def is_installed(self):
+        """Returns True if the rollup tables exist in the database.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(Rollup._INSTALLED_SQL)
+                return cursor.fetchone()[0]
+
+    def refresh(self):
+        """Rolls up log entries added since the last refresh.
+
+        The refresh runs in a single transaction, and concurrent refreshes
+        are serialised, so the rollups are always consistent with their high
+        water mark.
+
+        Returns a RefreshResult.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database, including when the rollup tables have not been created.
+        """
+        with self._provider.connection() as news_db:
+            with news_db.cursor() as cursor:
+                cursor.execute(Rollup._LOCK_STATE_SQL)
+                low = cursor.fetchone()[0]
+                cursor.execute(Rollup._MAX_LOG_ID_SQL)
+                high = cursor.fetchone()[0]
+                if high is None or high <= low:
+                    return RefreshResult(low, low, 0)
+
+                params = {"low": low, "high": high}
+                cursor.execute(Rollup._ROLLUP_ARTICLES_SQL, params)
+                cursor.execute(Rollup._ROLLUP_VISITORS_SQL, params)
+                cursor.execute(Rollup._ROLLUP_STATUS_SQL, params)
+                entries = cursor.fetchone()[0]
+                cursor.execute(Rollup._UPDATE_STATE_SQL, params)
+        return RefreshResult(low, high, entries)
@@ -0,0 +1,137 @@
+"""Module that installs the indexes supporting the report queries."""
+
+import collections
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+
+# Outcome of an optimisation: the names of the indexes and statistics that
+# were created, and ordered dictionaries of the estimated cost of each report
+# query, keyed by report name, from before and after they were installed.
+OptimizeResult = collections.namedtuple(
+    "OptimizeResult", ["created", "costs_before", "costs_after"])
+
+
+class SchemaOptimizer:
+    """Installs indexes and statistics that support the report queries.
+
+    These are:
+    * log_article_hits_idx -- a partial index of the successful accesses to
+      articles, on the slug derived from the path. Its predicate and
+      expression are exactly those of the accessed_articles view, so the
+      planner can use it, and its statistics, for the articles and authors
+      reports.
+    * articles_slug_idx -- an index on articles.slug for the join from the
+      derived slug to the article.
+    * log_time_idx -- an index on log.time, for the date range scans of the
+      errors report's parallel shards. As the log is written in time order,
+      a range of the index is a nearly sequential range of the table.
+    * log_day_stats -- statistics on the day of each log entry, as grouped
+      by the errors report's daily buckets, so that the planner knows how
+      few days there are and can plan the errors report's aggregation
+      accordingly. This needs PostgreSQL 14 or later and is skipped on older
+      servers. The day itself cannot be stored or indexed, as truncating a
+      timestamp with time zone to a day depends on the session's time zone
+      and so is not immutable.
+
+    Installation is idempotent. Indexes are built concurrently, so that
+    writes to the log are not blocked while they are built, and an index
+    left invalid by an interrupted build is rebuilt.
+    """
+
+    # pylint: disable-msg=R0903
+
+    _INDEXES = [
+        ("log_article_hits_idx", """
+         create index concurrently if not exists log_article_hits_idx
+           on log (substr(path, char_length('/article/') + 1))
+           where path like '/article/%' and status = '200 OK'"""),
+        ("articles_slug_idx", """
+         create index concurrently if not exists articles_slug_idx
+           on articles (slug)"""),
+        ("log_time_idx", """
+         create index concurrently if not exists log_time_idx
+           on log (time)""")]
+
+    _STATISTICS = [
+        ("log_day_stats", """
+         create statistics if not exists log_day_stats
+           on (date_trunc('day', time)) from log""")]
+
+    _MIN_STATISTICS_VERSION = 140000
+
+    # null if the index does not exist, otherwise whether it is valid
+    _INDEX_VALID_SQL = """
+    select (select indisvalid from pg_index
+              where indexrelid = to_regclass(%(name)s))"""
+
+    _DROP_INDEX_SQL = "drop index concurrently if exists {}"
+
+    _STATISTICS_EXIST_SQL = """
+    select exists (select 1 from pg_statistic_ext
+                     where stxname = %(name)s)"""
+
+    # indexed expressions and extended statistics only get their statistics
+    # when their table is analysed
+    _ANALYZE_SQL = "analyze log, articles"
+
+    def __init__(self, dbname, provider=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbname -- name of the psql database to connect to. Required.
+        provider -- the connection_provider.ConnectionProvider used to
+                    obtain connections to the database. Optional. Defaults
+                    to None, which means a new connection for every call.
+        """
+        self._dbname = dbname
+        if provider is None:
+            provider = connection_provider.DirectConnectionProvider(dbname)
+        self._provider = provider
+
+    def optimize(self, articles_top_n=None, authors_top_n=None,
+                 pct_errors=1.0):
+        """Installs the indexes and statistics, and estimates the report
+        costs before and after installing them.
+
+        Returns an OptimizeResult. The keyword arguments are as for
+        db_report.DbReport.run_all and are used for estimating costs.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        report = db_report.DbReport(self._dbname, self._provider)
+        costs_before = report.explain_costs(articles_top_n, authors_top_n,
+                                            pct_errors)
+        created = self._install()
+        costs_after = report.explain_costs(articles_top_n, authors_top_n,
+                                           pct_errors)
+        return OptimizeResult(created, costs_before, costs_after)
+
+    def _install(self):
+        created = []
+        # concurrent index builds cannot run inside a transaction
+        with self._provider.connection(autocommit=True) as news_db:
+            with news_db.cursor() as cursor:
+                for name, sql in SchemaOptimizer._INDEXES:
+                    cursor.execute(SchemaOptimizer._INDEX_VALID_SQL,
+                                   {"name": name})
+                    valid = cursor.fetchone()[0]
+                    if valid:
+                        continue
+                    if valid is not None:
+                        cursor.execute(
+                            SchemaOptimizer._DROP_INDEX_SQL.format(name))
+                    cursor.execute(sql)
+                    created.append(name)
+                if news_db.server_version >= \
+                        SchemaOptimizer._MIN_STATISTICS_VERSION:
+                    for name, sql in SchemaOptimizer._STATISTICS:
+                        cursor.execute(SchemaOptimizer._STATISTICS_EXIST_SQL,
+                                       {"name": name})
+                        if not cursor.fetchone()[0]:
+                            cursor.execute(sql)
+                            created.append(name)
+                cursor.execute(SchemaOptimizer._ANALYZE_SQL)
+        return created
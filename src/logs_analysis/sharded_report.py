@@ -0,0 +1,175 @@
+"""Module that runs the reports over a log sharded across several
+databases."""
+
+import collections
+import concurrent.futures
+import fnmatch
+
+import psycopg2
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_names as db_names
+import logs_analysis.db_report as db_report
+
+_DATABASES_SQL = """
+select datname from pg_database
+  where datallowconn and not datistemplate
+  order by datname"""
+
+
+def expand_dbnames(dbnames, maintenance_db="postgres", **connect_kwargs):
+    """Returns the database names, with each glob pattern replaced by the
+    names of the databases that match it, in name order, and without
+    duplicates.
+
+    Keyword arguments:
+    dbnames -- the database names and glob patterns. Required.
+    maintenance_db -- the database to connect to in order to list the
+                      databases, if there are any patterns. Optional.
+                      Defaults to postgres.
+    connect_kwargs -- passed to psycopg2.connect. Optional.
+
+    Throws:
+    ValueError -- when a pattern matches no database.
+    psycopg2.Error --  when an error occurs with accessing or querying the
+    database.
+    """
+    existing = None
+    expanded = collections.OrderedDict()
+    for dbname in dbnames:
+        if not db_names.is_pattern(dbname):
+            expanded[dbname] = None
+            continue
+        if existing is None:
+            with psycopg2.connect(dbname=maintenance_db,
+                                  **connect_kwargs) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(_DATABASES_SQL)
+                    existing = [row[0] for row in cursor.fetchall()]
+            conn.close()
+        matches = [name for name in existing
+                   if fnmatch.fnmatchcase(name, dbname)]
+        if not matches:
+            raise ValueError("no database matches '{}'".format(dbname))
+        expanded.update((name, None) for name in matches)
+    return list(expanded)
+
+
+class ShardedDbReport(db_report.ComputedReportMixin):
+    """Reports on a log that is sharded across several databases, such as
+    one per region or month, each with the schema of the news database.
+
+    Each report queries every shard at once, on a thread each, through a
+    db_report.DbReport per shard, so it takes about as long as the slowest
+    shard. The shards' partial results are then merged: the views of each
+    article and author are added up, and the requests and errors of each
+    day, or bucket, are added up before the percentage of errors is
+    computed, so the top N and the errors threshold are applied to the
+    whole log. Articles and authors are merged by title and name, so the
+    shards are assumed to hold the same articles and authors. Those with
+    the same views are in title or name order, as are days with the same
+    percentage of errors.
+
+    Each shard's rows are read from a snapshot of its own, so the shards
+    are not read at one point in time, and run_all runs one query per
+    report on each shard. The shards' rollups and article ids are used as
+    each shard's DbReport finds them.
+
+    The reports have the interface of db_report.DbReport, so a sharded
+    report can be given to news_text_report.NewsTextReport. The streaming
+    methods return iterators over the merged lists.
+    """
+
+    # pylint: disable-msg=R0913
+    def __init__(self, dbnames, providers=None, since=None, until=None,
+                 bucket="day", statement_timeout=None):
+        """Constructor.
+
+        Keyword arguments:
+        dbnames -- the names of the databases holding the shards. Required.
+        providers -- the connection_provider.ConnectionProvider of each
+                     database, in the same order. Optional. Defaults to
+                     None, which means a new connection for every query.
+        since, until, bucket, statement_timeout -- as for
+        db_report.DbReport, with the timeout applying to each shard's
+        query.
+
+        Throws:
+        ValueError -- when the bucket is unknown.
+        """
+        if providers is None:
+            providers = [connection_provider.DirectConnectionProvider(name)
+                         for name in dbnames]
+        self._reports = [
+            db_report.DbReport(name, provider, since=since, until=until,
+                               bucket=bucket,
+                               statement_timeout=statement_timeout)
+            for name, provider in zip(dbnames, providers)]
+        self._profiler = None
+
+    @property
+    def profiler(self):
+        """The query_profiler.QueryProfiler given to the DbReport of each
+        shard, or None, the default, when they are not profiled."""
+        return self._profiler
+
+    @profiler.setter
+    def profiler(self, profiler):
+        self._profiler = profiler
+        for report in self._reports:
+            report.profiler = profiler
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors, over all the
+        shards."""
+        return self._merge_views(self._map(
+            db_report.DbReport.get_most_popular_authors), top_n)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles, over all the
+        shards."""
+        return self._merge_views(self._map(
+            db_report.DbReport.get_most_popular_articles), top_n)
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=1):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors, over all
+        the shards."""
+        return db_report.DbReport.dates_wth_more_pct_errors(
+            self._chain(self._map(
+                db_report.DbReport.get_daily_request_counts)),
+            pct_errors)
+
+    def run_all(self, articles_top_n=None, authors_top_n=None,
+                pct_errors=1.0):
+        """As db_report.DbReport.run_all, over all the shards, with each
+        shard's three reports run one after the other."""
+        parts = self._map(lambda report: (
+            report.get_most_popular_articles(),
+            report.get_most_popular_authors(),
+            report.get_daily_request_counts()))
+        articles, authors, counts = zip(*parts)
+        return db_report.ReportResult(
+            self._merge_views(articles, articles_top_n),
+            self._merge_views(authors, authors_top_n),
+            db_report.DbReport.dates_wth_more_pct_errors(
+                self._chain(counts), pct_errors))
+
+    def _map(self, query):
+        """Returns the results of calling query with the DbReport of each
+        shard, called on a thread each."""
+        with concurrent.futures.ThreadPoolExecutor(
+                len(self._reports)) as executor:
+            return list(executor.map(query, self._reports))
+
+    @staticmethod
+    def _chain(parts):
+        return (row for part in parts for row in part)
+
+    @staticmethod
+    def _merge_views(parts, top_n):
+        """Adds up the (name, views) rows of each shard by name."""
+        views = collections.OrderedDict()
+        for name, shard_views in ShardedDbReport._chain(parts):
+            views[name] = views.get(name, 0) + shard_views
+        return ShardedDbReport._top(list(views.items()), top_n)
@@ -0,0 +1,421 @@
+"""Module that exports the daily counts of the log to a store of snapshot
+files, and runs the reports over them without a database.
+
+A store is a directory of snapshot files, each of which covers a range of
+whole days that no other file covers, and is named from its first and last
+days. append_snapshot adds a file of the days completed since the last day
+in the store, so that it can be kept up to date day by day, and each file
+is written whole before it is given its name, so that a store can be read
+while it is being appended to.
+
+A snapshot file is read from a memory map. In little endian byte order, it
+has:
+
+* a header: the MAGIC bytes and format VERSION, the numbers of days, hit
+  records, articles and authors, and the offset and size of the
+  dictionary;
+* a fixed width record per day, in order of time: the start of the day, as
+  seconds since 1970 and the offset from UTC in seconds of the time zone in
+  which it was exported, the index of its first hit record, and its
+  requests and failed requests;
+* a fixed width hit record per article viewed on each day, in order of
+  day: the article's index in the dictionary and its hits on that day;
+* the dictionary: the authors' names, then each article's slug, title and
+  index of its author, or -1 for none, where each string is its length in
+  bytes and then its UTF-8 encoding.
+
+Days are days in the time zone of the database session that exported them,
+which should stay the same from one append to the next. Log entries with no
+time are on no day, so are left out.
+"""
+
+import bisect
+import collections
+import datetime as dt
+import mmap
+import os
+import struct
+import tempfile
+
+import logs_analysis.db_report as db_report
+
+# The result of appending to a store: the snapshot file written, or None if
+# there were no days to append, and the numbers of days and of hit records
+# in it.
+AppendResult = collections.namedtuple("AppendResult",
+                                      ["path", "days", "hits"])
+
+# The counts of the days of a store in a time window: the articles, as
+# (slug, title, author name) tuples, the authors' names, a Counter of hits
+# by article slug, and a list of (day, requests, failed requests) tuples,
+# where day is the start of the day as an aware datetime.
+SnapshotCounts = collections.namedtuple(
+    "SnapshotCounts", ["articles", "authors", "hits", "days"])
+
+MAGIC = b"LOGSNAP\n"
+
+VERSION = 1
+
+SUFFIX = ".snap"
+
+_HEADER = struct.Struct("<8sHHIIIIQQ")
+
+# start, utc offset, first hit record, requests, failed requests
+_DAY = struct.Struct("<qiIqq")
+
+# article index, hits
+_HIT = struct.Struct("<II")
+
+_LENGTH = struct.Struct("<I")
+
+_AUTHOR_INDEX = struct.Struct("<i")
+
+_FILE_NAME = "{:%Y%m%d}-{:%Y%m%d}" + SUFFIX
+
+# the whole days after the last day in the store, if any, and before the
+# day of until, or of now
+_APPEND_WINDOW_SQL = """
+    time >= coalesce(%(last_day)s::timestamptz + interval '1 day',
+                     '-infinity')
+      and time < date_trunc('day', coalesce(%(until)s::timestamptz, now()))"""
+
+_DAYS_SQL = """
+select extract(epoch from day)::int8, extract(timezone from day)::int4,
+       requests, failures
+  from (select date_trunc('day', time) as day, count(*) as requests,
+               count(case when status != '200 OK' then 1 else NULL end)
+                 as failures
+          from log
+          where {window}
+          group by 1) as days
+  order by day"""
+
+# hits per day and article slug, grouped by slug before the join to the
+# articles, as for db_report.DbReport._VIEW_HITS_SQL
+_HITS_SQL = """
+select extract(epoch from hits.day)::int8, hits.derived_slug, hits.hits
+  from (select date_trunc('day', time) as day, derived_slug,
+               count(*) as hits
+          from accessed_articles
+          where {window}
+          group by 1, 2) as hits
+  join articles on articles.slug = hits.derived_slug
+  order by 1"""
+
+_ARTICLES_SQL = "select slug, title, author from articles order by id"
+
+_AUTHORS_SQL = "select id, name from authors order by id"
+
+
+def append_snapshot(provider, path, until=None):
+    """Appends the days completed since the last day in a store, or every
+    completed day of the log if the store is empty, as a new snapshot file.
+
+    Returns an AppendResult tuple.
+
+    Keyword arguments:
+    provider -- the connection_provider.ConnectionProvider used to obtain a
+                connection to the database. Required.
+    path -- the store's directory, which is created if need be. Required.
+    until -- a datetime; only the days that end by the start of its day are
+             appended. Optional. Defaults to None, which means now, so
+             every day before today.
+
+    Throws:
+    psycopg2.Error --  when an error occurs with accessing or querying the
+    database.
+    OSError -- when the store cannot be read or written.
+    ValueError -- when a file in the store is not a snapshot file.
+    """
+    os.makedirs(path, exist_ok=True)
+    snapshots = _read_files(path)
+    for snapshot in snapshots:
+        snapshot.close()
+    params = {"last_day": snapshots[-1].days()[-1][0] if snapshots else None,
+              "until": until}
+    with provider.connection() as news_db:
+        with news_db.cursor() as cursor:
+            # the days and their hits are taken from the same snapshot
+            cursor.execute(db_report.DbReport._SNAPSHOT_SQL)
+            cursor.execute(_DAYS_SQL.format(window=_APPEND_WINDOW_SQL),
+                           params)
+            day_rows = cursor.fetchall()
+            cursor.execute(_HITS_SQL.format(window=_APPEND_WINDOW_SQL),
+                           params)
+            hit_rows = cursor.fetchall()
+            cursor.execute(_ARTICLES_SQL)
+            article_rows = cursor.fetchall()
+            cursor.execute(_AUTHORS_SQL)
+            author_rows = cursor.fetchall()
+    if not day_rows:
+        return AppendResult(None, 0, 0)
+
+    author_indexes = {author_id: index for index, (author_id, _)
+                      in enumerate(author_rows)}
+    article_indexes = {slug: index for index, (slug, _, _)
+                       in enumerate(article_rows)}
+    dictionary = bytearray()
+    for _, name in author_rows:
+        dictionary += _encode(name)
+    for slug, title, author_id in article_rows:
+        dictionary += _encode(slug) + _encode(title) + _AUTHOR_INDEX.pack(
+            author_indexes.get(author_id, -1))
+
+    # the hits are in order of day, so each day's follow the day before's
+    records = bytearray()
+    first_hit = 0
+    for start, utc_offset, requests, failures in day_rows:
+        records += _DAY.pack(start, utc_offset, first_hit, requests,
+                             failures)
+        while first_hit < len(hit_rows) and hit_rows[first_hit][0] == start:
+            first_hit += 1
+    hits = bytearray()
+    for _, slug, count in hit_rows:
+        hits += _HIT.pack(article_indexes[slug], count)
+    header = _HEADER.pack(
+        MAGIC, VERSION, 0, len(day_rows), len(hit_rows), len(article_rows),
+        len(author_rows), _HEADER.size + len(records) + len(hits),
+        len(dictionary))
+
+    first, last = [_day_start(row[0], row[1])
+                   for row in (day_rows[0], day_rows[-1])]
+    file_path = os.path.join(path, _FILE_NAME.format(first, last))
+    with tempfile.NamedTemporaryFile(dir=path, suffix=".tmp",
+                                     delete=False) as snapshot_file:
+        try:
+            for data in (header, records, hits, dictionary):
+                snapshot_file.write(data)
+            snapshot_file.close()
+            os.replace(snapshot_file.name, file_path)
+        except BaseException:
+            os.unlink(snapshot_file.name)
+            raise
+    return AppendResult(file_path, len(day_rows), len(hit_rows))
+
+
+def _encode(text):
+    data = text.encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _day_start(start, utc_offset):
+    return dt.datetime.fromtimestamp(
+        start, dt.timezone(dt.timedelta(seconds=utc_offset)))
+
+
+def _read_files(path):
+    """Returns the _SnapshotFiles of a store, in order of their days."""
+    snapshots = []
+    try:
+        # a store that does not exist is an error, rather than empty
+        for name in os.listdir(path):
+            if name.endswith(SUFFIX):
+                snapshots.append(_SnapshotFile(os.path.join(path, name)))
+        snapshots.sort(key=lambda snapshot: snapshot.first_start)
+        for earlier, later in zip(snapshots, snapshots[1:]):
+            if later.first_start <= earlier.last_start:
+                raise ValueError("{} and {} cover the same days"
+                                 .format(earlier.path, later.path))
+    except BaseException:
+        for snapshot in snapshots:
+            snapshot.close()
+        raise
+    return snapshots
+
+
+class _SnapshotFile:
+    """A memory mapped snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            if os.fstat(snapshot_file.fileno()).st_size < _HEADER.size:
+                raise ValueError("{} is not a snapshot file".format(path))
+            self._map = mmap.mmap(snapshot_file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        (magic, version, _, day_count, self._hit_count,
+         self._article_count, self._author_count, self._dictionary_offset,
+         dictionary_size) = _HEADER.unpack_from(self._map)
+        self._hits_offset = _HEADER.size + day_count * _DAY.size
+        if magic != MAGIC or version != VERSION or day_count == 0 or \
+                self._hits_offset + self._hit_count * _HIT.size \
+                != self._dictionary_offset or \
+                self._dictionary_offset + dictionary_size != len(self._map):
+            self._map.close()
+            raise ValueError("{} is not a version {} snapshot file"
+                             .format(path, VERSION))
+        # only the day records are read up front, which are few
+        self._days = list(_DAY.iter_unpack(
+            self._map[_HEADER.size:self._hits_offset]))
+        self.first_start = self._days[0][0]
+        self.last_start = self._days[-1][0]
+
+    def days(self):
+        """Returns the (day, requests, failed requests) tuple of each day,
+        where day is the start of the day as an aware datetime."""
+        return [(_day_start(start, utc_offset), requests, failures)
+                for start, utc_offset, _, requests, failures in self._days]
+
+    def dictionary(self):
+        """Returns the articles, as (slug, title, author name) tuples, and
+        the authors' names."""
+        offset = self._dictionary_offset
+        authors = []
+        for _ in range(self._author_count):
+            name, offset = self._string(offset)
+            authors.append(name)
+        articles = []
+        for _ in range(self._article_count):
+            slug, offset = self._string(offset)
+            title, offset = self._string(offset)
+            index, = _AUTHOR_INDEX.unpack_from(self._map, offset)
+            offset += _AUTHOR_INDEX.size
+            articles.append((slug, title,
+                             None if index < 0 else authors[index]))
+        return articles, authors
+
+    def add_hits(self, hits, articles, first_day, end_day):
+        """Adds the hits of the days at indexes [first_day, end_day) to a
+        Counter, by slug. Only the hit records of those days are read."""
+        first_hit = self._first_hit(first_day)
+        end_hit = self._first_hit(end_day)
+        # a view of the map, not a copy, which must be released before the
+        # map is closed
+        with memoryview(self._map) as view:
+            for index, count in _HIT.iter_unpack(
+                    view[self._hits_offset + first_hit * _HIT.size:
+                         self._hits_offset + end_hit * _HIT.size]):
+                hits[articles[index][0]] += count
+
+    def close(self):
+        """Unmaps the file."""
+        self._map.close()
+
+    def _string(self, offset):
+        """Returns the string at an offset, and the offset after it."""
+        length, = _LENGTH.unpack_from(self._map, offset)
+        offset += _LENGTH.size
+        return self._map[offset:offset + length].decode("utf-8"), \
+            offset + length
+
+    def _first_hit(self, day):
+        return self._hit_count if day == len(self._days) \
+            else self._days[day][2]
+
+
+class SnapshotReport(db_report.ComputedReportMixin):
+    """Reports on a store of snapshot files, with the same interface as
+    DbReport, without a database.
+
+    The files are memory mapped on the first report, and only the records
+    of the days in the time window are read. The counts are kept, so
+    further reports need no further reading.
+
+    The articles and authors are those of the latest snapshot in which
+    they appear. Reports are as for DbReport over the whole days in the
+    window, except that the order of rows with equal counts may differ, the
+    errors report is only by day, and the rollups are never used.
+    """
+
+    def __init__(self, path, since=None, until=None):
+        """Constructor.
+
+        Keyword arguments:
+        path -- the store's directory. Required.
+        since, until -- datetimes; only the days that start at or after
+                        since and before until are reported on. A datetime
+                        with no time zone is in the time zone of the days.
+                        Optional. Default to None, which means no limit.
+        """
+        self._path = path
+        self._since = since
+        self._until = until
+        self._counts = None
+
+    @property
+    def counts(self):
+        """The SnapshotCounts of the days in the time window, which are read
+        on first use.
+
+        Throws:
+        OSError -- when a file cannot be read.
+        ValueError -- when a file is not a snapshot file, or two cover the
+                      same days.
+        """
+        return self.load()
+
+    def load(self):
+        """Reads the files, unless already read, and returns the
+        SnapshotCounts of the days in the time window.
+
+        Throws:
+        OSError -- when a file cannot be read.
+        ValueError -- when a file is not a snapshot file, or two cover the
+                      same days.
+        """
+        if self._counts is None:
+            snapshots = _read_files(self._path)
+            try:
+                self._counts = self._read_counts(snapshots)
+            finally:
+                for snapshot in snapshots:
+                    snapshot.close()
+        return self._counts
+
+    def get_most_popular_authors(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_authors."""
+        counts = self.counts
+        views = collections.OrderedDict((name, 0) for name in counts.authors)
+        for slug, _, author in counts.articles:
+            if author is not None:
+                views[author] += counts.hits[slug]
+        return self._top(list(views.items()), top_n)
+
+    def get_most_popular_articles(self, top_n=None):
+        """As db_report.DbReport.get_most_popular_articles."""
+        counts = self.counts
+        return self._top([(title, counts.hits[slug])
+                          for slug, title, _ in counts.articles], top_n)
+
+    # pylint: disable-msg=W0613
+    def get_dates_wth_more_pct_errors(self, pct_errors, parallelism=None):
+        """As db_report.DbReport.get_dates_wth_more_pct_errors."""
+        dates = []
+        for day, requests, failures in self.counts.days:
+            nok_pct = 100 * failures / requests
+            if nok_pct > pct_errors:
+                dates.append((day, nok_pct, requests))
+        dates.sort(key=lambda date: date[1], reverse=True)
+        return dates
+
+    def _read_counts(self, snapshots):
+        articles = collections.OrderedDict()
+        authors = collections.OrderedDict()
+        hits = collections.Counter()
+        days = []
+        for snapshot in snapshots:
+            file_articles, file_authors = snapshot.dictionary()
+            authors.update((name, None) for name in file_authors)
+            # later snapshots have the latest titles and authors
+            for article in file_articles:
+                articles.pop(article[0], None)
+                articles[article[0]] = article
+            file_days = snapshot.days()
+            # the days are in order, so those in the window are a range
+            first_day = self._bisect(file_days, self._since, 0)
+            end_day = self._bisect(file_days, self._until, len(file_days))
+            if first_day < end_day:
+                snapshot.add_hits(hits, file_articles, first_day, end_day)
+                days.extend(file_days[first_day:end_day])
+        return SnapshotCounts(list(articles.values()), list(authors), hits,
+                              days)
+
+    @staticmethod
+    def _bisect(days, bound, default):
+        """Returns the index of the first day that starts at or after a
+        bound of the time window, or the default for no bound."""
+        if bound is None:
+            return default
+        starts = [day if bound.tzinfo is not None
+                  else day.replace(tzinfo=None) for day, _, _ in days]
+        return bisect.bisect_left(starts, bound)
@@ -0,0 +1,149 @@
+"""Module that reports on the articles and authors with estimates of their
+unique visitors."""
+
+import logs_analysis.db_report as db_report
+import logs_analysis.hyperloglog as hyperloglog
+
+
+class VisitorsDbReport(db_report.DbReport):
+    """Reports on a database, with the unique visitors of each article and
+    author estimated from HyperLogLog sketches (see hyperloglog) of the ip
+    addresses of the successful log entries of their articles. Log entries
+    with no ip address are not counted as visitors.
+
+    The rows of the articles and authors reports are (name, views,
+    visitors), and those of the errors report are as for DbReport. Views
+    are counted as by DbReport, but authors are grouped by id rather than by
+    name. The estimates have a relative standard error of
+    hyperloglog.STANDARD_ERROR.
+
+    When the rollups are used, each article's sketch is merged from its
+    daily sketches (see init/createRollups.sql), with a time window too:
+    from those of the days wholly within the window, and from the log
+    entries on the days partly within it or added since the rollups were
+    last refreshed. Otherwise the sketches are computed from the log
+    entries in the window, which reads them all, but holds no more than
+    hyperloglog.REGISTERS registers per article, where an exact count of the
+    distinct ip addresses would hold every one of them.
+    """
+
+    _POPULAR_ARTICLES_SQL = """
+    select articles.title,
+           coalesce(hits.hits, 0)::bigint as access_count,
+           coalesce(visitors.visitors, 0) as visitors
+      from articles
+      left join (select {key}, sum(hits) as hits
+                   from ({hits}) as hits
+                   group by {key}) as hits on hits.{key} = articles.{key}
+      left join ({visitors}) as visitors on visitors.id = articles.id
+      order by access_count desc"""
+
+    _POPULAR_AUTHORS_SQL = """
+    select authors.name as author_name,
+           coalesce(hits.hits, 0)::bigint as article_count,
+           coalesce(visitors.visitors, 0) as visitors
+      from authors
+      left join (select articles.author, sum(hits.hits) as hits
+                   from articles
+                   join ({hits}) as hits on hits.{key} = articles.{key}
+                   group by articles.author) as hits
+        on hits.author = authors.id
+      left join ({visitors}) as visitors on visitors.id = authors.id
+      order by article_count desc"""
+
+    # the sketches of the articles, by slug, as the sketches of their
+    # articles or of their authors
+    _ARTICLE_SKETCHES_SQL = """
+    select articles.{owner} as id, register, rank
+      from ({sketches}) as sketches
+      join articles on articles.slug = sketches.slug"""
+
+    # the sketch of each article slug from the log entries matching the
+    # where clause
+    _LOG_SKETCHES_SQL = """
+    select slug, {register} as register, max({rank}) as rank
+      from (select substr(path, char_length('/article/') + 1) as slug,
+                   {hash} as hash
+              from log
+              where path like '/article/%%' and status = '200 OK'
+                and ip is not null and {where}) as hashes
+      group by slug, register"""
+
+    # the daily sketches of the whole days of the time window, with those of
+    # the log entries on other days or added since the rollups were last
+    # refreshed (see db_report.DbReport._ROLLUP_LOG_WHERE_SQL), which are
+    # filtered before they are hashed. Sketches that overlap merge as if
+    # they did not.
+    _ROLLUP_SKETCHES_SQL = """
+    select slug, register, rank
+      from article_visitors_daily
+      where {whole_days}
+    union all
+    {log_sketches}"""
+
+    # as DbReport._RUN_ALL_SECTIONS, with the visitors as a fifth column
+    _RUN_ALL_SECTIONS = (
+        ("articles", "label, null::timestamptz, null::float8, n, v",
+         "label, n, v"),
+        ("authors", "label, null::timestamptz, null::float8, n, v",
+         "label, n, v"),
+        ("errors", "null::text, day, pct, n, null::bigint", "day, pct, n"))
+
+    def uses_visitor_rollups(self):
+        """Returns True if the visitors are estimated from the daily
+        sketches of the rollups.
+
+        Throws:
+        psycopg2.Error --  when an error occurs with accessing or querying the
+        database.
+        """
+        return self.uses_rollups()
+
+    def _authors_query(self, top_n):
+        sql = VisitorsDbReport._POPULAR_AUTHORS_SQL.format(
+            visitors=self._visitors_sql("author"), **self._hits())
+        if top_n is not None:
+            sql += VisitorsDbReport._LIMIT_SQL
+        return sql, dict(self._window_params(), top_n=top_n)
+
+    def _articles_query(self, top_n):
+        sql = VisitorsDbReport._POPULAR_ARTICLES_SQL.format(
+            visitors=self._visitors_sql("id"), **self._hits())
+        if top_n is not None:
+            sql += VisitorsDbReport._LIMIT_SQL
+        return sql, dict(self._window_params(), top_n=top_n)
+
+    def _run_all_query(self, articles_top_n, authors_top_n, pct_errors,
+                       run_all_sections=_RUN_ALL_SECTIONS):
+        return super()._run_all_query(articles_top_n, authors_top_n,
+                                      pct_errors, run_all_sections)
+
+    @staticmethod
+    def _run_all_row(row):
+        section, _, label, day, pct, count, visitors = row
+        name = VisitorsDbReport._RUN_ALL_SECTIONS[section][0]
+        if name == "errors":
+            return name, (day, pct, count)
+        return name, (label, count, visitors)
+
+    def _visitors_sql(self, owner):
+        """Returns the estimated visitors of each article, for an owner of
+        "id", or author, for "author", by the id of the article or
+        author."""
+        if self.uses_visitor_rollups():
+            sketches = VisitorsDbReport._ROLLUP_SKETCHES_SQL.format(
+                whole_days=self._whole_spans_sql("date", "day"),
+                log_sketches=self._log_sketches_sql(
+                    self._rollup_log_where_sql("day")))
+        else:
+            sketches = self._log_sketches_sql(self._window_sql())
+        return hyperloglog.ESTIMATE_SQL.format(
+            sketches=VisitorsDbReport._ARTICLE_SKETCHES_SQL.format(
+                owner=owner, sketches=sketches))
+
+    @staticmethod
+    def _log_sketches_sql(where):
+        return VisitorsDbReport._LOG_SKETCHES_SQL.format(
+            register=hyperloglog.REGISTER_SQL.format(hash="hash"),
+            rank=hyperloglog.RANK_SQL.format(hash="hash"),
+            hash=hyperloglog.HASH_SQL.format(ip="ip"), where=where)
@@ -1,5 +1,6 @@
-# package is split across src and test directories
-# ensure the package can include resources in other directories
+# package is split across src and test directories. The src portion is a
+# native namespace package, with no __init__.py; this portion extends it, as
+# test discovery only looks in directories with an __init__.py.
 
 """Test module for logs_analysis."""
-__import__('pkg_resources').declare_namespace(__name__)
+__path__ = __import__('pkgutil').extend_path(__path__, __name__)
@@ -0,0 +1,100 @@
+"""Tests for approx_report module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import io
+import unittest
+
+import logs_analysis.approx_report as approx_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.news_text_report as news_text_report
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class ApproxDbReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        timestamp = dt.datetime(2020, 3, 21, tzinfo=cls._TZ_00)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug2", timestamp=timestamp)
+        helper.add_log("/", status="404 NOT FOUND", timestamp=timestamp)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def test_full_sample_gives_exact_views_with_no_margin(self):
+        for method in approx_report.ApproxDbReport.METHODS:
+            report = approx_report.ApproxDbReport(
+                ApproxDbReportTest._TEST_DB, 100, method=method, seed=1)
+            self.assertListEqual([("title one", 2, 0), ("title two", 1, 0)],
+                                 report.get_most_popular_articles())
+            self.assertListEqual([("first author", 2, 0)],
+                                 report.get_most_popular_authors(1))
+
+    def test_dates_with_errors_have_intervals_and_uncertainty(self):
+        report = approx_report.ApproxDbReport(ApproxDbReportTest._TEST_DB,
+                                              100)
+        low, high = report._wilson_interval(1, 4)
+        self.assertLess(low, 25.0)
+        self.assertGreater(high, 25.0)
+        date = dt.datetime(2020, 3, 21, tzinfo=ApproxDbReportTest._TZ_00)
+        self.assertListEqual([(date, 25.0, 4, low, high, False)],
+                             report.get_dates_wth_more_pct_errors(low - 1))
+        self.assertListEqual([(date, 25.0, 4, low, high, True)],
+                             report.get_dates_wth_more_pct_errors(30))
+        self.assertListEqual([],
+                             report.get_dates_wth_more_pct_errors(high))
+
+    def test_scaled_views_and_margin(self):
+        report = approx_report.ApproxDbReport(ApproxDbReportTest._TEST_DB,
+                                              10)
+        # 100 hits in a 10% sample: 1,000 views, margin 1.96 * sqrt(90) / 0.1
+        self.assertListEqual([("title", 1000, 186)],
+                             report._scale_views([("title", 100)]))
+
+    def test_invalid_arguments_are_rejected(self):
+        with self.assertRaises(ValueError):
+            approx_report.ApproxDbReport(ApproxDbReportTest._TEST_DB, 0)
+        with self.assertRaises(ValueError):
+            approx_report.ApproxDbReport(ApproxDbReportTest._TEST_DB, 10,
+                                         method="random")
+
+    def test_text_report_shows_intervals(self):
+        report = approx_report.ApproxDbReport(ApproxDbReportTest._TEST_DB,
+                                              100)
+        out = io.StringIO()
+        news_text_report.NewsTextReport(
+            ApproxDbReportTest._TEST_DB, db_reporter=report).report_all(
+                out, 1, 1, 20)
+        self.assertEqual(
+            "The most popular 1 articles are:\n"
+            "'title one' - 2 ± 0 views\n\n"
+            "The most popular 1 authors are:\n"
+            "'first author' - 2 ± 0 views\n\n"
+            "The days on which more than 20% of requests led to errors:\n"
+            "Sat 21 March 2020 - 25.00% (4.56% to 69.94%) errors out of "
+            "about 4 requests (uncertain)\n\n", out.getvalue())
@@ -0,0 +1,152 @@
+"""Tests for article_ids module and for the reports counted by article id.
+These are integration tests and require that the test database has been
+created and db structure created before these tests are run."""
+
+import unittest
+import datetime as dt
+
+import psycopg2
+
+import logs_analysis.article_ids as article_ids
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class ArticleIdsTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _DAY = dt.datetime(2020, 3, 21, 12, tzinfo=_TZ_00)
+
+    #
+    # Set up and tear down methods.
+    #
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the article ids and reset database once all tests have
+        run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.drop_article_ids()
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database, log five entries, then install the article
+        ids before each test is run"""
+        self.helper = \
+            db_report_test_helper.DbReportTestHelper(ArticleIdsTest._TEST_DB)
+        self.helper.reset_database()
+        self.helper.drop_article_ids()
+
+        self.helper.add_author("first author")
+        self.helper.add_author("second author")
+        self.helper.add_article("first author", "title one", "slug1")
+        self.helper.add_article("second author", "title two", "slug2")
+        self.helper.add_log("/article/slug1", timestamp=self._DAY)
+        self.helper.add_log("/article/slug1", timestamp=self._DAY)
+        self.helper.add_log("/article/slug2", timestamp=self._DAY)
+        self.helper.add_log("/article/slug2", status="404 NOT FOUND",
+                            timestamp=self._DAY)
+        self.helper.add_log("/", timestamp=self._DAY)
+        self.helper.run_init_script("createArticleIds.sql")
+
+    def _article_ids(self):
+        with psycopg2.connect(dbname=ArticleIdsTest._TEST_DB) as test_db:
+            with test_db.cursor() as cursor:
+                cursor.execute("select article_id from log order by id")
+                article_ids_ = [row[0] for row in cursor.fetchall()]
+        test_db.close()
+        return article_ids_
+
+    def _assert_article_ids_match_views(self, since=None):
+        by_ids = db_report.DbReport(ArticleIdsTest._TEST_DB,
+                                    use_rollups=False, since=since,
+                                    use_article_ids=True)
+        from_views = db_report.DbReport(ArticleIdsTest._TEST_DB,
+                                        use_rollups=False, since=since,
+                                        use_article_ids=False)
+        self.assertListEqual(from_views.get_most_popular_articles(),
+                             by_ids.get_most_popular_articles())
+        self.assertListEqual(from_views.get_most_popular_authors(),
+                             by_ids.get_most_popular_authors())
+        self.assertEqual(from_views.run_all(1, 1, 0),
+                         by_ids.run_all(1, 1, 0))
+
+    #
+    # Backfill tests
+    #
+    def test_backfill_resolves_existing_entries(self):
+        self.assertListEqual([None] * 5, self._article_ids())
+        result = article_ids.ArticleIds(ArticleIdsTest._TEST_DB).backfill()
+        self.assertTupleEqual((0, 5, 5, 4), result)
+        self.assertListEqual([1, 1, 2, 2, None], self._article_ids())
+
+    def test_backfill_commits_in_chunks_and_resumes(self):
+        ids = article_ids.ArticleIds(ArticleIdsTest._TEST_DB)
+        result = ids.backfill(chunk_size=2, max_chunks=1)
+        self.assertTupleEqual((0, 2, 5, 2), result)
+        self.assertListEqual([1, 1, None, None, None], self._article_ids())
+        self.assertFalse(ids.is_ready())
+        result = ids.backfill(chunk_size=2)
+        self.assertTupleEqual((2, 5, 5, 2), result)
+        self.assertTrue(ids.is_ready())
+        self.assertTupleEqual((5, 5, 5, 0), ids.backfill())
+
+    #
+    # Trigger tests
+    #
+    def test_new_entries_are_resolved_on_insert(self):
+        self.helper.add_log("/article/slug2")
+        self.helper.add_log("/article/nonesuch")
+        self.assertListEqual([None] * 5 + [2, None], self._article_ids())
+
+    def test_entries_are_resolved_when_articles_are_added(self):
+        self.helper.add_log("/article/slug3")
+        self.helper.add_article("first author", "title three", "slug3")
+        self.assertEqual(3, self._article_ids()[-1])
+        with psycopg2.connect(dbname=ArticleIdsTest._TEST_DB) as test_db:
+            with test_db.cursor() as cursor:
+                cursor.execute("update articles set slug = 'renamed' "
+                               "where slug = 'slug3'")
+        test_db.close()
+        self.assertIsNone(self._article_ids()[-1])
+
+    #
+    # Report tests
+    #
+    def test_article_ids_used_only_when_backfilled(self):
+        self.assertTrue(
+            article_ids.ArticleIds(ArticleIdsTest._TEST_DB).is_installed())
+        report = db_report.DbReport(ArticleIdsTest._TEST_DB,
+                                    use_rollups=False)
+        self.assertFalse(report.uses_article_ids())
+        article_ids.ArticleIds(ArticleIdsTest._TEST_DB).backfill()
+        report = db_report.DbReport(ArticleIdsTest._TEST_DB,
+                                    use_rollups=False)
+        self.assertTrue(report.uses_article_ids())
+
+        self.helper.drop_article_ids()
+        self.assertFalse(
+            article_ids.ArticleIds(ArticleIdsTest._TEST_DB).is_installed())
+        report = db_report.DbReport(ArticleIdsTest._TEST_DB,
+                                    use_rollups=False)
+        self.assertFalse(report.uses_article_ids())
+
+    def test_reports_by_article_id_match_views(self):
+        article_ids.ArticleIds(ArticleIdsTest._TEST_DB).backfill()
+        self.helper.add_log("/article/slug2")
+        self.helper.add_log("/article/slug2")
+        self._assert_article_ids_match_views()
+        self._assert_article_ids_match_views(since=self._DAY)
+        self.assertListEqual(
+            [("title two", 3), ("title one", 2)],
+            db_report.DbReport(ArticleIdsTest._TEST_DB, use_rollups=False)
+            .get_most_popular_articles())
@@ -0,0 +1,90 @@
+"""Tests for async_db_report module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import asyncio
+import datetime as dt
+import time
+import unittest
+
+import psycopg2
+
+import logs_analysis.async_db_report as async_db_report
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class AsyncDbReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        timestamp = dt.datetime(2020, 3, 21, tzinfo=cls._TZ_00)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug2", timestamp=timestamp)
+        helper.add_log("/", status="404 NOT FOUND", timestamp=timestamp)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def test_run_all_matches_serial_reports(self):
+        serial = db_report.DbReport(AsyncDbReportTest._TEST_DB)
+        report = async_db_report.AsyncDbReport(AsyncDbReportTest._TEST_DB)
+        self.assertEqual(serial.run_all(1, None, 1.0),
+                         report.run_all(1, None, 1.0))
+
+    def test_iter_all_generates_rows_in_section_order(self):
+        report = async_db_report.AsyncDbReport(AsyncDbReportTest._TEST_DB)
+        self.assertEqual(
+            [("articles", ("title one", 2)), ("articles", ("title two", 1)),
+             ("authors", ("first author", 2)),
+             ("authors", ("second author", 1)),
+             ("errors", (dt.datetime(2020, 3, 21,
+                                     tzinfo=AsyncDbReportTest._TZ_00),
+                         25.0, 4))],
+            list(report.iter_all()))
+
+    def test_coroutine_reports(self):
+        report = async_db_report.AsyncDbReport(AsyncDbReportTest._TEST_DB)
+        self.assertEqual([("first author", 2)], asyncio.run(
+            report.get_most_popular_authors_async(1)))
+
+    def test_queries_run_concurrently(self):
+        report = async_db_report.AsyncDbReport(AsyncDbReportTest._TEST_DB)
+
+        async def sleep_three_times():
+            await asyncio.gather(*(
+                report._fetch_all_async("select pg_sleep(0.3)", None)
+                for _ in range(3)))
+
+        start = time.perf_counter()
+        asyncio.run(sleep_three_times())
+        self.assertLess(time.perf_counter() - start, 0.8)
+
+    def test_query_errors_are_raised(self):
+        report = async_db_report.AsyncDbReport(AsyncDbReportTest._TEST_DB)
+        with self.assertRaises(psycopg2.Error):
+            asyncio.run(report._fetch_all_async("select * from no_such_table",
+                                                None))
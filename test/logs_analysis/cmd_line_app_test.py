@@ -0,0 +1,57 @@
+"""Tests for cmd_line_app module."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import logs_analysis.approx_report as approx_report
+import logs_analysis.cmd_line_app as cmd_line_app
+import logs_analysis.db_report as db_report
+import logs_analysis.report_writer as report_writer
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class CmdLineAppTest(unittest.TestCase):
+    """Test cases"""
+
+    def test_help_does_not_import_the_db_layer(self):
+        self._assert_db_layer_not_imported(["--help"])
+
+    def test_usage_errors_do_not_import_the_db_layer(self):
+        self._assert_db_layer_not_imported(["--explain"])
+        self._assert_db_layer_not_imported(["--db", "news_*", "--visitors"])
+        self._assert_db_layer_not_imported(["--approx", "10", "--columnar"])
+
+    def _assert_db_layer_not_imported(self, argv):
+        # a new interpreter, as this one has already imported them
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        modules = subprocess.run(
+            [sys.executable, "-c",
+             "import sys\n"
+             "import logs_analysis.cmd_line_app as app\n"
+             "sys.argv = ['logs_analysis'] + {!r}\n"
+             "try:\n"
+             "    app.CmdLineApp().run()\n"
+             "except SystemExit:\n"
+             "    print('\\n'.join(sys.modules))\n".format(argv)],
+            env=env, check=True, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True).stdout.splitlines()
+        self.assertIn("logs_analysis.cmd_line_app", modules)
+        for module in ["psycopg2", "numpy", "pkg_resources",
+                       "logs_analysis.db_report"]:
+            self.assertNotIn(module, modules)
+
+    def test_choices_match_the_lazily_imported_modules(self):
+        self.assertEqual(tuple(approx_report.ApproxDbReport.METHODS),
+                         cmd_line_app.CmdLineApp._APPROX_METHODS)
+        self.assertEqual(tuple(sorted(report_writer.WRITERS)),
+                         cmd_line_app.CmdLineApp._FORMATS)
+        self.assertEqual(db_report.DbReport.BUCKETS,
+                         cmd_line_app.CmdLineApp._BUCKETS)
@@ -0,0 +1,101 @@
+"""Tests for columnar_report module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import unittest
+
+import logs_analysis.columnar_report as columnar_report
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+@unittest.skipIf(columnar_report.numpy is None, "numpy is not installed")
+class ColumnarDbReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _DAY_1 = dt.datetime(2020, 3, 21, 10, tzinfo=_TZ_00)
+
+    _DAY_2 = dt.datetime(2020, 3, 22, 10, tzinfo=_TZ_00)
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_author("no articles")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        helper.add_article("first author", "title three", "slug3")
+        for _ in range(3):
+            helper.add_log("/article/slug1", timestamp=cls._DAY_1)
+        helper.add_log("/article/slug2", timestamp=cls._DAY_1)
+        helper.add_log("/article/slug2", timestamp=cls._DAY_2)
+        helper.add_log("/article/slug3", status="404 NOT FOUND",
+                       timestamp=cls._DAY_2)
+        helper.add_log("/article/missing", timestamp=cls._DAY_2)
+        helper.add_log("/", status="404 NOT FOUND", timestamp=cls._DAY_1)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def test_reports_match_db_report(self):
+        columnar = columnar_report.ColumnarDbReport(
+            ColumnarDbReportTest._TEST_DB)
+        report = db_report.DbReport(ColumnarDbReportTest._TEST_DB,
+                                    use_rollups=False)
+        self.assertListEqual(report.get_most_popular_articles(),
+                             columnar.get_most_popular_articles())
+        self.assertListEqual(report.get_most_popular_authors(),
+                             columnar.get_most_popular_authors())
+        self.assertListEqual(report.get_dates_wth_more_pct_errors(0),
+                             columnar.get_dates_wth_more_pct_errors(0))
+        self.assertEqual(8, columnar.rows_read)
+
+    def test_reports_are_resliced_without_reading_again(self):
+        columnar = columnar_report.ColumnarDbReport(
+            ColumnarDbReportTest._TEST_DB)
+        self.assertListEqual([("title one", 3)],
+                             columnar.get_most_popular_articles(1))
+        helper = db_report_test_helper.DbReportTestHelper(
+            ColumnarDbReportTest._TEST_DB)
+        for _ in range(3):
+            helper.add_log("/article/slug2", timestamp=self._DAY_1)
+        try:
+            self.assertListEqual([("title one", 3), ("title two", 2)],
+                                 columnar.get_most_popular_articles(2))
+            date = dt.datetime(2020, 3, 22, tzinfo=self._TZ_00)
+            self.assertListEqual([(date, 100 / 3, 3)],
+                                 columnar.get_dates_wth_more_pct_errors(30))
+            self.assertEqual(8, columnar.rows_read)
+            columnar.refresh()
+            self.assertListEqual([("title two", 5)],
+                                 columnar.get_most_popular_articles(1))
+            self.assertEqual(11, columnar.rows_read)
+        finally:
+            self.setUpClass()
+
+    def test_time_window(self):
+        until = dt.datetime(2020, 3, 22, tzinfo=self._TZ_00)
+        columnar = columnar_report.ColumnarDbReport(
+            ColumnarDbReportTest._TEST_DB, until=until)
+        self.assertListEqual([("first author", 3), ("second author", 1),
+                              ("no articles", 0)],
+                             columnar.get_most_popular_authors())
+        self.assertListEqual([(until - dt.timedelta(days=1), 20.0, 5)],
+                             columnar.get_dates_wth_more_pct_errors(0))
@@ -0,0 +1,281 @@
+"""Tests for connection_provider module. These are integration tests and
+require that the test database has been created before these tests are
+run."""
+
+import datetime as dt
+import os
+import signal
+import threading
+import time
+import unittest
+
+import psycopg2
+import psycopg2.extensions
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class ConnectionProviderTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database and add a little data before each test."""
+        helper = db_report_test_helper.DbReportTestHelper(
+            ConnectionProviderTest._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_log("/article/slug1")
+
+    @staticmethod
+    def _run_all_reports(report):
+        report.get_most_popular_articles()
+        report.get_most_popular_authors()
+        report.get_dates_wth_more_pct_errors(1.0)
+
+    #
+    # Direct provider tests
+    #
+    def test_direct_provider_connects_for_every_report(self):
+        provider = connection_provider.DirectConnectionProvider(
+            ConnectionProviderTest._TEST_DB)
+        report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                    provider)
+        self._run_all_reports(report)
+        self.assertEqual(3, provider.connect_count)
+
+    def test_default_report_connects_once_per_report(self):
+        helper = db_report_test_helper.DbReportTestHelper(
+            ConnectionProviderTest._TEST_DB)
+        self.addCleanup(helper.drop_rollups)
+        self.addCleanup(helper.drop_article_ids)
+        # whatever is installed, finding out takes no connection of its own
+        for install in [None, "createRollups.sql", "createArticleIds.sql"]:
+            if install is not None:
+                helper.run_init_script(install)
+            with self.subTest(install=install):
+                provider = connection_provider.DirectConnectionProvider(
+                    ConnectionProviderTest._TEST_DB)
+                report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                            provider)
+                report.run_all()
+                self.assertEqual(1, provider.connect_count)
+                self._run_all_reports(report)
+                self.assertEqual(4, provider.connect_count)
+                windowed = db_report.DbReport(
+                    ConnectionProviderTest._TEST_DB, provider,
+                    since=dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc))
+                self._run_all_reports(windowed)
+                self.assertEqual(7, provider.connect_count)
+
+    #
+    # Single connection provider tests
+    #
+    def test_single_provider_connects_once_for_all_reports(self):
+        with connection_provider.SingleConnectionProvider(
+                ConnectionProviderTest._TEST_DB) as provider:
+            report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                        provider)
+            self._run_all_reports(report)
+            self.assertEqual(1, provider.connect_count)
+            self.assertEqual([("title one", 1)],
+                             report.get_most_popular_articles())
+
+    def test_single_provider_reconnects_after_connection_closed(self):
+        with connection_provider.SingleConnectionProvider(
+                ConnectionProviderTest._TEST_DB) as provider:
+            with provider.connection() as conn:
+                pass
+            conn.close()
+            with provider.connection() as conn:
+                self.assertFalse(conn.closed)
+            self.assertEqual(2, provider.connect_count)
+
+    def test_single_provider_rolls_back_on_error(self):
+        with connection_provider.SingleConnectionProvider(
+                ConnectionProviderTest._TEST_DB) as provider:
+            with self.assertRaises(psycopg2.Error):
+                with provider.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("select * from no_such_table")
+            with provider.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("select 1")
+                    self.assertEqual((1,), cursor.fetchone())
+            self.assertEqual(1, provider.connect_count)
+
+    #
+    # Pooled provider tests
+    #
+    def test_pool_reuses_connections(self):
+        with connection_provider.PooledConnectionProvider(
+                ConnectionProviderTest._TEST_DB, min_size=1,
+                max_size=2) as provider:
+            report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                        provider)
+            self._run_all_reports(report)
+            self._run_all_reports(report)
+            self.assertEqual(1, provider.connect_count)
+            self.assertEqual(1, provider.idle_count)
+
+    def test_pool_grows_to_max_size_then_times_out(self):
+        with connection_provider.PooledConnectionProvider(
+                ConnectionProviderTest._TEST_DB, min_size=0, max_size=2,
+                timeout=0.1) as provider:
+            with provider.connection():
+                with provider.connection():
+                    self.assertEqual(2, provider.size)
+                    with self.assertRaises(connection_provider.PoolError):
+                        with provider.connection():
+                            pass
+            self.assertEqual(2, provider.idle_count)
+
+    def test_pool_evicts_idle_connections_above_min_size(self):
+        with connection_provider.PooledConnectionProvider(
+                ConnectionProviderTest._TEST_DB, min_size=1, max_size=3,
+                max_idle=0.05) as provider:
+            with provider.connection():
+                with provider.connection():
+                    pass
+            self.assertEqual(2, provider.size)
+            time.sleep(0.1)
+            with provider.connection():
+                pass
+            self.assertEqual(1, provider.size)
+
+    def test_pool_replaces_unhealthy_connections(self):
+        with connection_provider.PooledConnectionProvider(
+                ConnectionProviderTest._TEST_DB, min_size=1, max_size=1,
+                health_check_interval=0) as provider:
+            with provider.connection() as conn:
+                backend_pid = conn.get_backend_pid()
+            # terminate the pooled connection's backend behind its back
+            with psycopg2.connect(
+                    dbname=ConnectionProviderTest._TEST_DB) as admin:
+                with admin.cursor() as cursor:
+                    cursor.execute("select pg_terminate_backend(%s)",
+                                   (backend_pid,))
+            admin.close()
+            time.sleep(0.1)
+            with provider.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("select 1")
+                    self.assertEqual((1,), cursor.fetchone())
+            self.assertEqual(2, provider.connect_count)
+            self.assertEqual(1, provider.size)
+
+    def test_pool_rejects_inconsistent_sizes(self):
+        with self.assertRaises(ValueError):
+            connection_provider.PooledConnectionProvider(
+                ConnectionProviderTest._TEST_DB, min_size=3, max_size=2)
+
+    def test_closed_pool_raises_pool_error(self):
+        provider = connection_provider.PooledConnectionProvider(
+            ConnectionProviderTest._TEST_DB)
+        provider.close()
+        with self.assertRaises(connection_provider.PoolError):
+            with provider.connection():
+                pass
+
+    #
+    # Replica provider tests
+    #
+    def _replica_provider(self, replica_dbname, **kwargs):
+        return connection_provider.ReplicaConnectionProvider(
+            connection_provider.SingleConnectionProvider(replica_dbname),
+            connection_provider.SingleConnectionProvider(
+                ConnectionProviderTest._TEST_DB), **kwargs)
+
+    def test_replica_provider_uses_replica_without_lag(self):
+        # a database that is not in recovery stands in for the replica
+        with self._replica_provider(ConnectionProviderTest._TEST_DB) \
+                as provider:
+            report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                        provider)
+            self._run_all_reports(report)
+            self.assertTrue(provider.uses_replica())
+            self.assertEqual(0.0, provider.lag)
+            self.assertEqual([("title one", 1)],
+                             report.get_most_popular_articles())
+
+    def test_replica_provider_falls_back_to_primary(self):
+        with self._replica_provider("no_such_replica_db") as provider:
+            report = db_report.DbReport(ConnectionProviderTest._TEST_DB,
+                                        provider)
+            self.assertEqual([("title one", 1)],
+                             report.get_most_popular_articles())
+            self.assertFalse(provider.uses_replica())
+            self.assertIsNone(provider.lag)
+
+    def test_replica_provider_without_fallback_raises(self):
+        with self._replica_provider("no_such_replica_db",
+                                    fallback=False) as provider:
+            with self.assertRaises(
+                    connection_provider.ReplicaUnavailableError):
+                with provider.connection():
+                    pass
+
+    def test_replica_provider_checks_lag_again_after_interval(self):
+        with self._replica_provider(ConnectionProviderTest._TEST_DB,
+                                    max_lag=-1.0, check_interval=0.0) \
+                as provider:
+            self.assertFalse(provider.uses_replica())
+            provider._max_lag = 30.0
+            self.assertTrue(provider.uses_replica())
+
+    def test_replica_provider_returns_connections_to_their_lender(self):
+        primary = connection_provider.PooledConnectionProvider(
+            ConnectionProviderTest._TEST_DB, min_size=0, max_size=1)
+        with connection_provider.ReplicaConnectionProvider(
+                connection_provider.DirectConnectionProvider(
+                    ConnectionProviderTest._TEST_DB),
+                primary, max_lag=-1.0, check_interval=0.0) as provider:
+            with provider.connection() as conn:
+                # the replica is chosen while the primary's is lent
+                provider._max_lag = 30.0
+                self.assertTrue(provider.uses_replica())
+            with primary.connection() as reused:
+                self.assertIs(conn, reused)
+
+    #
+    # Interrupt tests
+    #
+    def test_interrupt_cancels_query_and_connection_reopens(self):
+        psycopg2.extensions.set_wait_callback(
+            connection_provider.wait_cancelling_on_interrupt)
+        timer = threading.Timer(
+            0.2, os.kill, (os.getpid(), signal.SIGINT))
+        try:
+            with connection_provider.SingleConnectionProvider(
+                    ConnectionProviderTest._TEST_DB) as provider:
+                start = time.monotonic()
+                timer.start()
+                with self.assertRaises(KeyboardInterrupt):
+                    with provider.connection() as conn:
+                        with conn.cursor() as cursor:
+                            cursor.execute("select pg_sleep(10)")
+                self.assertLess(time.monotonic() - start, 5)
+                with provider.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute("select 1")
+                        self.assertEqual((1,), cursor.fetchone())
+        finally:
+            timer.cancel()
+            psycopg2.extensions.set_wait_callback(None)
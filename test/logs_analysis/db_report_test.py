@@ -5,6 +5,8 @@ tests are run."""
 import unittest
 import datetime as dt
 
+import psycopg2
+
 import logs_analysis.db_report as db_report
 import logs_analysis.db_report_test_helper as db_report_test_helper
 
@@ -378,3 +380,222 @@ class DbReportTest(unittest.TestCase):
         self.assertTupleEqual(
             (dt.datetime(2020, 3, 21, tzinfo=DbReportTest._TZ_00), 100.0, 4),
             pct_errors[0])
+
+    def test_parallel_dates_with_errors_match_serial_query(self):
+        # add test data over more days than shards, and with no time
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        for day in range(1, 20):
+            for hour in range(day % 4 + 1):
+                helper.add_log("/", timestamp=dt.datetime(
+                    2020, 3, day, hour, tzinfo=DbReportTest._TZ_00))
+            helper.add_log("/", status="404 NOT FOUND",
+                           timestamp=dt.datetime(2020, 3, day, 23,
+                                                 tzinfo=DbReportTest._TZ_00))
+        helper.add_log("/", status="404 NOT FOUND")
+        with psycopg2.connect(dbname=DbReportTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("update log set time = null where id = "
+                               "(select max(id) from log)")
+        conn.close()
+
+        # run the test
+        report = db_report.DbReport(DbReportTest._TEST_DB,
+                                    use_rollups=False)
+        serial = report.get_dates_wth_more_pct_errors(20)
+        parallel = report.get_dates_wth_more_pct_errors(20, parallelism=2)
+        self.assertEqual(15, len(parallel))
+        self.assertEqual((None, 100.0, 1), parallel[0])
+        self.assertCountEqual(serial, parallel)
+        self.assertEqual([row[1] for row in serial],
+                         [row[1] for row in parallel])
+
+    def test_parallel_dates_with_errors_with_empty_database(self):
+        report = db_report.DbReport(DbReportTest._TEST_DB,
+                                    use_rollups=False)
+        self.assertListEqual(
+            [], report.get_dates_wth_more_pct_errors(1.0, parallelism=3))
+
+    def test_errors_are_counted_per_bucket(self):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        for hour, minute, status in [(12, 1, "200 OK"),
+                                     (12, 3, "404 NOT FOUND"),
+                                     (12, 7, "200 OK"),
+                                     (13, 30, "404 NOT FOUND"),
+                                     (13, 31, "200 OK")]:
+            helper.add_log("/", status=status, timestamp=dt.datetime(
+                2020, 3, 21, hour, minute, tzinfo=DbReportTest._TZ_00))
+
+        def at(hour, minute=0):
+            return dt.datetime(2020, 3, 21, hour, minute,
+                               tzinfo=DbReportTest._TZ_00)
+        expected = {
+            "minute": [(at(12, 3), 100.0, 1), (at(13, 30), 100.0, 1)],
+            "5m": [(at(12), 50.0, 2), (at(13, 30), 50.0, 2)],
+            "hour": [(at(13), 50.0, 2), (at(12), 100 / 3, 3)],
+            "day": [(at(0), 40.0, 5)]}
+        for bucket, dates in expected.items():
+            report = db_report.DbReport(DbReportTest._TEST_DB,
+                                        use_rollups=False, bucket=bucket)
+            self.assertEqual(bucket, report.bucket)
+            self.assertCountEqual(dates,
+                                  report.get_dates_wth_more_pct_errors(1))
+            self.assertCountEqual(
+                dates, report.get_dates_wth_more_pct_errors(1, parallelism=2))
+            self.assertCountEqual(dates, report.run_all(0, 0, 1).errors)
+
+    def test_unknown_bucket_is_rejected(self):
+        with self.assertRaises(ValueError):
+            db_report.DbReport(DbReportTest._TEST_DB, bucket="week")
+
+    #
+    # Time window tests
+    #
+    def test_time_window_limits_every_report(self):
+        # add test data
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        for day, path, status in [(1, "/article/slug1", "200 OK"),
+                                  (2, "/article/slug2", "200 OK"),
+                                  (2, "/", "404 NOT FOUND"),
+                                  (3, "/article/slug1", "200 OK"),
+                                  (3, "/article/slug1", "200 OK")]:
+            helper.add_log(path, status=status,
+                           timestamp=dt.datetime(2020, 3, day, 12,
+                                                 tzinfo=DbReportTest._TZ_00))
+
+        # run the test
+        report = db_report.DbReport(
+            DbReportTest._TEST_DB,
+            since=dt.datetime(2020, 3, 2, tzinfo=DbReportTest._TZ_00),
+            until=dt.datetime(2020, 3, 3, tzinfo=DbReportTest._TZ_00))
+        self.assertFalse(report.uses_rollups())
+        self.assertListEqual([("title two", 1), ("title one", 0)],
+                             report.get_most_popular_articles())
+        self.assertListEqual([("second author", 1), ("first author", 0)],
+                             report.get_most_popular_authors())
+        errors = [(dt.datetime(2020, 3, 2, tzinfo=DbReportTest._TZ_00),
+                   50.0, 2)]
+        self.assertListEqual(errors,
+                             report.get_dates_wth_more_pct_errors(1.0))
+        self.assertListEqual(
+            errors, report.get_dates_wth_more_pct_errors(1.0, parallelism=2))
+        self.assertTupleEqual(
+            ([("title two", 1)], [("second author", 1)], errors),
+            tuple(report.run_all(1, 1, 1.0)))
+
+        since_only = db_report.DbReport(
+            DbReportTest._TEST_DB,
+            since=dt.datetime(2020, 3, 3, tzinfo=DbReportTest._TZ_00))
+        self.assertListEqual([("title one", 2), ("title two", 0)],
+                             since_only.get_most_popular_articles())
+
+    #
+    # Combined report tests
+    #
+    def test_run_all_matches_individual_reports(self):
+        # add test data
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        helper.add_article("second author", "title three", "slug3")
+        helper.add_log("/article/slug1",
+                       timestamp=dt.datetime(2020, 3, 31,
+                                             tzinfo=DbReportTest._TZ_00))
+        helper.add_log("/article/slug2",
+                       timestamp=dt.datetime(2020, 3, 31,
+                                             tzinfo=DbReportTest._TZ_00))
+        helper.add_log("/article/slug2",
+                       timestamp=dt.datetime(2020, 4, 1,
+                                             tzinfo=DbReportTest._TZ_00))
+        helper.add_log("/article/slug3", status="404 NOT FOUND",
+                       timestamp=dt.datetime(2020, 4, 1,
+                                             tzinfo=DbReportTest._TZ_00))
+
+        # run the test
+        report = db_report.DbReport(DbReportTest._TEST_DB)
+        result = report.run_all(articles_top_n=2, authors_top_n=None,
+                                pct_errors=10)
+        self.assertListEqual([("title two", 2), ("title one", 1)],
+                             result.articles)
+        self.assertListEqual([("second author", 2), ("first author", 1)],
+                             result.authors)
+        self.assertListEqual(
+            [(dt.datetime(2020, 4, 1, tzinfo=DbReportTest._TZ_00), 50.0, 2)],
+            result.errors)
+        self.assertListEqual(report.get_most_popular_articles(2),
+                             result.articles)
+        self.assertListEqual(report.get_most_popular_authors(),
+                             result.authors)
+        self.assertListEqual(report.get_dates_wth_more_pct_errors(10),
+                             result.errors)
+
+    def test_run_all_with_empty_database(self):
+        report = db_report.DbReport(DbReportTest._TEST_DB)
+        result = report.run_all(3, 3, 1.0)
+        self.assertTupleEqual(([], [], []), tuple(result))
+
+    #
+    # Streaming report tests
+    #
+    def test_streaming_reports_match_lists(self):
+        # add test data
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        helper.add_author("first author")
+        helper.add_author("second author")
+        for number in range(1, 6):
+            helper.add_article("first author", "title {}".format(number),
+                               "slug{}".format(number))
+            for _ in range(number):
+                helper.add_log("/article/slug{}".format(number),
+                               timestamp=dt.datetime(
+                                   2020, 3, number,
+                                   tzinfo=DbReportTest._TZ_00))
+            helper.add_log("/", status="404 NOT FOUND",
+                           timestamp=dt.datetime(2020, 3, number,
+                                                 tzinfo=DbReportTest._TZ_00))
+
+        # run the test with fewer rows per fetch than rows in the reports
+        report = db_report.DbReport(DbReportTest._TEST_DB)
+        articles = report.iter_most_popular_articles(itersize=2)
+        self.assertNotIsInstance(articles, list)
+        self.assertListEqual(report.get_most_popular_articles(),
+                             list(articles))
+        self.assertListEqual(report.get_most_popular_articles(4),
+                             list(report.iter_most_popular_articles(4, 2)))
+        self.assertListEqual(report.get_most_popular_authors(),
+                             list(report.iter_most_popular_authors(None, 1)))
+        self.assertListEqual(
+            report.get_dates_wth_more_pct_errors(20),
+            list(report.iter_dates_wth_more_pct_errors(20, 2)))
+
+        result = report.run_all(2, None, 20)
+        streamed = list(report.iter_all(2, None, 20, itersize=2))
+        self.assertListEqual(
+            [("articles", row) for row in result.articles] +
+            [("authors", row) for row in result.authors] +
+            [("errors", row) for row in result.errors], streamed)
+
+    def test_streaming_report_can_be_abandoned(self):
+        # add test data
+        helper = \
+            db_report_test_helper.DbReportTestHelper(DbReportTest._TEST_DB)
+        helper.add_author("first author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("first author", "title two", "slug2")
+
+        # run the test
+        report = db_report.DbReport(DbReportTest._TEST_DB)
+        articles = report.iter_most_popular_articles(itersize=1)
+        self.assertEqual(0, next(articles)[1])
+        articles.close()
+        self.assertEqual(2, len(report.get_most_popular_articles()))
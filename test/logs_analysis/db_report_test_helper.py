@@ -1,5 +1,7 @@
 """Module containing helper code for testing db."""
 
+import os
+
 import psycopg2
 
 
@@ -9,6 +11,25 @@ class DbReportTestHelper:
     _ALL_TABLES = ["articles", "authors", "log"]
     _ALL_SEQUENCES = ["articles_id_seq", "authors_id_seq", "log_id_seq"]
 
+    _INIT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "init")
+
+    _ROLLUP_TABLES = ["article_hits_daily", "article_visitors_daily",
+                      "request_status_daily", "request_status_minutely",
+                      "rollup_state"]
+
+    _OPTIMIZER_INDEXES = ["log_article_hits_idx", "articles_slug_idx",
+                          "log_time_idx"]
+
+    _OPTIMIZER_STATISTICS = ["log_day_stats"]
+
+    _ARTICLE_IDS_SQL = """
+    drop trigger if exists articles_resolve_log_article_ids on articles;
+    drop trigger if exists log_resolve_article_id on log;
+    drop function if exists articles_resolve_log_article_ids();
+    drop function if exists log_resolve_article_id();
+    alter table log drop column if exists article_id;
+    drop table if exists article_ids_state"""
+
     def __init__(self, dbname):
         """Constructor
 
@@ -59,7 +80,8 @@ class DbReportTestHelper:
                                where name = %s""", (title, slug, author))
         test_db.close()
 
-    def add_log(self, path, method="GET", status="200 OK", timestamp=None):
+    def add_log(self, path, method="GET", status="200 OK", timestamp=None,
+                ip=None):
         """Add a access log entry into the database.
 
         Keyword arguments:
@@ -70,11 +92,56 @@ class DbReportTestHelper:
                   Optional. Defaults to "200 OK".
         timestamp -- the date/time the URL was accessed.
                      Optional. Defaults to time of insertion of row into db.
+        ip -- the address from which the URL was accessed. Optional.
+              Defaults to None.
         """
         with psycopg2.connect(dbname=self._dbname) as test_db:
             with test_db.cursor() as cursor:
                 cursor.execute(
-                    """INSERT INTO log (path, method, status, time)
-                    VALUES (%s, %s, %s, %s)""",
-                    (path, method, status, timestamp))
+                    """INSERT INTO log (path, method, status, time, ip)
+                    VALUES (%s, %s, %s, %s, %s)""",
+                    (path, method, status, timestamp, ip))
+        test_db.close()
+
+    def run_init_script(self, file_name):
+        """Runs one of the sql scripts in the project's init directory.
+
+        Keyword arguments:
+        file_name -- the name of the script within the init directory.
+                     Required.
+        """
+        with open(os.path.join(DbReportTestHelper._INIT_DIR,
+                               file_name)) as script:
+            sql = script.read()
+        with psycopg2.connect(dbname=self._dbname) as test_db:
+            with test_db.cursor() as cursor:
+                cursor.execute(sql)
+        test_db.close()
+
+    def drop_rollups(self):
+        """Drop the rollup tables, if they exist."""
+        with psycopg2.connect(dbname=self._dbname) as test_db:
+            with test_db.cursor() as cursor:
+                for table in DbReportTestHelper._ROLLUP_TABLES:
+                    cursor.execute("DROP TABLE IF EXISTS {}".format(table))
+        test_db.close()
+
+    def drop_schema_optimizations(self):
+        """Drop the indexes and statistics installed by the schema
+        optimizer, if they exist."""
+        with psycopg2.connect(dbname=self._dbname) as test_db:
+            with test_db.cursor() as cursor:
+                for index in DbReportTestHelper._OPTIMIZER_INDEXES:
+                    cursor.execute("DROP INDEX IF EXISTS {}".format(index))
+                for statistics in DbReportTestHelper._OPTIMIZER_STATISTICS:
+                    cursor.execute("DROP STATISTICS IF EXISTS {}"
+                                   .format(statistics))
+        test_db.close()
+
+    def drop_article_ids(self):
+        """Drop the article id column, its triggers and its state, if they
+        exist."""
+        with psycopg2.connect(dbname=self._dbname) as test_db:
+            with test_db.cursor() as cursor:
+                cursor.execute(DbReportTestHelper._ARTICLE_IDS_SQL)
         test_db.close()
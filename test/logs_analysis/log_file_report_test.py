@@ -0,0 +1,165 @@
+"""Tests for log_file_report module. Most tests only use temporary files, but
+the comparison with the database report is an integration test and requires
+that the test database has been created before it is run."""
+
+import datetime as dt
+import gzip
+import io
+import os
+import tempfile
+import unittest
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.log_file_report as log_file_report
+import logs_analysis.news_text_report as news_text_report
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+def _line(path, status=200, time="21/Mar/2020:10:15:32 +0000"):
+    return '10.0.0.1 - - [{}] "GET {} HTTP/1.1" {} 512\n'.format(
+        time, path, status)
+
+
+class LogFileReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _METADATA = log_file_report.Metadata(
+        [(1, 1, "slug1", "title one"), (2, 1, "slug2", "title two"),
+         (3, 2, "slug3", "title three")],
+        [(1, "first author"), (2, "second author"), (3, "third author")])
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, name, lines, compress=False):
+        path = os.path.join(self._dir.name, name)
+        opener = gzip.open if compress else open
+        with opener(path, "wt") as log_file:
+            log_file.writelines(lines)
+        return path
+
+    def _report(self, paths, **kwargs):
+        return log_file_report.LogFileReport(
+            paths, LogFileReportTest._METADATA, **kwargs)
+
+    #
+    # Parsing tests
+    #
+    def test_parse_lines_converts_day_to_utc(self):
+        records = list(log_file_report.parse_lines([
+            _line("/a", 404, "21/Mar/2020:23:30:00 -0100"),
+            _line("/b", 200, "21/Mar/2020:00:30:00 +0100")]))
+        self.assertEqual(
+            [("/a", False, dt.date(2020, 3, 22).toordinal()),
+             ("/b", True, dt.date(2020, 3, 20).toordinal())], records)
+
+    def test_parse_lines_yields_none_for_bad_lines(self):
+        records = list(log_file_report.parse_lines([
+            "garbage\n", _line("/a", 200, "31/Feb/2020:10:00:00 +0000")]))
+        self.assertEqual([None, None], records)
+
+    def test_parse_records_returns_log_table_rows(self):
+        records = list(log_file_report.parse_records([
+            _line("/a", 404, "21/Mar/2020:23:30:00 -0130"),
+            _line("/b", 200).replace("10.0.0.1", "host.example"),
+            "garbage\n"]))
+        self.assertEqual(
+            [("/a", "10.0.0.1", "GET", "404 NOT FOUND",
+              dt.datetime(2020, 3, 22, 1, 0,
+                          tzinfo=LogFileReportTest._TZ_00)),
+             ("/b", None, "GET", "200 OK",
+              dt.datetime(2020, 3, 21, 10, 15, 32,
+                          tzinfo=LogFileReportTest._TZ_00)),
+             None], records)
+
+    def test_count_lines_counts_ok_article_hits_and_daily_errors(self):
+        counts = log_file_report.count_lines([
+            _line("/article/slug1"), _line("/article/slug1"),
+            _line("/article/slug2", 404), _line("/"), "garbage\n"])
+        self.assertEqual({"slug1": 2}, dict(counts.hits))
+        self.assertEqual({dt.date(2020, 3, 21).toordinal(): [4, 1]},
+                         counts.days)
+        self.assertEqual(1, counts.bad_lines)
+
+    #
+    # Report tests
+    #
+    def test_reports_from_plain_and_gzip_files(self):
+        plain = self._write("access.log", [
+            _line("/article/slug1"), _line("/article/slug3")])
+        compressed = self._write("access.log.1.gz", [
+            _line("/article/slug1"), _line("/article/slug2", 404)],
+                                 compress=True)
+        report = self._report([plain, compressed], workers=1)
+        self.assertEqual([("title one", 2), ("title three", 1),
+                          ("title two", 0)],
+                         report.get_most_popular_articles())
+        self.assertEqual([("first author", 2)],
+                         report.get_most_popular_authors(1))
+        self.assertEqual([(dt.datetime(2020, 3, 21,
+                                       tzinfo=LogFileReportTest._TZ_00),
+                           25.0, 4)],
+                         report.get_dates_wth_more_pct_errors(1.0))
+
+    def test_chunks_in_process_pool_count_every_line_once(self):
+        lines = [_line("/article/slug{}".format(i % 3 + 1))
+                 for i in range(300)]
+        path = self._write("access.log", lines)
+        serial = self._report([path], workers=1)
+        parallel = self._report([path], workers=3, chunk_size=1000)
+        self.assertEqual(serial.load(), parallel.counts)
+        self.assertEqual(300, sum(parallel.counts.hits.values()))
+
+    def test_load_metadata_from_csv(self):
+        path = self._write("metadata.csv", [
+            "slug,title,author\n", "slug1,\"title, one\",first author\n",
+            ",,second author\n"])
+        metadata = log_file_report.load_metadata_from_csv(path)
+        self.assertEqual([(1, 1, "slug1", "title, one")], metadata.articles)
+        self.assertEqual([(1, "first author"), (2, "second author")],
+                         metadata.authors)
+
+    def test_text_report_matches_database_report(self):
+        helper = db_report_test_helper.DbReportTestHelper(
+            LogFileReportTest._TEST_DB)
+        helper.reset_database()
+        self.addCleanup(helper.reset_database)
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        timestamp = dt.datetime(2020, 3, 21, 10,
+                                tzinfo=LogFileReportTest._TZ_00)
+        lines = []
+        for path, status in [("/article/slug1", "200 OK"),
+                             ("/article/slug1", "200 OK"),
+                             ("/article/slug2", "200 OK"),
+                             ("/article/slug2", "404 NOT FOUND")]:
+            helper.add_log(path, status=status, timestamp=timestamp)
+            lines.append(_line(path, status[:3]))
+        path = self._write("access.log", lines)
+
+        with connection_provider.SingleConnectionProvider(
+                LogFileReportTest._TEST_DB) as provider:
+            db_out = io.StringIO()
+            news_text_report.NewsTextReport(
+                LogFileReportTest._TEST_DB, provider).report_all(db_out)
+            metadata = log_file_report.load_metadata_from_db(provider)
+        file_out = io.StringIO()
+        news_text_report.NewsTextReport(
+            LogFileReportTest._TEST_DB,
+            db_reporter=log_file_report.LogFileReport(
+                [path], metadata, workers=1)).report_all(file_out)
+        self.assertEqual(db_out.getvalue(), file_out.getvalue())
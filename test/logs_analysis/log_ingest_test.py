@@ -0,0 +1,114 @@
+"""Tests for log_ingest module. These are integration tests and require that
+the test database has been created before these tests are run."""
+
+import datetime as dt
+import unittest
+
+import psycopg2
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.log_ingest as log_ingest
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class LogIngesterTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _TIMESTAMP = dt.datetime(2020, 3, 21, 10, tzinfo=_TZ_00)
+
+    _INDEX_EXISTS_SQL = "select to_regclass('log_article_hits_idx')"
+
+    _CONSTRAINT_EXISTS_SQL = """
+    select exists (select 1 from pg_constraint
+                     where conname = 'log_method_check')"""
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.drop_schema_optimizations()
+
+    def setUp(self):
+        helper = db_report_test_helper.DbReportTestHelper(
+            LogIngesterTest._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_article("first author", "title one", "slug1")
+        self._provider = connection_provider.SingleConnectionProvider(
+            LogIngesterTest._TEST_DB)
+        self.addCleanup(self._provider.close)
+
+    def _records(self, count, path="/article/slug1"):
+        return [(path, "10.0.0.1", "GET", "200 OK",
+                 LogIngesterTest._TIMESTAMP) for _ in range(count)]
+
+    def _fetch_one(self, sql):
+        with self._provider.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+                return cursor.fetchone()[0]
+
+    def _execute(self, sql):
+        with self._provider.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql)
+
+    def test_ingest_loads_records_in_batches(self):
+        ingester = log_ingest.LogIngester(LogIngesterTest._TEST_DB,
+                                          self._provider, batch_rows=2)
+        result = ingester.ingest(self._records(5) + [None])
+        self.assertEqual((5, 3, 1), result[:3])
+        report = db_report.DbReport(LogIngesterTest._TEST_DB, self._provider)
+        self.assertEqual([("title one", 5)],
+                         report.get_most_popular_articles())
+
+    def test_ingest_escapes_copy_special_characters(self):
+        ingester = log_ingest.LogIngester(LogIngesterTest._TEST_DB,
+                                          self._provider)
+        ingester.ingest([("/a\\b\tc\nd", None, "GET", "200 OK",
+                          LogIngesterTest._TIMESTAMP)])
+        self.assertEqual("/a\\b\tc\nd",
+                         self._fetch_one("select path from log"))
+        self.assertIsNone(self._fetch_one("select ip from log"))
+
+    def test_ingest_loads_nothing_on_error(self):
+        ingester = log_ingest.LogIngester(LogIngesterTest._TEST_DB,
+                                          self._provider, batch_rows=1)
+        bad_ip = [("/", "not an ip", "GET", "200 OK",
+                   LogIngesterTest._TIMESTAMP)]
+        with self.assertRaises(psycopg2.Error):
+            ingester.ingest(self._records(2) + bad_ip)
+        self.assertEqual(0, self._fetch_one("select count(*) from log"))
+
+    def test_deferred_indexes_and_constraints_are_recreated(self):
+        with self._provider.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                create index if not exists log_article_hits_idx
+                  on log (substr(path, char_length('/article/') + 1))
+                  where path like '/article/%' and status = '200 OK'""")
+                cursor.execute("""
+                alter table log add constraint log_method_check
+                  check (method <> '')""")
+        self.addCleanup(self._execute, """
+        alter table log drop constraint if exists log_method_check""")
+        ingester = log_ingest.LogIngester(
+            LogIngesterTest._TEST_DB, self._provider, defer_indexes=True,
+            defer_constraints=True)
+        self.assertEqual(3, ingester.ingest(self._records(3)).rows)
+        self.assertEqual("log_article_hits_idx",
+                         self._fetch_one(LogIngesterTest._INDEX_EXISTS_SQL))
+        self.assertTrue(
+            self._fetch_one(LogIngesterTest._CONSTRAINT_EXISTS_SQL))
@@ -0,0 +1,121 @@
+"""Tests for log_watch module. These are integration tests and require that
+the test database has been created before these tests are run."""
+
+import datetime as dt
+import threading
+import unittest
+
+import psycopg2
+
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.log_watch as log_watch
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class LogWatcherTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _DAY = dt.datetime(2020, 3, 21, 10, tzinfo=_TZ_00)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database and add articles before each test is run"""
+        self.helper = \
+            db_report_test_helper.DbReportTestHelper(LogWatcherTest._TEST_DB)
+        self.helper.reset_database()
+        self.helper.add_author("first author")
+        self.helper.add_author("second author")
+        self.helper.add_article("first author", "title one", "slug1")
+        self.helper.add_article("second author", "title two", "slug2")
+        self.helper.add_log("/article/slug1", timestamp=self._DAY)
+        self.helper.add_log("/article/slug1", timestamp=self._DAY)
+        self.helper.add_log("/article/slug2", timestamp=self._DAY)
+
+    def test_snapshot_matches_db_report(self):
+        self.helper.add_log("/", status="404 NOT FOUND", timestamp=self._DAY)
+        watcher = log_watch.LogWatcher(LogWatcherTest._TEST_DB)
+        watcher.snapshot()
+        self.assertEqual(
+            db_report.DbReport(LogWatcherTest._TEST_DB,
+                               use_rollups=False).run_all(None, None, 0),
+            watcher.run_all(None, None, 0))
+
+    def test_polls_count_only_new_entries(self):
+        watcher = log_watch.LogWatcher(LogWatcherTest._TEST_DB)
+        self.assertEqual(3, watcher.poll())
+        high_water = watcher.high_water
+        self.assertEqual(0, watcher.poll())
+        self.helper.add_log("/article/slug2", timestamp=self._DAY)
+        self.helper.add_log("/article/slug2", timestamp=self._DAY)
+        self.helper.add_log("/", status="404 NOT FOUND", timestamp=self._DAY)
+        self.assertEqual(3, watcher.poll())
+        self.assertEqual(high_water + 3, watcher.high_water)
+        self.assertListEqual([("title two", 3), ("title one", 2)],
+                             watcher.get_most_popular_articles())
+        self.assertListEqual([("second author", 3)],
+                             watcher.get_most_popular_authors(1))
+        date = dt.datetime(2020, 3, 21, tzinfo=self._TZ_00)
+        self.assertListEqual([(date, 100 / 6, 6)],
+                             watcher.get_dates_wth_more_pct_errors(10))
+
+    def test_watch_generates_only_on_changes(self):
+        watcher = log_watch.LogWatcher(LogWatcherTest._TEST_DB)
+        results = watcher.watch(1, 1, 10, interval=0)
+        first = next(results)
+        self.assertListEqual([("title one", 2)], first.articles)
+        # the top 1 changes as the second article overtakes the first
+        self.helper.add_log("/article/slug1", timestamp=self._DAY)
+        for _ in range(3):
+            self.helper.add_log("/article/slug2", timestamp=self._DAY)
+        second = next(results)
+        self.assertListEqual([("title two", 4)], second.articles)
+        results.close()
+
+    def test_changes_of_counts_alone_are_not_shown(self):
+        date = dt.datetime(2020, 3, 21, tzinfo=self._TZ_00)
+        shown = db_report.ReportResult([("title", 2)], [("author", 2)],
+                                       [(date, 10.0, 10)])
+        counts = db_report.ReportResult([("title", 3)], [("author", 3)],
+                                        [(date, 20.0, 5)])
+        day_added = counts._replace(errors=counts.errors +
+                                    [(None, 50.0, 2)])
+        signature = log_watch.LogWatcher._signature
+        self.assertEqual(signature(shown), signature(counts))
+        self.assertNotEqual(signature(shown), signature(day_added))
+
+    def test_watch_wakes_on_notification(self):
+        watcher = log_watch.LogWatcher(LogWatcherTest._TEST_DB)
+        results = watcher.watch(1, None, 10, interval=60,
+                                channel="log_watch_test")
+        next(results)
+
+        def notify():
+            for _ in range(3):
+                self.helper.add_log("/article/slug2", timestamp=self._DAY)
+            with psycopg2.connect(dbname=LogWatcherTest._TEST_DB) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("notify log_watch_test")
+
+        timer = threading.Timer(0.2, notify)
+        timer.start()
+        try:
+            self.assertListEqual([("title two", 4)], next(results).articles)
+        finally:
+            timer.join()
+            results.close()
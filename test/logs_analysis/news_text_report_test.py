@@ -0,0 +1,158 @@
+"""Tests for news_text_report module. These are integration tests and require
+that the test database has been created and db structure created before
+these tests are run."""
+
+import contextlib
+import io
+import json
+import unittest
+import datetime as dt
+
+import psycopg2
+import psycopg2.extensions
+
+import logs_analysis.news_text_report as news_text_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class _TimingOutDbReport:
+    """A db reporter whose single query times out after its first row."""
+
+    @staticmethod
+    def iter_all(articles_limit, authors_limit, pct_errors):
+        # pylint: disable-msg=W0613
+        yield "articles", ("title one", 2)
+        raise psycopg2.extensions.QueryCanceledError(
+            "canceling statement due to statement timeout")
+
+
+@contextlib.contextmanager
+def _authors_locked(dbname):
+    """Holds an exclusive lock on the authors table, on which the authors
+    report waits until its statement timeout."""
+    with psycopg2.connect(dbname=dbname) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("lock table authors in access exclusive mode")
+            yield
+    conn.close()
+
+
+class NewsTextReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _EXPECTED_REPORT = """The most popular 2 articles are:
+'title one' - 2 views
+'title two' - 1 views
+
+The most popular authors are:
+'first author' - 3 views
+'second author' - 0 views
+
+The days on which more than 1.0% of requests led to errors:
+None
+"""
+
+    #
+    # Set up and tear down methods.
+    #
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("first author", "title two", "slug2")
+        helper.add_article("first author", "title three", "slug3")
+        timestamp = dt.datetime(2020, 3, 21, tzinfo=cls._TZ_00)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug2", timestamp=timestamp)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    #
+    # Report tests
+    #
+    def test_report_all(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB)
+        reporter.report_all(out, 2, None, 1.0)
+        self.assertEqual(NewsTextReportTest._EXPECTED_REPORT, out.getvalue())
+
+    def test_individual_reports_match_report_all(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB)
+        print(reporter.articles_heading(2), file=out)
+        reporter.report_most_popular_articles(out, 2)
+        print(reporter.authors_heading(), file=out)
+        reporter.report_most_popular_authors(out)
+        print(reporter.errors_heading(1.0), file=out)
+        reporter.report_get_dates_gt_errors_pct(out, 1.0)
+        self.assertEqual(NewsTextReportTest._EXPECTED_REPORT, out.getvalue())
+
+    def test_report_all_as_json_lines(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB, output_format="jsonl")
+        reporter.report_all(out, 1, None, 1.0)
+        self.assertListEqual(
+            [{"report": "articles", "title": "title one", "views": 2},
+             {"report": "authors", "name": "first author", "views": 3},
+             {"report": "authors", "name": "second author", "views": 0}],
+            [json.loads(line) for line in out.getvalue().splitlines()])
+
+    def test_unknown_format_is_rejected(self):
+        with self.assertRaises(ValueError):
+            news_text_report.NewsTextReport(NewsTextReportTest._TEST_DB,
+                                            output_format="xml")
+
+    def test_report_all_shows_timed_out_sections(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB, db_reporter=_TimingOutDbReport(),
+            output_format="jsonl")
+        reporter.report_all(out, 2, None, 1.0)
+        self.assertListEqual(
+            [{"report": "articles", "title": "title one", "views": 2},
+             {"report": "articles", "timed_out": True},
+             {"report": "authors", "timed_out": True},
+             {"report": "errors", "timed_out": True}],
+            [json.loads(line) for line in out.getvalue().splitlines()])
+
+    def test_query_cancelled_by_statement_timeout_is_shown(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB, statement_timeout=0.1)
+        with _authors_locked(NewsTextReportTest._TEST_DB):
+            reporter.report_most_popular_authors(out)
+        self.assertEqual("Timed out\n", out.getvalue())
+
+    def test_errors_heading_names_the_bucket(self):
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            NewsTextReportTest._TEST_DB, bucket="5m")
+        reporter.report_all(out, 2, None, 1.0)
+        self.assertIn("The 5 minute spans in which more than 1.0% of "
+                      "requests led to errors:\nNone\n", out.getvalue())
+        with self.assertRaises(ValueError):
+            news_text_report.NewsTextReport(NewsTextReportTest._TEST_DB,
+                                            bucket="week")
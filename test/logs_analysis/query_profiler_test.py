@@ -0,0 +1,100 @@
+"""Tests for query_profiler module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import io
+import json
+import time
+import unittest
+
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.news_text_report as news_text_report
+import logs_analysis.query_profiler as query_profiler
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class QueryProfilerTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        helper.add_log("/article/slug1")
+        helper.add_log("/article/slug1")
+        helper.add_log("/article/slug2")
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def test_nested_phases_are_excluded_from_their_parent(self):
+        profiler = query_profiler.QueryProfiler()
+        with profiler.phase("report", "render"):
+            with profiler.phase("report", "fetch"):
+                time.sleep(0.05)
+        profile, = profiler.profiles()
+        self.assertEqual("report", profile.report)
+        self.assertGreaterEqual(profile.phases["fetch"], 0.05)
+        self.assertLess(profile.phases["render"], 0.05)
+
+    def test_reports_are_profiled(self):
+        profiler = query_profiler.QueryProfiler()
+        report = db_report.DbReport(QueryProfilerTest._TEST_DB,
+                                    use_rollups=False)
+        report.profiler = profiler
+        self.assertListEqual([("title one", 2)],
+                             report.get_most_popular_articles(1))
+        self.assertListEqual([("first author", 2), ("second author", 1)],
+                             list(report.iter_most_popular_authors()))
+        articles, authors = profiler.profiles()
+        self.assertEqual("articles", articles.report)
+        self.assertEqual(1, articles.rows)
+        self.assertEqual(len("title one") + len("2"), articles.bytes)
+        self.assertEqual(1, articles.statements)
+        self.assertGreater(articles.phases["plan"], 0)
+        self.assertGreater(articles.phases["execute"], 0)
+        self.assertListEqual([], articles.plans)
+        self.assertEqual(2, authors.rows)
+        self.assertGreater(authors.phases["fetch"], 0)
+
+    def test_explain_captures_plans(self):
+        profiler = query_profiler.QueryProfiler(explain=True)
+        report = db_report.DbReport(QueryProfilerTest._TEST_DB,
+                                    use_rollups=False)
+        report.profiler = profiler
+        report.run_all(1, 1, 1.0)
+        profile, = profiler.profiles()
+        self.assertEqual("all", profile.report)
+        plan, = profile.plans
+        self.assertIn("Execution Time", plan[0])
+        self.assertIn("Shared Hit Blocks", plan[0]["Plan"])
+        self.assertIn("all: planning", profiler.format_table())
+
+    def test_text_report_rendering_is_profiled(self):
+        profiler = query_profiler.QueryProfiler()
+        report = news_text_report.NewsTextReport(QueryProfilerTest._TEST_DB,
+                                                 profiler=profiler)
+        report.report_all(io.StringIO(), 1, 1, 1.0)
+        profiles = json.loads(profiler.to_json())["reports"]
+        self.assertListEqual(["all", "articles", "authors", "errors"],
+                             [profile["report"] for profile in profiles])
+        self.assertEqual(2, profiles[0]["rows"])
+        self.assertGreater(profiles[1]["phases"]["render"], 0)
+        self.assertEqual(profiles[1]["phases"]["render"],
+                         profiles[1]["total"])
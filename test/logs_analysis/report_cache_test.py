@@ -0,0 +1,185 @@
+"""Tests for report_cache module. The tests of CachedDbReport are integration
+tests and require that the test database has been created and db structure
+created before these tests are run."""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.report_cache as report_cache
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class ReportCacheTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    #
+    # Set up and tear down methods.
+    #
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database and create a cache directory before each
+        test."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(ReportCacheTest._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_log("/article/slug1")
+        self._cache_dir = tempfile.mkdtemp()
+        self._cache_path = os.path.join(self._cache_dir, "cache.db")
+
+    def tearDown(self):
+        shutil.rmtree(self._cache_dir)
+
+    #
+    # ReportCache tests
+    #
+    def test_memory_tier_hits_and_misses(self):
+        with report_cache.ReportCache() as cache:
+            self.assertTupleEqual((False, None), cache.get("key", "v1"))
+            cache.put("key", "v1", [("title", 1)])
+            self.assertTupleEqual((True, [("title", 1)]),
+                                  cache.get("key", "v1"))
+            self.assertTupleEqual((False, None), cache.get("key", "v2"))
+            self.assertTupleEqual((1, 0, 2), cache.stats)
+
+    def test_disk_tier_is_shared_between_caches(self):
+        with report_cache.ReportCache(self._cache_path) as cache:
+            cache.put("key", "v1", [("title", 1)])
+        with report_cache.ReportCache(self._cache_path) as cache:
+            self.assertTupleEqual((True, [("title", 1)]),
+                                  cache.get("key", "v1"))
+            self.assertTupleEqual((True, [("title", 1)]),
+                                  cache.get("key", "v1"))
+            self.assertTupleEqual((1, 1, 0), cache.stats)
+
+    def test_entries_expire(self):
+        with report_cache.ReportCache(self._cache_path, ttl=0.05) as cache:
+            cache.put("key", "v1", 1)
+            time.sleep(0.1)
+            self.assertTupleEqual((False, None), cache.get("key", "v1"))
+
+    def test_least_recently_used_entries_are_evicted_from_memory(self):
+        with report_cache.ReportCache(max_entries=2) as cache:
+            cache.put("a", "v1", 1)
+            cache.put("b", "v1", 2)
+            cache.get("a", "v1")
+            cache.put("c", "v1", 3)
+            self.assertTupleEqual((True, 1), cache.get("a", "v1"))
+            self.assertTupleEqual((False, None), cache.get("b", "v1"))
+            self.assertTupleEqual((True, 3), cache.get("c", "v1"))
+
+    def test_clear_removes_entries_from_both_tiers(self):
+        with report_cache.ReportCache(self._cache_path) as cache:
+            cache.put("key", "v1", 1)
+            cache.clear()
+            self.assertTupleEqual((False, None), cache.get("key", "v1"))
+
+    def test_unreadable_disk_entries_are_removed_and_missed(self):
+        with report_cache.ReportCache(self._cache_path) as cache:
+            cache.put("key", "v1", [("title", 1)])
+        with sqlite3.connect(self._cache_path) as disk:
+            disk.execute("update report_cache set value = ?",
+                         (b"not a pickle",))
+        disk.close()
+        with report_cache.ReportCache(self._cache_path) as cache:
+            self.assertTupleEqual((False, None), cache.get("key", "v1"))
+            self.assertTupleEqual((0, 0, 1), cache.stats)
+        with sqlite3.connect(self._cache_path) as disk:
+            self.assertEqual(0, disk.execute(
+                "select count(*) from report_cache").fetchone()[0])
+        disk.close()
+
+    #
+    # CachedDbReport tests
+    #
+    def test_cached_report_is_reused(self):
+        with report_cache.ReportCache(self._cache_path) as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache)
+            self.assertListEqual([("title one", 1)],
+                                 report.get_most_popular_articles())
+            self.assertListEqual([("title one", 1)],
+                                 report.get_most_popular_articles())
+            self.assertListEqual([("first author", 1)],
+                                 list(report.iter_most_popular_authors()))
+            self.assertTupleEqual((1, 0, 2), cache.stats)
+
+    def test_cached_report_is_keyed_by_parameters(self):
+        with report_cache.ReportCache() as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache)
+            self.assertEqual(1, len(report.get_dates_wth_more_pct_errors(-1)))
+            self.assertEqual(0, len(report.get_dates_wth_more_pct_errors(1)))
+            self.assertTupleEqual((0, 0, 2), cache.stats)
+
+    def test_cached_report_is_keyed_by_server(self):
+        provider = connection_provider.DirectConnectionProvider(
+            ReportCacheTest._TEST_DB)
+        with provider.connection() as news_db:
+            host = news_db.info.host
+        if not host.startswith("/"):
+            self.skipTest("the test database is not on a unix socket")
+        # the same server, by another name, stands in for another server
+        other_provider = connection_provider.DirectConnectionProvider(
+            ReportCacheTest._TEST_DB, host=os.path.join(host, ""))
+        with report_cache.ReportCache() as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache, provider)
+            other_report = report_cache.CachedDbReport(
+                ReportCacheTest._TEST_DB, cache, other_provider)
+            self.assertEqual(report.get_most_popular_articles(),
+                             other_report.get_most_popular_articles())
+            self.assertTupleEqual((0, 0, 2), cache.stats)
+
+    def test_cached_report_is_invalidated_by_new_log_entries(self):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(ReportCacheTest._TEST_DB)
+        with report_cache.ReportCache() as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache)
+            result = report.run_all(3, None, 1.0)
+            helper.add_log("/article/slug1")
+            self.assertNotEqual(result, report.run_all(3, None, 1.0))
+            self.assertListEqual([("title one", 2)],
+                                 report.run_all(3, None, 1.0).articles)
+            self.assertTupleEqual((1, 0, 2), cache.stats)
+
+    def test_cached_report_is_invalidated_by_truncation(self):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(ReportCacheTest._TEST_DB)
+        with report_cache.ReportCache() as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache)
+            self.assertEqual(1, len(report.get_dates_wth_more_pct_errors(-1)))
+            helper.reset_database()
+            self.assertEqual(0, len(report.get_dates_wth_more_pct_errors(-1)))
+
+    def test_cached_streaming_all_matches_run_all(self):
+        with report_cache.ReportCache() as cache:
+            report = report_cache.CachedDbReport(ReportCacheTest._TEST_DB,
+                                                 cache)
+            result = report.run_all(3, None, -1)
+            self.assertListEqual(
+                [("articles", row) for row in result.articles] +
+                [("authors", row) for row in result.authors] +
+                [("errors", row) for row in result.errors],
+                list(report.iter_all(3, None, -1)))
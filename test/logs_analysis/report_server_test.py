@@ -0,0 +1,119 @@
+"""Tests for report_server module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.report_server as report_server
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class ReportServerTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    def setUp(self):
+        """Add the test data and start a server on a free port."""
+        self.helper = \
+            db_report_test_helper.DbReportTestHelper(ReportServerTest._TEST_DB)
+        self.helper.reset_database()
+        self.helper.add_author("first author")
+        self.helper.add_author("second author")
+        self.helper.add_article("first author", "title one", "slug1")
+        self.helper.add_article("second author", "title two", "slug2")
+        timestamp = dt.datetime(2020, 3, 21, tzinfo=ReportServerTest._TZ_00)
+        self.helper.add_log("/article/slug1", timestamp=timestamp)
+        self.helper.add_log("/article/slug1", timestamp=timestamp)
+        self.helper.add_log("/article/slug2", timestamp=timestamp)
+        self.helper.add_log("/", status="404 NOT FOUND", timestamp=timestamp)
+
+        self.pool = connection_provider.PooledConnectionProvider(
+            ReportServerTest._TEST_DB, max_size=2)
+        # the background thread is left to the tests, which call poll
+        self.server = report_server.ReportServer(
+            ReportServerTest._TEST_DB, self.pool, port=0,
+            poll_interval=3600)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        """Stop the server and reset the database."""
+        self.server.shutdown()
+        self.thread.join()
+        self.pool.close()
+        self.helper.reset_database()
+
+    def _get(self, path):
+        url = "http://{}:{}{}".format(*self.server.server_address, path)
+        try:
+            with urllib.request.urlopen(url) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as exp:
+            return exp.code, json.loads(exp.read())
+
+    def test_reports_are_served_as_json(self):
+        status, body = self._get("/reports?articles=1&errors=20")
+        self.assertEqual(200, status)
+        self.assertListEqual([{"title": "title one", "views": 2}],
+                             body["articles"])
+        self.assertListEqual([{"name": "first author", "views": 2},
+                              {"name": "second author", "views": 1}],
+                             body["authors"])
+        self.assertListEqual([{"date": "2020-03-21T00:00:00+00:00",
+                               "pct_errors": 25.0, "requests": 4}],
+                             body["errors"])
+
+    def test_default_results_are_precomputed_and_held(self):
+        self._get("/reports")
+        self._get("/reports?articles=3")
+        self._get("/reports?articles=2")
+        status, stats = self._get("/stats")
+        self.assertEqual(200, status)
+        # only articles=2 was computed for a request
+        self.assertEqual(1, stats["misses"])
+        self.assertEqual(3, stats["requests"])
+        self.assertEqual(2, stats["results"])
+        self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+
+    def test_results_are_refreshed_when_the_log_grows(self):
+        self._get("/stats")  # answered once the server has started
+        self.assertFalse(self.server.poll())
+        self.helper.add_log("/article/slug2")
+        self.helper.add_log("/article/slug2")
+        # held until refreshed
+        self.assertEqual(1, self._get("/reports")[1]["articles"][1]["views"])
+        self.assertTrue(self.server.poll())
+        self.assertEqual("title two",
+                         self._get("/reports")[1]["articles"][0]["title"])
+        self.assertEqual(1, self._get("/stats")[1]["refreshes"])
+
+    def test_invalid_requests_are_rejected(self):
+        self.assertEqual(400, self._get("/reports?articles=many")[0])
+        self.assertEqual(400, self._get("/reports?top=3")[0])
+        self.assertEqual(400, self._get("/reports?since=2020-01-01&"
+                                        "last=1d")[0])
+        self.assertEqual(400, self._get("/reports?last=1y")[0])
+        self.assertEqual(400, self._get("/reports?bucket=week")[0])
+        self.assertEqual(404, self._get("/articles")[0])
+
+    def test_params_mirror_the_command_line(self):
+        params = report_server.ReportServer.parse_params(
+            "articles=5&authors=2&errors=2.5&until=2020-03-22&last=2w&"
+            "bucket=hour")
+        self.assertEqual(report_server.ReportParams(
+            5, 2, 2.5, None, "2020-03-22", "2w", "hour"), params)
+        self.assertEqual(report_server.DEFAULT_PARAMS,
+                         report_server.ReportServer.parse_params(""))
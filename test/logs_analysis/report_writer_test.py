@@ -0,0 +1,151 @@
+"""Tests for report_writer module."""
+
+import csv
+import datetime as dt
+import io
+import json
+import unittest
+
+import logs_analysis.report_writer as report_writer
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class _FlushCountingIO(io.StringIO):
+    """A StringIO that records the length of its value at each flush."""
+
+    def __init__(self):
+        super().__init__()
+        self.flushed_at = []
+
+    def flush(self):
+        self.flushed_at.append(len(self.getvalue()))
+        super().flush()
+
+
+class ReportWriterTest(unittest.TestCase):
+    """Test cases"""
+
+    _DATE = dt.datetime(2020, 3, 21, tzinfo=dt.timezone.utc)
+
+    _REPORTS = [
+        ("articles", "Articles:", [("title, one", 2), ("title two", 1)]),
+        ("authors", None, []),
+        ("errors", "Errors:", [(_DATE, 25.0, 4)])]
+
+    def _write(self, writer_class, out):
+        writer = writer_class(out)
+        for name, heading, rows in ReportWriterTest._REPORTS:
+            writer.begin(name, heading)
+            for row in rows:
+                writer.row(name, row)
+            writer.end(name)
+        return out.getvalue()
+
+    def test_text(self):
+        self.assertEqual(
+            "Articles:\n'title, one' - 2 views\n'title two' - 1 views\n\n"
+            "None\n"
+            "Errors:\nSat 21 March 2020 - 25.00% errors out of 4 requests\n"
+            "\n",
+            self._write(report_writer.TextWriter, io.StringIO()))
+
+    def test_text_shows_the_time_of_buckets_finer_than_a_day(self):
+        out = io.StringIO()
+        writer = report_writer.TextWriter(out, "hour")
+        writer.row("errors", (ReportWriterTest._DATE.replace(hour=13), 25.0,
+                              4))
+        self.assertEqual(
+            "Sat 21 March 2020 13:00 - 25.00% errors out of 4 requests\n",
+            out.getvalue())
+
+    def test_csv(self):
+        rows = list(csv.DictReader(io.StringIO(
+            self._write(report_writer.CsvWriter, io.StringIO()))))
+        self.assertEqual(3, len(rows))
+        self.assertEqual(("articles", "title, one", "2", ""),
+                         (rows[0]["report"], rows[0]["name"],
+                          rows[0]["views"], rows[0]["date"]))
+        self.assertEqual(("errors", "", "2020-03-21T00:00:00+00:00", "25.0",
+                          "4"),
+                         (rows[2]["report"], rows[2]["name"],
+                          rows[2]["date"], rows[2]["pct_errors"],
+                          rows[2]["requests"]))
+
+    def test_json_lines(self):
+        lines = self._write(report_writer.JsonLinesWriter,
+                            io.StringIO()).splitlines()
+        self.assertListEqual(
+            [{"report": "articles", "title": "title, one", "views": 2},
+             {"report": "articles", "title": "title two", "views": 1},
+             {"report": "errors", "date": "2020-03-21T00:00:00+00:00",
+              "pct_errors": 25.0, "requests": 4}],
+            [json.loads(line) for line in lines])
+
+    def test_estimated_rows(self):
+        out = io.StringIO()
+        writer = report_writer.JsonLinesWriter(out)
+        writer.row("authors", ("name", 10, 3))
+        writer.row("errors", (None, 50.0, 8, 20.0, 80.0, True))
+        self.assertListEqual(
+            [{"report": "authors", "name": "name", "views": 10,
+              "margin": 3},
+             {"report": "errors", "date": None, "pct_errors": 50.0,
+              "requests": 8, "pct_errors_low": 20.0,
+              "pct_errors_high": 80.0, "uncertain": True}],
+            [json.loads(line) for line in out.getvalue().splitlines()])
+
+    def test_visitors_rows(self):
+        for writer_class, expected in [
+                (report_writer.TextWriter,
+                 "'first' - 1,200 views by about 300 visitors\n"),
+                (report_writer.JsonLinesWriter,
+                 '{"report": "authors", "name": "first", "views": 1200, '
+                 '"visitors": 300}\n'),
+                (report_writer.CsvWriter,
+                 ",".join(report_writer.CsvWriter.COLUMNS) + "\r\n"
+                 "authors,first,1200,,300,,,,,,,\r\n")]:
+            out = io.StringIO()
+            writer_class(out, visitors=True).row("authors",
+                                                 ("first", 1200, 300))
+            self.assertEqual(expected, out.getvalue())
+
+    def test_timed_out(self):
+        for writer_class, expected in [
+                (report_writer.TextWriter,
+                 "Articles:\n'title one' - 2 views\nTimed out\n\n"
+                 "Errors:\nTimed out\n"),
+                (report_writer.JsonLinesWriter,
+                 '{"report": "articles", "title": "title one", "views": 2}\n'
+                 '{"report": "articles", "timed_out": true}\n'
+                 '{"report": "errors", "timed_out": true}\n')]:
+            out = io.StringIO()
+            writer = writer_class(out)
+            writer.begin("articles", "Articles:")
+            writer.row("articles", ("title one", 2))
+            writer.timed_out("articles")
+            writer.timed_out("errors", "Errors:")
+            self.assertEqual(expected, out.getvalue())
+
+    def test_csv_timed_out(self):
+        out = io.StringIO()
+        report_writer.CsvWriter(out).timed_out("authors")
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual([("authors", "", "True")],
+                         [(row["report"], row["name"], row["timed_out"])
+                          for row in rows])
+
+    def test_first_row_of_each_report_is_flushed(self):
+        out = _FlushCountingIO()
+        writer = report_writer.TextWriter(out)
+        writer.begin("authors", "Authors:")
+        self.assertListEqual([], out.flushed_at)
+        writer.row("authors", ("first", 2))
+        writer.row("authors", ("second", 1))
+        self.assertListEqual([len("Authors:\n'first' - 2 views\n")],
+                             out.flushed_at)
+        writer.end("authors")
+        self.assertEqual(len(out.getvalue()), out.flushed_at[-1])
@@ -0,0 +1,242 @@
+"""Tests for rollup module and for the reports answered from the rollups.
+These are integration tests and require that the test database has been
+created and db structure created before these tests are run."""
+
+import unittest
+import datetime as dt
+
+import psycopg2
+
+import logs_analysis.db_report as db_report
+import logs_analysis.rollup as rollup
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class RollupTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    #
+    # Set up and tear down methods.
+    #
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the rollups and reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.drop_rollups()
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database and the rollups before each test is run"""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        helper.reset_database()
+        helper.drop_rollups()
+        helper.run_init_script("createRollups.sql")
+
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_author("third author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        helper.add_article("second author", "title three", "slug3")
+
+    def _add_logs(self, day, errors):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        timestamp = dt.datetime(2020, 3, day, 12, tzinfo=RollupTest._TZ_00)
+        for _ in range(4):
+            helper.add_log("/article/slug1", timestamp=timestamp)
+        helper.add_log("/article/slug2", timestamp=timestamp)
+        for _ in range(errors):
+            helper.add_log("/article/slug2", status="404 NOT FOUND",
+                           timestamp=timestamp)
+        helper.add_log("/", timestamp=timestamp)
+        helper.add_log("/article/slug3")
+        helper.add_log("/article/slug3")
+
+    def _assert_rollups_match_views(self, since=None, until=None):
+        from_rollups = db_report.DbReport(RollupTest._TEST_DB,
+                                          use_rollups=True, since=since,
+                                          until=until)
+        from_views = db_report.DbReport(RollupTest._TEST_DB,
+                                        use_rollups=False, since=since,
+                                        until=until)
+        self.assertListEqual(from_views.get_most_popular_articles(),
+                             from_rollups.get_most_popular_articles())
+        self.assertListEqual(from_views.get_most_popular_authors(),
+                             from_rollups.get_most_popular_authors())
+        self.assertEqual(from_views.run_all(2, 2, 0),
+                         from_rollups.run_all(2, 2, 0))
+        for bucket in db_report.DbReport.BUCKETS:
+            from_rollups = db_report.DbReport(
+                RollupTest._TEST_DB, use_rollups=True, since=since,
+                until=until, bucket=bucket)
+            from_views = db_report.DbReport(
+                RollupTest._TEST_DB, use_rollups=False, since=since,
+                until=until, bucket=bucket)
+            self.assertCountEqual(
+                from_views.get_dates_wth_more_pct_errors(0),
+                from_rollups.get_dates_wth_more_pct_errors(0))
+            self.assertCountEqual(from_views.get_daily_request_counts(),
+                                  from_rollups.get_daily_request_counts())
+
+    #
+    # Refresh tests
+    #
+    def test_refresh_rolls_up_log_entries(self):
+        self._add_logs(21, 1)
+        result = rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self.assertTupleEqual((0, 9, 9), result)
+        self._assert_rollups_match_views()
+
+        report = db_report.DbReport(RollupTest._TEST_DB)
+        self.assertListEqual(
+            [("title one", 4), ("title three", 2), ("title two", 1)],
+            report.get_most_popular_articles())
+        self.assertListEqual(
+            [("first author", 4), ("second author", 3), ("third author", 0)],
+            report.get_most_popular_authors())
+        self.assertListEqual(
+            [(dt.datetime(2020, 3, 21, tzinfo=RollupTest._TZ_00), 100 / 7,
+              7)],
+            report.get_dates_wth_more_pct_errors(1))
+
+    def test_refresh_is_incremental(self):
+        self._add_logs(21, 1)
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self._add_logs(21, 1)
+        self._add_logs(22, 2)
+        result = rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self.assertTupleEqual((9, 28, 19), result)
+        self._assert_rollups_match_views()
+
+    def test_refresh_with_no_new_entries(self):
+        self._add_logs(21, 1)
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        result = rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self.assertTupleEqual((9, 9, 0), result)
+
+    #
+    # Report tests
+    #
+    def test_reports_include_entries_added_since_refresh(self):
+        self._add_logs(21, 1)
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self._add_logs(22, 2)
+        self._assert_rollups_match_views()
+
+    def test_reports_before_first_refresh(self):
+        self._add_logs(21, 1)
+        self._add_logs(22, 2)
+        self._assert_rollups_match_views()
+
+    def test_finer_buckets_are_summed_from_minutes(self):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        for hour, minute, status in [(12, 1, "200 OK"),
+                                     (12, 3, "404 NOT FOUND"),
+                                     (12, 7, "200 OK"),
+                                     (13, 30, "404 NOT FOUND")]:
+            helper.add_log("/", status=status, timestamp=dt.datetime(
+                2020, 3, 21, hour, minute, tzinfo=RollupTest._TZ_00))
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        helper.add_log("/", timestamp=dt.datetime(
+            2020, 3, 21, 13, 31, tzinfo=RollupTest._TZ_00))
+        self._assert_rollups_match_views()
+
+        report = db_report.DbReport(RollupTest._TEST_DB, bucket="hour")
+        self.assertListEqual(
+            [(dt.datetime(2020, 3, 21, 13, tzinfo=RollupTest._TZ_00), 50.0,
+              2),
+             (dt.datetime(2020, 3, 21, 12, tzinfo=RollupTest._TZ_00),
+              100 / 3, 3)],
+            report.get_dates_wth_more_pct_errors(1))
+
+    def test_init_script_fills_minutes_of_earlier_rollups(self):
+        self._add_logs(21, 1)
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        self._add_logs(22, 2)
+        # as installed before the per minute rollups were added
+        with psycopg2.connect(dbname=RollupTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("drop table request_status_minutely")
+        conn.close()
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        helper.run_init_script("createRollups.sql")
+        self._assert_rollups_match_views()
+        # and running it again changes nothing
+        helper.run_init_script("createRollups.sql")
+        self._assert_rollups_match_views()
+
+    def test_time_window_sums_rollups_of_whole_spans(self):
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        for day in [21, 22, 23]:
+            self._add_logs(day, day - 20)
+        for hour, minute, second in [(0, 0, 0), (6, 30, 15), (6, 30, 45),
+                                     (23, 59, 59)]:
+            helper.add_log("/article/slug2", status="404 NOT FOUND",
+                           timestamp=dt.datetime(2020, 3, 22, hour, minute,
+                                                 second,
+                                                 tzinfo=RollupTest._TZ_00))
+        rollup.Rollup(RollupTest._TEST_DB).refresh()
+        helper.add_log("/article/slug1", timestamp=dt.datetime(
+            2020, 3, 22, 18, tzinfo=RollupTest._TZ_00))
+
+        def time(day, hour=0, minute=0, second=0):
+            return dt.datetime(2020, 3, day, hour, minute, second,
+                               tzinfo=RollupTest._TZ_00)
+
+        for since, until in [
+                (time(22), None),
+                (None, time(23)),
+                (time(22), time(23)),
+                (time(21, 12, 0, 1), time(23, 12)),
+                (time(22, 6, 30), time(22, 6, 31)),
+                (time(22, 6, 30, 30), time(22, 6, 30, 50)),
+                # naive times are in the session's time zone
+                (dt.datetime(2020, 3, 22), dt.datetime(2020, 3, 22, 6))]:
+            with self.subTest(since=since, until=until):
+                self.assertTrue(db_report.DbReport(
+                    RollupTest._TEST_DB, since=since,
+                    until=until).uses_rollups())
+                self._assert_rollups_match_views(since, until)
+
+        # the rollups of the whole days, and only those, are read
+        with psycopg2.connect(dbname=RollupTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("update article_hits_daily set hits = 100 "
+                               "where slug = 'slug1' and date = %s",
+                               (time(22),))
+        conn.close()
+        for since, until, hits in [(time(22), time(23), 101),
+                                   (time(21), None, 109),
+                                   (time(22), time(22, 20), 5),
+                                   (time(22, 0, 0, 1), time(23), 5)]:
+            report = db_report.DbReport(RollupTest._TEST_DB, since=since,
+                                        until=until)
+            self.assertEqual([("title one", hits)],
+                             report.get_most_popular_articles(1))
+
+    def test_rollups_used_only_when_installed(self):
+        report = db_report.DbReport(RollupTest._TEST_DB)
+        self.assertTrue(report.uses_rollups())
+        self.assertTrue(rollup.Rollup(RollupTest._TEST_DB).is_installed())
+
+        helper = \
+            db_report_test_helper.DbReportTestHelper(RollupTest._TEST_DB)
+        helper.drop_rollups()
+        report = db_report.DbReport(RollupTest._TEST_DB)
+        self.assertFalse(report.uses_rollups())
+        self.assertFalse(rollup.Rollup(RollupTest._TEST_DB).is_installed())
@@ -0,0 +1,78 @@
+"""Tests for schema_optimizer module. These are integration tests and require
+that the test database has been created and db structure created before
+these tests are run."""
+
+import unittest
+
+import logs_analysis.db_report as db_report
+import logs_analysis.schema_optimizer as schema_optimizer
+import logs_analysis.db_report_test_helper as db_report_test_helper
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class SchemaOptimizerTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    #
+    # Set up and tear down methods.
+    #
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the optimizations and reset database once all tests have
+        run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.drop_schema_optimizations()
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database and drop optimizations before each test."""
+        helper = db_report_test_helper.DbReportTestHelper(
+            SchemaOptimizerTest._TEST_DB)
+        helper.reset_database()
+        helper.drop_schema_optimizations()
+        helper.add_author("first author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("first author", "title two", "slug2")
+        helper.add_log("/article/slug1")
+        helper.add_log("/article/slug1")
+        helper.add_log("/article/slug2")
+        helper.add_log("/article/slug2", status="404 NOT FOUND")
+
+    #
+    # Optimize tests
+    #
+    def test_optimize_installs_structures_and_estimates_costs(self):
+        optimizer = schema_optimizer.SchemaOptimizer(
+            SchemaOptimizerTest._TEST_DB)
+        result = optimizer.optimize(3, None, 1.0)
+        self.assertIn("log_article_hits_idx", result.created)
+        self.assertIn("articles_slug_idx", result.created)
+        self.assertListEqual(["articles", "authors", "errors"],
+                             list(result.costs_before.keys()))
+        self.assertListEqual(["articles", "authors", "errors"],
+                             list(result.costs_after.keys()))
+        for cost in result.costs_after.values():
+            self.assertGreater(cost, 0)
+
+    def test_optimize_is_idempotent(self):
+        optimizer = schema_optimizer.SchemaOptimizer(
+            SchemaOptimizerTest._TEST_DB)
+        optimizer.optimize()
+        result = optimizer.optimize()
+        self.assertListEqual([], result.created)
+
+    def test_reports_unchanged_by_optimize(self):
+        report = db_report.DbReport(SchemaOptimizerTest._TEST_DB)
+        before = report.run_all(None, None, 0)
+        schema_optimizer.SchemaOptimizer(
+            SchemaOptimizerTest._TEST_DB).optimize()
+        self.assertEqual(before, report.run_all(None, None, 0))
+        self.assertListEqual([("title one", 2), ("title two", 1)],
+                             report.get_most_popular_articles())
@@ -0,0 +1,101 @@
+"""Tests for sharded_report module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import unittest
+
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.query_profiler as query_profiler
+import logs_analysis.sharded_report as sharded_report
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+# pylint: disable-msg=W0212
+
+
+class ShardedDbReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    _DAY = dt.datetime(2020, 3, 21, tzinfo=_TZ_00)
+
+    @classmethod
+    def setUpClass(cls):
+        """Add the test data once, as it is only read by these tests."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("second author", "title two", "slug2")
+        helper.add_log("/article/slug1", timestamp=cls._DAY)
+        helper.add_log("/article/slug1", timestamp=cls._DAY)
+        helper.add_log("/article/slug2", timestamp=cls._DAY)
+        helper.add_log("/", status="404 NOT FOUND", timestamp=cls._DAY)
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.reset_database()
+
+    def test_shards_are_added_up(self):
+        # the same database twice is a log sharded into two equal halves
+        report = sharded_report.ShardedDbReport(
+            [ShardedDbReportTest._TEST_DB] * 2)
+        self.assertListEqual([("title one", 4)],
+                             report.get_most_popular_articles(1))
+        self.assertListEqual([("first author", 4), ("second author", 2)],
+                             report.get_most_popular_authors())
+        self.assertListEqual([(self._DAY, 25.0, 8)],
+                             report.get_dates_wth_more_pct_errors(20))
+        self.assertEqual(
+            db_report.ReportResult([("title one", 4)], [("first author", 4)],
+                                   [(self._DAY, 25.0, 8)]),
+            report.run_all(1, 1, 20))
+        self.assertListEqual(
+            [("articles", ("title one", 4)), ("authors", ("first author", 4)),
+             ("errors", (self._DAY, 25.0, 8))],
+            list(report.iter_all(1, 1, 20)))
+
+    def test_shards_are_profiled(self):
+        profiler = query_profiler.QueryProfiler()
+        report = sharded_report.ShardedDbReport(
+            [ShardedDbReportTest._TEST_DB] * 2)
+        report.profiler = profiler
+        report.get_most_popular_articles()
+        profile, = profiler.profiles()
+        self.assertEqual(2, profile.statements)
+
+    def test_errors_are_counted_before_the_threshold(self):
+        # 50% of one shard's requests failed but only 10% of the day's
+        counts = [[(self._DAY, 2, 1)], [(self._DAY, 8, 0)]]
+        self.assertListEqual(
+            [], db_report.DbReport.dates_wth_more_pct_errors(
+                sharded_report.ShardedDbReport._chain(counts), 20))
+        self.assertListEqual(
+            [(self._DAY, 10.0, 10)],
+            db_report.DbReport.dates_wth_more_pct_errors(
+                sharded_report.ShardedDbReport._chain(counts), 5))
+
+    def test_top_n_is_taken_after_merging(self):
+        parts = [[("a", 5), ("b", 4), ("c", 0)], [("c", 9), ("b", 2)]]
+        self.assertListEqual(
+            [("c", 9), ("b", 6)],
+            sharded_report.ShardedDbReport._merge_views(parts, 2))
+
+    def test_patterns_are_expanded(self):
+        self.assertListEqual(
+            [ShardedDbReportTest._TEST_DB, "other"],
+            sharded_report.expand_dbnames(["news_tes?", "other",
+                                           ShardedDbReportTest._TEST_DB]))
+        with self.assertRaises(ValueError):
+            sharded_report.expand_dbnames(["no_such_db_*"])
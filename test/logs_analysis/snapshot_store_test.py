@@ -0,0 +1,189 @@
+"""Tests for snapshot_store module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import psycopg2
+
+import logs_analysis.connection_provider as connection_provider
+import logs_analysis.db_report as db_report
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.news_text_report as news_text_report
+import logs_analysis.snapshot_store as snapshot_store
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    @classmethod
+    def tearDownClass(cls):
+        """Reset database once all tests have run."""
+        db_report_test_helper.DbReportTestHelper(
+            cls._TEST_DB).reset_database()
+
+    def setUp(self):
+        """Reset the database, add the articles and make an empty store."""
+        self._helper = db_report_test_helper.DbReportTestHelper(
+            SnapshotStoreTest._TEST_DB)
+        self._helper.reset_database()
+        self._helper.add_author("first author")
+        self._helper.add_author("second author")
+        self._helper.add_author("third author")
+        self._helper.add_article("first author", "title one", "slug1")
+        self._helper.add_article("first author", "title two", "slug2")
+        self._helper.add_article("second author", "title three", "slug3")
+        self._dir = tempfile.TemporaryDirectory()
+        self._store = os.path.join(self._dir.name, "store")
+        self._provider = connection_provider.SingleConnectionProvider(
+            SnapshotStoreTest._TEST_DB)
+
+    def tearDown(self):
+        self._provider.close()
+        self._dir.cleanup()
+
+    def _day(self, day, hour=0):
+        return dt.datetime(2020, 3, day, hour,
+                           tzinfo=SnapshotStoreTest._TZ_00)
+
+    def _add_logs(self, day, slug1_hits=2):
+        timestamp = self._day(day, 12)
+        for _ in range(slug1_hits):
+            self._helper.add_log("/article/slug1", timestamp=timestamp)
+        self._helper.add_log("/article/slug2", timestamp=timestamp)
+        self._helper.add_log("/article/slug3", status="404 NOT FOUND",
+                             timestamp=timestamp)
+        self._helper.add_log("/", timestamp=timestamp)
+
+    def _append(self, until=None):
+        return snapshot_store.append_snapshot(self._provider, self._store,
+                                              until)
+
+    def test_reports_match_database_report(self):
+        for day in [1, 2, 4]:
+            self._add_logs(day, slug1_hits=day)
+        self._helper.add_log("/", status="404 NOT FOUND",
+                             timestamp=self._day(3, 12))
+        self._append()
+        from_store = snapshot_store.SnapshotReport(self._store)
+        from_db = db_report.DbReport(SnapshotStoreTest._TEST_DB,
+                                     self._provider)
+        self.assertEqual(from_db.get_most_popular_articles(),
+                         from_store.get_most_popular_articles())
+        self.assertCountEqual(from_db.get_most_popular_authors(),
+                              from_store.get_most_popular_authors())
+        self.assertCountEqual(from_db.get_dates_wth_more_pct_errors(0),
+                              from_store.get_dates_wth_more_pct_errors(0))
+        self.assertEqual(
+            [(self._day(3), 100.0, 1), (self._day(1), 25.0, 4)],
+            from_store.get_dates_wth_more_pct_errors(22))
+
+    def test_text_report_matches_database_report(self):
+        self._add_logs(1)
+        self._append()
+        db_out = io.StringIO()
+        news_text_report.NewsTextReport(
+            SnapshotStoreTest._TEST_DB, self._provider).report_all(
+                db_out, 2, 1, 10)
+        store_out = io.StringIO()
+        news_text_report.NewsTextReport(
+            SnapshotStoreTest._TEST_DB,
+            db_reporter=snapshot_store.SnapshotReport(
+                self._store)).report_all(store_out, 2, 1, 10)
+        self.assertEqual(db_out.getvalue(), store_out.getvalue())
+
+    def test_append_adds_each_completed_day_once(self):
+        self._add_logs(1)
+        self._add_logs(2)
+        first = self._append(until=self._day(2, 6))
+        self.assertEqual(
+            (os.path.join(self._store, "20200301-20200301.snap"), 1, 2),
+            first)
+        # the day of until is not yet complete
+        self.assertEqual((None, 0, 0), self._append(until=self._day(2, 6)))
+        self._add_logs(3)
+        second = self._append(until=self._day(4))
+        self.assertEqual(
+            (os.path.join(self._store, "20200302-20200303.snap"), 2, 4),
+            second)
+        self.assertEqual(
+            [("title one", 6), ("title two", 3), ("title three", 0)],
+            snapshot_store.SnapshotReport(
+                self._store).get_most_popular_articles())
+
+    def test_days_without_article_hits_keep_their_hits_apart(self):
+        self._add_logs(1, slug1_hits=1)
+        self._helper.add_log("/", timestamp=self._day(2, 12))
+        self._add_logs(3, slug1_hits=3)
+        self._append()
+        for day, hits in [(1, 1), (2, 0), (3, 3)]:
+            report = snapshot_store.SnapshotReport(
+                self._store, self._day(day), self._day(day + 1))
+            self.assertEqual([("title one", hits)],
+                             report.get_most_popular_articles(1))
+
+    def test_time_window_selects_whole_days(self):
+        for day in [1, 2, 3]:
+            self._add_logs(day, slug1_hits=day)
+        self._append(until=self._day(2))
+        self._append()
+        for since, until, hits in [
+                (self._day(2), None, 5),
+                (None, self._day(2, 12), 3),
+                (self._day(1, 12), self._day(3), 2),
+                # naive times are in the time zone of the days
+                (dt.datetime(2020, 3, 2), dt.datetime(2020, 3, 3), 2)]:
+            report = snapshot_store.SnapshotReport(self._store, since, until)
+            self.assertEqual([("title one", hits)],
+                             report.get_most_popular_articles(1))
+
+    def test_later_snapshots_have_the_latest_articles(self):
+        self._add_logs(1)
+        self._append(until=self._day(2))
+        with psycopg2.connect(dbname=SnapshotStoreTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("update articles set title = 'new title' "
+                               "where slug = 'slug1'")
+        conn.close()
+        self._helper.add_article("third author", "title four", "slug4")
+        self._helper.add_log("/article/slug4", timestamp=self._day(2, 12))
+        self._append()
+        report = snapshot_store.SnapshotReport(self._store)
+        self.assertEqual(
+            [("new title", 2), ("title four", 1), ("title two", 1),
+             ("title three", 0)],
+            sorted(report.get_most_popular_articles(),
+                   key=lambda row: (-row[1], row[0])))
+        self.assertEqual(
+            [("first author", 3), ("third author", 1), ("second author", 0)],
+            report.get_most_popular_authors())
+
+    def test_invalid_stores_are_rejected(self):
+        self._add_logs(1)
+        self._add_logs(2)
+        path = self._append(until=self._day(2)).path
+        shutil.copy(path, os.path.join(self._store, "copy.snap"))
+        with self.assertRaises(ValueError):
+            snapshot_store.SnapshotReport(self._store).load()
+        with open(os.path.join(self._store, "copy.snap"), "wb") as bad_file:
+            bad_file.write(b"not a snapshot")
+        with self.assertRaises(ValueError):
+            snapshot_store.SnapshotReport(self._store).load()
+        with self.assertRaises(ValueError):
+            self._append()
+        with self.assertRaises(OSError):
+            snapshot_store.SnapshotReport(
+                os.path.join(self._dir.name, "missing")).load()
@@ -0,0 +1,182 @@
+"""Tests for visitors_report module. These are integration tests and require
+that the test database has been created before these tests are run."""
+
+import datetime as dt
+import io
+import unittest
+
+import psycopg2
+
+import logs_analysis.db_report_test_helper as db_report_test_helper
+import logs_analysis.hyperloglog as hyperloglog
+import logs_analysis.news_text_report as news_text_report
+import logs_analysis.rollup as rollup
+import logs_analysis.visitors_report as visitors_report
+
+# tests are allowed to have long descriptive function names and don't need
+# doc comments, so disable pylint warnings
+# pylint: disable-msg=C0103
+# pylint: disable-msg=C0111
+
+
+class VisitorsDbReportTest(unittest.TestCase):
+    """Test cases"""
+
+    _TEST_DB = "news_test"
+
+    _TZ_00 = dt.timezone(dt.timedelta(hours=0))
+
+    # a visitor from each of n addresses to slug1 on each of ten days from
+    # the 1st March 2020, at noon
+    _MANY_VISITORS_SQL = """
+    insert into log (path, method, status, time, ip)
+      select '/article/slug1', 'GET', '200 OK',
+             timestamptz '2020-03-01 12:00+00' + day * interval '1 day',
+             '10.0.0.0'::inet + visitor
+        from generate_series(0, 9) as day,
+             generate_series(1, %(n)s) as visitor"""
+
+    @classmethod
+    def tearDownClass(cls):
+        """Drop the rollups and reset database once all tests have run."""
+        helper = \
+            db_report_test_helper.DbReportTestHelper(cls._TEST_DB)
+        helper.drop_rollups()
+        helper.reset_database()
+
+    def setUp(self):
+        """Reset the database, without rollups, and add the articles."""
+        helper = db_report_test_helper.DbReportTestHelper(
+            VisitorsDbReportTest._TEST_DB)
+        helper.reset_database()
+        helper.drop_rollups()
+        helper.add_author("first author")
+        helper.add_author("second author")
+        helper.add_author("third author")
+        helper.add_article("first author", "title one", "slug1")
+        helper.add_article("first author", "title two", "slug2")
+        helper.add_article("second author", "title three", "slug3")
+
+    def _add_logs(self, day):
+        helper = db_report_test_helper.DbReportTestHelper(
+            VisitorsDbReportTest._TEST_DB)
+        timestamp = dt.datetime(2020, 3, day, 12,
+                                tzinfo=VisitorsDbReportTest._TZ_00)
+        for ip in ["10.0.0.1", "10.0.0.2", "10.0.0.1"]:
+            helper.add_log("/article/slug1", timestamp=timestamp, ip=ip)
+        helper.add_log("/article/slug2", timestamp=timestamp,
+                       ip="10.0.0.{}".format(day))
+        helper.add_log("/article/slug3", timestamp=timestamp)
+        helper.add_log("/article/slug3", status="404 NOT FOUND",
+                       timestamp=timestamp, ip="10.0.0.9")
+
+    def _report(self, **kwargs):
+        return visitors_report.VisitorsDbReport(
+            VisitorsDbReportTest._TEST_DB, **kwargs)
+
+    def _add_many_visitors(self, count):
+        with psycopg2.connect(dbname=VisitorsDbReportTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(VisitorsDbReportTest._MANY_VISITORS_SQL,
+                               {"n": count})
+        conn.close()
+
+    def test_small_counts_of_visitors_are_exact(self):
+        self._add_logs(21)
+        report = self._report()
+        # no ip address is no visitor, nor is a failed request
+        self.assertCountEqual(
+            [("title one", 3, 2), ("title three", 1, 0), ("title two", 1, 1)],
+            report.get_most_popular_articles())
+        # 10.0.0.21 visits only title two, so first author has 3 visitors
+        self.assertListEqual(
+            [("first author", 4, 3), ("second author", 1, 0),
+             ("third author", 0, 0)],
+            report.get_most_popular_authors())
+
+    def test_visitors_are_merged_across_days_and_articles(self):
+        self._add_logs(21)
+        self._add_logs(22)
+        report = self._report()
+        self.assertListEqual([("title one", 6, 2)],
+                             report.get_most_popular_articles(1))
+        self.assertListEqual([("first author", 8, 4)],
+                             report.get_most_popular_authors(1))
+
+    def test_run_all_matches_individual_reports(self):
+        self._add_logs(21)
+        report = self._report()
+        result = report.run_all(2, 2, 0)
+        self.assertListEqual(report.get_most_popular_articles(2),
+                             result.articles)
+        self.assertListEqual(report.get_most_popular_authors(2),
+                             result.authors)
+        self.assertListEqual(report.get_dates_wth_more_pct_errors(0),
+                             result.errors)
+        self.assertListEqual(
+            [("articles", row) for row in result.articles] +
+            [("authors", row) for row in result.authors] +
+            [("errors", row) for row in result.errors],
+            list(report.iter_all(2, 2, 0)))
+
+    def test_estimate_is_within_error_bound(self):
+        self._add_many_visitors(20000)
+        views, visitors = self._report().get_most_popular_articles(1)[0][1:]
+        self.assertEqual(200000, views)
+        self.assertLess(abs(visitors - 20000) / 20000,
+                        3 * hyperloglog.STANDARD_ERROR)
+
+    def test_rollups_match_log_over_any_window(self):
+        helper = db_report_test_helper.DbReportTestHelper(
+            VisitorsDbReportTest._TEST_DB)
+        helper.run_init_script("createRollups.sql")
+        self._add_many_visitors(500)
+        self._add_logs(3)
+        rollup.Rollup(VisitorsDbReportTest._TEST_DB).refresh()
+        # some entries are added since the refresh
+        self._add_logs(5)
+        for since, until in [(None, None), (1, None), (None, 4), (3, 8),
+                             (2.5, 5.25)]:
+            window = {
+                name: None if day is None else dt.datetime(
+                    2020, 3, 1, tzinfo=VisitorsDbReportTest._TZ_00)
+                + dt.timedelta(days=day)
+                for name, day in [("since", since), ("until", until)]}
+            from_rollups = self._report(use_rollups=True, **window)
+            from_log = self._report(use_rollups=False, **window)
+            self.assertTrue(from_rollups.uses_visitor_rollups())
+            self.assertCountEqual(from_log.get_most_popular_articles(),
+                                  from_rollups.get_most_popular_articles())
+            self.assertCountEqual(from_log.get_most_popular_authors(),
+                                  from_rollups.get_most_popular_authors())
+
+    def test_init_script_fills_sketches_of_earlier_rollups(self):
+        helper = db_report_test_helper.DbReportTestHelper(
+            VisitorsDbReportTest._TEST_DB)
+        helper.run_init_script("createRollups.sql")
+        self._add_logs(21)
+        rollup.Rollup(VisitorsDbReportTest._TEST_DB).refresh()
+        expected = self._report(use_rollups=False).get_most_popular_authors()
+        # as installed before the sketches were added
+        with psycopg2.connect(dbname=VisitorsDbReportTest._TEST_DB) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("drop table article_visitors_daily")
+        conn.close()
+        helper.run_init_script("createRollups.sql")
+        self.assertListEqual(expected, self._report(
+            use_rollups=True).get_most_popular_authors())
+
+    def test_news_text_report_shows_visitors(self):
+        self._add_logs(21)
+        out = io.StringIO()
+        reporter = news_text_report.NewsTextReport(
+            VisitorsDbReportTest._TEST_DB, visitors=True)
+        reporter.report_all(out, 1, 1, 50)
+        self.assertEqual(
+            "The most popular 1 articles are:\n"
+            "'title one' - 3 views by about 2 visitors\n\n"
+            "The most popular 1 authors are:\n"
+            "'first author' - 4 views by about 3 visitors\n\n"
+            "The days on which more than 50% of requests led to errors:\n"
+            "None\n",
+            out.getvalue())